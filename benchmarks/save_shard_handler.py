@@ -0,0 +1,53 @@
+"""
+Times `save_shard_handler` for unsaved users with and without the model
+registry, using the settings of the tests:
+
+    python benchmarks/save_shard_handler.py [--calls 20000]
+
+Without the registry the handler falls back to inspecting the model and
+looking up the bucketer on every call.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000, help='The number of calls to time for each run.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of runs, of which the fastest is reported.')
+    args = parser.parse_args()
+
+    import conftest
+    conftest.pytest_configure()
+
+    from django.contrib.auth import get_user_model
+
+    from django_sharding_library import registry
+    from django_sharding_library.signals import save_shard_handler
+
+    User = get_user_model()
+    users = [User(username='user{}'.format(i)) for i in range(args.calls)]
+
+    def run():
+        for user in users:
+            user.shard = None
+            save_shard_handler(User, user)
+
+    with_registry = min(timeit.repeat(run, number=1, repeat=args.repeat))
+    metadata = dict(registry._model_metadata)
+    registry._model_metadata.clear()
+    try:
+        without_registry = min(timeit.repeat(run, number=1, repeat=args.repeat))
+    finally:
+        registry._model_metadata.update(metadata)
+
+    for name, seconds in (('without the registry', without_registry), ('with the registry', with_registry)):
+        print('{:<22} {:.2f}us per call'.format(name, seconds / args.calls * 1e6))
+
+
+if __name__ == '__main__':
+    main()
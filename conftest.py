@@ -1,3 +1,6 @@
+import pytest
+
+
 def pytest_configure():
     from datetime import datetime
     import time
@@ -75,3 +78,29 @@ def pytest_configure():
         SHARD_EPOCH=int(time.mktime(datetime(2016, 1, 1).timetuple()) * 1000),
     )
     django.setup()
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(request, django_test_environment, django_db_blocker, django_db_use_migrations, django_db_keepdb, django_db_createdb, django_db_modify_db_settings):
+    """
+    Sets up the test databases like the django_db_setup fixture of pytest-django,
+    except that the test databases of the shards are copies of the first shard
+    of their group.
+    """
+    from django.db import connections
+    from django.test.utils import teardown_databases
+    from django_sharding_library.testing import setup_sharded_test_databases
+
+    if not django_db_use_migrations:
+        for connection in connections.all():
+            connection.settings_dict['TEST']['MIGRATE'] = False
+
+    verbosity = request.config.option.verbose
+    with django_db_blocker.unblock():
+        db_cfg = setup_sharded_test_databases(verbosity=verbosity, interactive=False, keepdb=django_db_keepdb and not django_db_createdb)
+
+    yield
+
+    if not django_db_keepdb:
+        with django_db_blocker.unblock():
+            teardown_databases(db_cfg, verbosity=verbosity)
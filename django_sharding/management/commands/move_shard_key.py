@@ -0,0 +1,5 @@
+from django_sharding_library.management.commands.move_shard_key import Command as MoveShardKeyCommand
+
+
+class Command(MoveShardKeyCommand):
+    pass
@@ -0,0 +1,5 @@
+from django_sharding_library.management.commands.sharded_id_capacity import Command as ShardedIDCapacityCommand
+
+
+class Command(ShardedIDCapacityCommand):
+    pass
@@ -0,0 +1,5 @@
+from django_sharding_library.management.commands.sharding_plan import Command as ShardingPlanCommand
+
+
+class Command(ShardingPlanCommand):
+    pass
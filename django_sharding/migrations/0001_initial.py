@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-19 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardKeyMove',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_group', models.CharField(max_length=120)),
+                ('shard_key', models.CharField(max_length=120)),
+                ('source', models.CharField(max_length=120)),
+                ('target', models.CharField(max_length=120)),
+                ('status', models.CharField(choices=[('copying', 'Copying'), ('verifying', 'Verifying'), ('switching', 'Switching'), ('deleting', 'Deleting'), ('done', 'Done')], default='copying', max_length=20)),
+                ('model', models.CharField(blank=True, default='', max_length=255)),
+                ('last_pk', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'index_together': {('shard_group', 'shard_key')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FrozenShardKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_group', models.CharField(max_length=120)),
+                ('shard_key', models.CharField(max_length=120)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('shard_group', 'shard_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import models
+
+
+class FrozenShardKey(models.Model):
+    """
+    A shard key whose rows the router refuses to write to, such as while they
+    are being moved to another shard.
+    """
+    shard_group = models.CharField(max_length=120)
+    shard_key = models.CharField(max_length=120)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('shard_group', 'shard_key'),)
+
+
+class ReadOnlyShard(models.Model):
+    """
+    A shard the router refuses to write to, such as during maintenance, while
+    it can still be read from.
+    """
+    database = models.CharField(max_length=120, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class FrozenVersion(models.Model):
+    """
+    A single row counting the changes to the frozen shard keys and read-only
+    shards, so each process only reads them again after they change.
+    """
+    version = models.BigIntegerField(default=0)
+
+
+class ShardKeyMove(models.Model):
+    """
+    The progress of moving the rows of a shard key to another shard, so that
+    an interrupted move can carry on from the step and row it stopped at.
+    """
+    COPYING = 'copying'
+    VERIFYING = 'verifying'
+    SWITCHING = 'switching'
+    DELETING = 'deleting'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (COPYING, 'Copying'),
+        (VERIFYING, 'Verifying'),
+        (SWITCHING, 'Switching'),
+        (DELETING, 'Deleting'),
+        (DONE, 'Done'),
+    )
+
+    shard_group = models.CharField(max_length=120)
+    shard_key = models.CharField(max_length=120)
+    source = models.CharField(max_length=120)
+    target = models.CharField(max_length=120)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=COPYING)
+    # The last model and primary key handled by the current step.
+    model = models.CharField(max_length=255, blank=True, default='')
+    last_pk = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = (('shard_group', 'shard_key'),)
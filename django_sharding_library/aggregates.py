@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import add
+
+from django.db.models import Avg, Count, Max, Min, Sum
+
+from django_sharding_library.exceptions import DjangoShardingException
+
+
+class PartialAggregate(object):
+    """
+    Splits an aggregate into the aggregates each shard computes on its own rows
+    and combines the results of the shards into the value of the aggregate.
+    """
+    partial_functions = ()
+
+    def __init__(self, alias, aggregate):
+        self.alias = alias
+        self.aggregate = aggregate
+
+    def get_partial_alias(self, function):
+        return 'django_sharding_{}_{}'.format(self.alias, function.name.lower())
+
+    def get_partials(self):
+        expressions = self.aggregate.source_expressions
+        extra = {}
+        if getattr(self.aggregate, 'filter', None) is not None:
+            extra['filter'] = self.aggregate.filter
+        return OrderedDict(
+            (self.get_partial_alias(function), function(*expressions, **extra))
+            for function in self.partial_functions
+        )
+
+    def get_values(self, rows, function):
+        alias = self.get_partial_alias(function)
+        return [row[alias] for row in rows if row[alias] is not None]
+
+    def combine(self, rows):
+        raise NotImplementedError
+
+
+class PartialSum(PartialAggregate):
+    partial_functions = (Sum,)
+
+    def combine(self, rows):
+        return _sum(self.get_values(rows, Sum))
+
+
+class PartialCount(PartialAggregate):
+    partial_functions = (Count,)
+
+    def combine(self, rows):
+        return sum(self.get_values(rows, Count))
+
+
+class PartialMin(PartialAggregate):
+    partial_functions = (Min,)
+
+    def combine(self, rows):
+        values = self.get_values(rows, Min)
+        return min(values) if values else None
+
+
+class PartialMax(PartialAggregate):
+    partial_functions = (Max,)
+
+    def combine(self, rows):
+        values = self.get_values(rows, Max)
+        return max(values) if values else None
+
+
+class PartialAvg(PartialAggregate):
+    """
+    An average of averages is wrong when the shards have different numbers of
+    rows, so each shard returns its sum and count instead.
+    """
+    partial_functions = (Sum, Count)
+
+    def combine(self, rows):
+        count = sum(self.get_values(rows, Count))
+        if not count:
+            return None
+        total = _sum(self.get_values(rows, Sum))
+        if isinstance(total, Decimal):
+            return total / Decimal(count)
+        if isinstance(total, timedelta):
+            return total / count
+        return float(total) / count
+
+
+PARTIAL_AGGREGATES = [
+    (Avg, PartialAvg),
+    (Count, PartialCount),
+    (Sum, PartialSum),
+    (Min, PartialMin),
+    (Max, PartialMax),
+]
+
+
+def get_partial_aggregate(alias, aggregate):
+    if getattr(aggregate, 'distinct', False):
+        raise DjangoShardingException('The distinct {} aggregate cannot be combined across shards.'.format(alias))
+    for aggregate_class, partial_class in PARTIAL_AGGREGATES:
+        if type(aggregate) is aggregate_class:
+            return partial_class(alias, aggregate)
+    raise DjangoShardingException(
+        'Only Avg, Count, Max, Min and Sum can be combined across shards, not the {} aggregate.'.format(alias)
+    )
+
+
+def get_partial_aggregates(args, kwargs):
+    """
+    Returns the partial aggregate for each of the aggregates passed to
+    `aggregate()` or `annotate()`, keyed by their alias.
+    """
+    aggregates = OrderedDict()
+    for arg in args:
+        try:
+            aggregates[arg.default_alias] = arg
+        except (AttributeError, TypeError):
+            raise TypeError('Complex aggregates require an alias')
+    aggregates.update(kwargs)
+    return OrderedDict((alias, get_partial_aggregate(alias, aggregate)) for alias, aggregate in aggregates.items())
+
+
+def get_partial_expressions(partial_aggregates):
+    expressions = OrderedDict()
+    for partial_aggregate in partial_aggregates.values():
+        expressions.update(partial_aggregate.get_partials())
+    return expressions
+
+
+def _sum(values):
+    return reduce(add, values) if values else None
@@ -0,0 +1,903 @@
+import asyncio
+import atexit
+import heapq
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
+from functools import reduce
+from itertools import chain, islice
+from operator import or_
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import FlatValuesListIterable, ModelIterable, ValuesIterable
+from django.dispatch import receiver
+
+from django_sharding_library.aggregates import get_partial_aggregates, get_partial_expressions
+from django_sharding_library.constants import Backends
+from django_sharding_library.exceptions import CrossShardTimeoutException, DjangoShardingException
+from django_sharding_library.pruning import prune_shards
+from django_sharding_library.utils import get_database_for_model_instance, get_shards_for_group
+
+
+DEFAULT_MAX_WORKERS = 8
+
+_executors = {}
+_executors_lock = threading.Lock()
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_max_workers(shard_group, max_workers=None):
+    if max_workers is None:
+        group_settings = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get(shard_group, None) or {}
+        max_workers = group_settings.get('CROSS_SHARD_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+    return max_workers
+
+
+class _LimitedExecutor(object):
+    """
+    Runs at most `limit` of the calls submitted through it at the same time on
+    a shared pool, for the queries asking for fewer workers than the pool has.
+    The other calls wait in a queue rather than on a thread of the pool, and
+    are submitted as the running ones finish.
+    """
+    def __init__(self, executor, limit):
+        self.executor = executor
+        self.limit = limit
+        self.running = 0
+        self.pending = deque()
+        self.lock = threading.Lock()
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            if self.running >= self.limit:
+                self.pending.append((future, function, args, kwargs))
+                return future
+            self.running += 1
+        self._start(future, function, args, kwargs)
+        return future
+
+    def _start(self, future, function, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            # Cancelled while it was waiting in the queue.
+            self._finished()
+            return
+        try:
+            pool_future = self.executor.submit(function, *args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+            self._finished()
+            return
+        pool_future.add_done_callback(lambda pool_future: self._done(future, pool_future))
+
+    def _done(self, future, pool_future):
+        if pool_future.cancelled():
+            future.set_exception(CancelledError())
+        elif pool_future.exception() is not None:
+            future.set_exception(pool_future.exception())
+        else:
+            future.set_result(pool_future.result())
+        self._finished()
+
+    def _finished(self):
+        with self.lock:
+            if not self.pending:
+                self.running -= 1
+                return
+            call = self.pending.popleft()
+        self._start(*call)
+
+
+def get_cross_shard_executor(shard_group, max_workers=None):
+    """
+    Returns the thread pool used to query the shards of a shard group. The pool
+    is shared by the whole process so that its size, the
+    `CROSS_SHARD_MAX_WORKERS` of the shard group, is the limit on the number of
+    concurrent queries against the shard group. A smaller `max_workers` limits
+    the calls made through the returned executor further.
+    """
+    pool_size = get_max_workers(shard_group)
+    with _executors_lock:
+        if shard_group not in _executors:
+            _executors[shard_group] = ThreadPoolExecutor(max_workers=pool_size)
+        executor = _executors[shard_group]
+    if max_workers is not None and max_workers < pool_size:
+        return _LimitedExecutor(executor, max_workers)
+    return executor
+
+
+@atexit.register
+def shutdown_cross_shard_executors():
+    """
+    Shuts the thread pools down, letting the queries already running finish.
+    """
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False)
+
+
+@receiver(setting_changed)
+def shutdown_cross_shard_executors_on_setting_changed(setting, **kwargs):
+    # The size of the pools may have changed.
+    if setting == 'DJANGO_SHARDING_SETTINGS':
+        shutdown_cross_shard_executors()
+
+
+def get_cross_shard_semaphore(shard_group, max_workers=None):
+    """
+    Returns the semaphore which limits the number of concurrent queries against
+    the shard group from the running event loop.
+    """
+    max_workers = get_max_workers(shard_group, max_workers)
+    semaphores = _semaphores.setdefault(asyncio.get_event_loop(), {})
+    if (shard_group, max_workers) not in semaphores:
+        semaphores[(shard_group, max_workers)] = asyncio.Semaphore(max_workers)
+    return semaphores[(shard_group, max_workers)]
+
+
+def set_statement_timeout(connection, milliseconds):
+    """
+    Makes the database cancel any statement on the connection running for longer than the timeout.
+    """
+    engine = connection.settings_dict['ENGINE']
+    with connection.cursor() as cursor:
+        if engine in Backends.POSTGRES:
+            cursor.execute('SET statement_timeout = {:d}'.format(milliseconds))
+        elif engine in Backends.MYSQL:
+            cursor.execute('SET SESSION max_execution_time = {:d}'.format(milliseconds))
+
+
+def reset_statement_timeout(connection):
+    engine = connection.settings_dict['ENGINE']
+    with connection.cursor() as cursor:
+        if engine in Backends.POSTGRES:
+            cursor.execute('SET statement_timeout TO DEFAULT')
+        elif engine in Backends.MYSQL:
+            cursor.execute('SET SESSION max_execution_time = DEFAULT')
+
+
+def cancel_query(connection):
+    """
+    Cancels the statement running on the connection from another thread, when the driver supports it.
+    """
+    raw_connection = getattr(connection, 'connection', None)
+    if callable(getattr(raw_connection, 'cancel', None)):
+        try:
+            raw_connection.cancel()
+        except Exception:
+            pass
+
+
+def _run_on_database(function, database, deadline=None, running=None):
+    connection = connections[database]
+    timeout = None
+    try:
+        if deadline is not None:
+            timeout = int((deadline - time.monotonic()) * 1000)
+            if timeout <= 0:
+                raise CrossShardTimeoutException('The deadline passed before {} was queried.'.format(database), [database])
+            set_statement_timeout(connection, timeout)
+        if running is not None:
+            running[database] = connection
+        return function(database)
+    finally:
+        if running is not None:
+            running.pop(database, None)
+        if timeout is not None:
+            try:
+                reset_statement_timeout(connection)
+            except DatabaseError:
+                pass
+        # Each worker thread has its own connections, treat every call like the end of a request.
+        connection.close_if_unusable_or_obsolete()
+
+
+def _timed_out(databases, running):
+    for database in databases:
+        cancel_query(running.get(database))
+    return CrossShardTimeoutException('{} did not answer before the deadline.'.format(', '.join(databases)), list(databases))
+
+
+def gather_from_databases(databases, function, executor, timeout=None):
+    """
+    Calls the function with each of the databases on the executor, waiting at
+    most `timeout` seconds. Returns the results of the databases that answered,
+    in the same order as the databases, and the exception raised for each of
+    the others. The queries still running at the deadline are cancelled.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    running = {}
+    futures = OrderedDict(
+        (database, executor.submit(_run_on_database, function, database, deadline, running)) for database in databases
+    )
+    not_done = wait(futures.values(), timeout=timeout).not_done if futures else set()
+    late_databases = [database for database, future in futures.items() if future in not_done]
+    for database in late_databases:
+        futures[database].cancel()
+
+    results, errors = OrderedDict(), OrderedDict()
+    timeout_error = _timed_out(late_databases, running) if late_databases else None
+    for database, future in futures.items():
+        if database in late_databases:
+            errors[database] = timeout_error
+        elif future.exception() is not None:
+            errors[database] = future.exception()
+        else:
+            results[database] = future.result()
+    return results, errors
+
+
+def run_on_databases(databases, function, executor, timeout=None):
+    """
+    Calls the function with each of the databases on the executor and returns
+    the results in the same order as the databases. Raises the first error, or
+    a `CrossShardTimeoutException` when a database doesn't answer in time.
+    """
+    results, errors = gather_from_databases(databases, function, executor, timeout=timeout)
+    if errors:
+        raise next(iter(errors.values()))
+    return list(results.values())
+
+
+async def agather_from_databases(databases, function, executor, semaphore, timeout=None):
+    """
+    Like `gather_from_databases`, without blocking the event loop. The function
+    runs on the executor's threads rather than through `sync_to_async`, whose
+    thread sensitive mode would run the query of each shard one after the other.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    running = {}
+
+    async def run(database):
+        async with semaphore:
+            return await loop.run_in_executor(executor, _run_on_database, function, database, deadline, running)
+
+    tasks = OrderedDict((database, asyncio.ensure_future(run(database))) for database in databases)
+    pending = (await asyncio.wait(tasks.values(), timeout=timeout))[1] if tasks else set()
+    late_databases = [database for database, task in tasks.items() if task in pending]
+    for database in late_databases:
+        tasks[database].cancel()
+
+    results, errors = OrderedDict(), OrderedDict()
+    timeout_error = _timed_out(late_databases, running) if late_databases else None
+    for database, task in tasks.items():
+        if database in late_databases:
+            errors[database] = timeout_error
+        elif task.exception() is not None:
+            errors[database] = task.exception()
+        else:
+            results[database] = task.result()
+    return results, errors
+
+
+def _batches(ids, database):
+    batch_size = connections[database].features.max_query_params or len(ids)
+    for offset in range(0, len(ids), batch_size):
+        yield ids[offset:offset + batch_size]
+
+
+class _Descending(object):
+    """
+    Inverts the comparison of a value so that descending orderings can be merged.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class ShardOrdering(object):
+    """
+    Extracts the sort key of the rows returned by a queryset so that the rows of
+    several shards can be merged in the order each shard returned them in.
+    """
+    def __init__(self, queryset, nulls_largest=False, ordering=None, selected=None):
+        self.model = queryset.model
+        self.nulls_largest = nulls_largest
+        self.iterable_class = queryset._iterable_class
+        if selected is not None:
+            self.selected = list(selected)
+        elif self.iterable_class is ModelIterable:
+            self.selected = None
+        elif queryset._fields:
+            self.selected = list(queryset._fields) + list(queryset.query.annotation_select)
+        else:
+            self.selected = [field.attname for field in self.model._meta.concrete_fields] + list(queryset.query.annotation_select)
+
+        if ordering is None:
+            if queryset.query.order_by:
+                ordering = queryset.query.order_by
+            elif queryset.query.default_ordering:
+                ordering = self.model._meta.ordering
+            else:
+                ordering = []
+
+        self.ordering = []
+        for name in ordering:
+            if not isinstance(name, str) or name == '?':
+                raise DjangoShardingException('Only field names can be used to order rows across shards, not {}.'.format(name))
+            self.ordering.append((name.lstrip('-'), self._get_getter(name.lstrip('-')), name.startswith('-')))
+
+    @property
+    def ordered(self):
+        return bool(self.ordering)
+
+    @property
+    def names(self):
+        return [name for name, getter, descending in self.ordering]
+
+    def _get_getter(self, name):
+        if self.selected is not None and name in self.selected:
+            aliases = [name]
+        elif LOOKUP_SEP in name:
+            raise DjangoShardingException(
+                'The rows across shards can only be ordered by the fields of the {} model or by selected values, not by {}. '
+                'Select it with values() to order by it.'.format(self.model._meta.label, name)
+            )
+        else:
+            field = self.model._meta.pk if name == 'pk' else self.model._meta.get_field(name)
+            if self.selected is None:
+                return lambda row: getattr(row, field.attname)
+            aliases = [field.name, field.attname] + (['pk'] if field.primary_key else [])
+
+        for alias in aliases:
+            if alias not in self.selected:
+                continue
+            if self.iterable_class is FlatValuesListIterable:
+                return lambda row: row
+            if self.iterable_class is ValuesIterable:
+                return lambda row: row[alias]
+            index = self.selected.index(alias)
+            return lambda row: row[index]
+        raise DjangoShardingException('The field {} must be selected in order to order the rows across shards.'.format(name))
+
+    def key(self, row):
+        key = []
+        for name, getter, descending in self.ordering:
+            value = getter(row)
+            # Sort NULLs the way the database does so that the merge agrees with each shard.
+            if value is None:
+                value = (self.nulls_largest, 0)
+            else:
+                value = (not self.nulls_largest, value)
+            key.append(_Descending(value) if descending else value)
+        return tuple(key)
+
+    @property
+    def order_by(self):
+        return ['-' + name if descending else name for name, getter, descending in self.ordering]
+
+    def is_unique(self):
+        pk = self.model._meta.pk
+        return any(name in ('pk', pk.name, pk.attname) for name in self.names)
+
+    def _get_after_filter(self, name, value, descending):
+        nulls_after = self.nulls_largest != descending
+        if value is None:
+            return None if nulls_after else Q(**{'{}__isnull'.format(name): False})
+        after = Q(**{'{}__{}'.format(name, 'lt' if descending else 'gt'): value})
+        if nulls_after:
+            after |= Q(**{'{}__isnull'.format(name): True})
+        return after
+
+    def get_values(self, row):
+        return [getter(row) for name, getter, descending in self.ordering]
+
+    def get_keyset_filter(self, row):
+        """
+        Returns the filter for the rows that come after the row in the ordering.
+        """
+        return self.get_keyset_filter_for_values(self.get_values(row))
+
+    def get_keyset_filter_for_values(self, values):
+        filters = []
+        equal = Q()
+        for (name, getter, descending), value in zip(self.ordering, values):
+            after = self._get_after_filter(name, value, descending)
+            if after is not None:
+                filters.append(equal & after)
+            equal &= Q(**{'{}__isnull'.format(name): True}) if value is None else Q(**{name: value})
+        if not filters:
+            return Q(pk__in=[])
+        return reduce(or_, filters)
+
+    def merge(self, iterables):
+        if not self.ordered:
+            return chain(*iterables)
+        return heapq.merge(*iterables, key=self.key)
+
+
+class CrossShardQuerySet(object):
+    """
+    Runs the same query on every shard of a shard group, in parallel, and merges
+    the results. When the query is ordered and sliced, each shard only returns
+    the rows that could make it into the slice and the rows are merged in order.
+
+    Build one from a `ShardedManager`:
+
+        TestModel.objects.across_shards().filter(user_pk=1).order_by('-id')[:10]
+    """
+    def __init__(self, queryset, shard_group, use_replicas=False, max_workers=None, timeout=None, allow_partial=False):
+        self.queryset = queryset
+        self.shard_group = shard_group
+        self.use_replicas = use_replicas
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.allow_partial = allow_partial
+        # The shards which did not answer, when partial results are allowed.
+        self.missing_shards = []
+        self._shards = None
+        self.low_mark = 0
+        self.high_mark = None
+        # The aggregates of a `values().annotate()` group-by, which are combined in Python.
+        self.group_aggregates = OrderedDict()
+        self.group_ordering = None
+        self._result_cache = None
+
+    def _clone(self, queryset=None):
+        clone = self.__class__(
+            queryset if queryset is not None else self.queryset,
+            self.shard_group,
+            use_replicas=self.use_replicas,
+            max_workers=self.max_workers,
+            timeout=self.timeout,
+            allow_partial=self.allow_partial,
+        )
+        clone.low_mark, clone.high_mark = self.low_mark, self.high_mark
+        clone.group_aggregates = self.group_aggregates.copy()
+        clone.group_ordering = self.group_ordering
+        return clone
+
+    def _chain(self, method_name, *args, **kwargs):
+        if self.low_mark or self.high_mark is not None:
+            raise DjangoShardingException('Cannot change a query across shards once it has been sliced.')
+        return self._clone(getattr(self.queryset, method_name)(*args, **kwargs))
+
+    def all(self):
+        return self._clone()
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def order_by(self, *field_names):
+        if self.group_aggregates:
+            # The groups are ordered once they are combined, the shards don't need to.
+            clone = self._chain('order_by')
+            clone.group_ordering = list(field_names)
+            return clone
+        return self._chain('order_by', *field_names)
+
+    def values(self, *fields, **expressions):
+        return self._chain('values', *fields, **expressions)
+
+    def values_list(self, *fields, **kwargs):
+        return self._chain('values_list', *fields, **kwargs)
+
+    def only(self, *fields):
+        return self._chain('only', *fields)
+
+    def defer(self, *fields):
+        return self._chain('defer', *fields)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def prefetch_related(self, *lookups):
+        return self._chain('prefetch_related', *lookups)
+
+    def annotate(self, *args, **kwargs):
+        """
+        Annotating a `values()` query with aggregates groups the rows of all the
+        shards. Each shard computes the partial aggregates of its own groups and
+        the groups of all the shards are combined afterwards.
+        """
+        if self.queryset._fields is None:
+            return self._chain('annotate', *args, **kwargs)
+
+        annotations = OrderedDict()
+        for arg in args:
+            annotations[arg.default_alias] = arg
+        annotations.update(kwargs)
+        aggregates = OrderedDict((alias, expression) for alias, expression in annotations.items() if expression.contains_aggregate)
+        partial_aggregates = get_partial_aggregates((), aggregates)
+
+        expressions = OrderedDict((alias, expression) for alias, expression in annotations.items() if alias not in aggregates)
+        expressions.update(get_partial_expressions(partial_aggregates))
+        clone = self._chain('annotate', **expressions)
+        clone.group_aggregates.update(partial_aggregates)
+        return clone
+
+    def get_executor(self):
+        return get_cross_shard_executor(self.shard_group, self.max_workers)
+
+    def get_shards(self):
+        """
+        Returns the primary database of each shard the query needs to run on,
+        skipping the shards which can't contain any of the rows.
+        """
+        if self._shards is None:
+            self._shards = prune_shards(self.queryset, self.shard_group, get_shards_for_group(self.shard_group))
+        return self._shards
+
+    def get_read_database(self, shard):
+        if not self.use_replicas:
+            return shard
+        app_config_app_label = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('APP_CONFIG_APP', 'django_sharding')
+        routing_strategy = apps.get_app_config(app_config_app_label).get_routing_strategy(self.shard_group)
+        return routing_strategy.pick_read_db(shard)
+
+    def get_read_databases(self):
+        return [self.get_read_database(shard) for shard in self.get_shards()]
+
+    def run(self, function):
+        """
+        Calls the function with the database of each shard, in parallel, and returns the results.
+        """
+        return run_on_databases(self.get_read_databases(), function, self.get_executor(), timeout=self.timeout)
+
+    def _get_results(self, results, errors):
+        if errors and not self.allow_partial:
+            raise next(iter(errors.values()))
+        self.missing_shards = [settings.DATABASES[database].get('PRIMARY') or database for database in errors]
+        return list(results.values())
+
+    def _execute(self, plan):
+        databases, function, combine = plan
+        results, errors = gather_from_databases(databases, function, self.get_executor(), timeout=self.timeout)
+        return combine(self._get_results(results, errors))
+
+    async def _aexecute(self, plan):
+        databases, function, combine = plan
+        semaphore = get_cross_shard_semaphore(self.shard_group, self.max_workers)
+        results, errors = await agather_from_databases(databases, function, self.get_executor(), semaphore, timeout=self.timeout)
+        return combine(self._get_results(results, errors))
+
+    def get_ordering(self, queryset=None, ordering=None, selected=None):
+        queryset = self.queryset if queryset is None else queryset
+        databases = get_shards_for_group(self.shard_group)
+        nulls_largest = bool(databases) and connections[databases[0]].features.nulls_order_largest
+        return ShardOrdering(queryset, nulls_largest=nulls_largest, ordering=ordering, selected=selected)
+
+    def _plan_count(self):
+        if self.group_aggregates:
+            return self._plan_fetch(len)
+
+        queryset = self.queryset
+        if self.high_mark is not None:
+            queryset = queryset[:self.high_mark]
+
+        def combine(counts):
+            count = sum(counts)
+            if self.high_mark is not None:
+                count = min(count, self.high_mark)
+            return max(count - self.low_mark, 0)
+        return self.get_read_databases(), lambda database: queryset.using(database).count(), combine
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return self._execute(self._plan_count())
+
+    async def acount(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return await self._aexecute(self._plan_count())
+
+    def _plan_aggregate(self, args, kwargs):
+        if self.low_mark or self.high_mark is not None:
+            raise DjangoShardingException('Cannot aggregate a sliced query across shards.')
+        if self.group_aggregates:
+            raise DjangoShardingException('Cannot aggregate a query grouped across shards.')
+        partial_aggregates = get_partial_aggregates(args, kwargs)
+        expressions = get_partial_expressions(partial_aggregates)
+
+        def combine(rows):
+            return OrderedDict((alias, partial_aggregate.combine(rows)) for alias, partial_aggregate in partial_aggregates.items())
+        return self.get_read_databases(), lambda database: self.queryset.using(database).aggregate(**expressions), combine
+
+    def aggregate(self, *args, **kwargs):
+        """
+        Sends the partial aggregates to each shard, so that only one row per
+        shard is returned, and combines them into the aggregates.
+        """
+        return self._execute(self._plan_aggregate(args, kwargs))
+
+    async def aaggregate(self, *args, **kwargs):
+        return await self._aexecute(self._plan_aggregate(args, kwargs))
+
+    def get_shards_for_ids(self, id_list):
+        """
+        Groups the primary keys by the shard they are on. The shard is read from
+        the primary key when its field encodes it, otherwise the model may
+        define a `get_shards_from_ids` static method which takes a list of
+        primary keys and returns a dictionary of the primary keys to their shard.
+        The primary keys whose shard is unknown are grouped under None.
+        """
+        model = self.queryset.model
+        pk_field = model._meta.pk
+        shards = {}
+        if callable(getattr(pk_field, 'get_shard_from_id', None)):
+            shards.update((pk, pk_field.get_shard_from_id(pk)) for pk in id_list)
+
+        unknown_ids = [pk for pk in id_list if shards.get(pk) is None]
+        if unknown_ids and callable(getattr(model, 'get_shards_from_ids', None)):
+            shards.update(model.get_shards_from_ids(unknown_ids))
+
+        shard_group_databases = self.get_shards()
+        grouped = OrderedDict()
+        for pk in id_list:
+            shard = shards.get(pk)
+            grouped.setdefault(shard if shard in shard_group_databases else None, []).append(pk)
+        return grouped
+
+    def _plan_in_bulk(self, id_list):
+        if self.low_mark or self.high_mark is not None:
+            raise DjangoShardingException("Cannot use 'limit' or 'offset' with in_bulk across shards.")
+        if self.queryset._fields is not None:
+            raise TypeError('in_bulk() cannot be used with values() or values_list().')
+        id_list = list(OrderedDict.fromkeys(id_list))
+        ids_by_database = OrderedDict(
+            (self.get_read_database(shard), ids) for shard, ids in self._get_ids_by_shard(id_list).items()
+        ) if id_list else OrderedDict()
+
+        def fetch(database):
+            objects = []
+            for ids in _batches(ids_by_database[database], database):
+                objects.extend(self.queryset.using(database).filter(pk__in=ids).order_by())
+            return objects
+        return list(ids_by_database), fetch, lambda results: {obj.pk: obj for obj in chain(*results)}
+
+    def in_bulk(self, id_list):
+        """
+        Returns a dictionary of the primary keys to the objects with those
+        primary keys, querying each shard once (per batch of parameters) for
+        the primary keys on it, in parallel. The primary keys whose shard is
+        unknown are looked for on every shard.
+        """
+        return self._execute(self._plan_in_bulk(id_list))
+
+    async def ain_bulk(self, id_list):
+        return await self._aexecute(self._plan_in_bulk(id_list))
+
+    def _get_ids_by_shard(self, id_list):
+        grouped = self.get_shards_for_ids(id_list)
+        unknown_ids = grouped.pop(None, [])
+        ids_by_shard = OrderedDict()
+        for shard in self.get_shards():
+            ids = grouped.get(shard, []) + unknown_ids
+            if ids:
+                ids_by_shard[shard] = ids
+        return ids_by_shard
+
+    def get_shard_for_object(self, obj):
+        """
+        Returns the primary database of the shard the object lives on.
+        """
+        database = get_database_for_model_instance(obj)
+        return settings.DATABASES[database].get('PRIMARY') or database
+
+    def _check_writable(self, method_name):
+        if self.low_mark or self.high_mark is not None:
+            raise DjangoShardingException("Cannot use 'limit' or 'offset' with {} across shards.".format(method_name))
+        if self.group_aggregates:
+            raise DjangoShardingException('Cannot use {} on a query grouped across shards.'.format(method_name))
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        """
+        Groups the objects by the shard they live on and runs `bulk_update` for
+        each shard, in parallel, in a transaction on each shard.
+        """
+        self._check_writable('bulk_update')
+        objs_by_shard = OrderedDict()
+        for obj in objs:
+            objs_by_shard.setdefault(self.get_shard_for_object(obj), []).append(obj)
+
+        def update(database):
+            with transaction.atomic(using=database):
+                self.queryset.using(database).bulk_update(objs_by_shard[database], fields, batch_size=batch_size)
+
+        run_on_databases(list(objs_by_shard), update, self.get_executor())
+
+    def delete_by_ids(self, id_list):
+        """
+        Deletes the objects with the primary keys from the shards they live on,
+        with one `DELETE ... WHERE pk IN (...)` per shard (and batch of
+        parameters) in a transaction on each shard, in parallel. Returns the
+        number of objects deleted and the number deleted per model, like
+        `QuerySet.delete()`.
+        """
+        self._check_writable('delete_by_ids')
+        id_list = list(OrderedDict.fromkeys(id_list))
+        if not id_list:
+            return 0, {}
+        ids_by_shard = self._get_ids_by_shard(id_list)
+
+        def delete(database):
+            deleted, rows_count = 0, Counter()
+            with transaction.atomic(using=database):
+                for ids in _batches(ids_by_shard[database], database):
+                    batch_deleted, batch_rows_count = self.queryset.using(database).filter(pk__in=ids).delete()
+                    deleted += batch_deleted
+                    rows_count.update(batch_rows_count)
+            return deleted, rows_count
+
+        results = run_on_databases(list(ids_by_shard), delete, self.get_executor())
+        rows_count = Counter()
+        for deleted, shard_rows_count in results:
+            rows_count.update(shard_rows_count)
+        return sum(deleted for deleted, shard_rows_count in results), dict(rows_count)
+
+    def _combine_groups(self, results):
+        partial_aliases = set(get_partial_expressions(self.group_aggregates))
+        groups = OrderedDict()
+        for row in chain(*results):
+            key = tuple((name, value) for name, value in row.items() if name not in partial_aliases)
+            groups.setdefault(key, []).append(row)
+
+        rows = []
+        for key, group_rows in groups.items():
+            row = OrderedDict(key)
+            for alias, partial_aggregate in self.group_aggregates.items():
+                row[alias] = partial_aggregate.combine(group_rows)
+            rows.append(row)
+        return rows
+
+    def _sort_groups(self, results):
+        rows = self._combine_groups(results)
+        if rows:
+            # Like Django, the default ordering of the model doesn't apply to a group-by.
+            ordering = self.group_ordering if self.group_ordering is not None else list(self.queryset.query.order_by)
+            ordering = self.get_ordering(ordering=ordering, selected=list(rows[0]))
+            if ordering.ordered:
+                rows.sort(key=ordering.key)
+        return [dict(row) for row in islice(rows, self.low_mark, self.high_mark)]
+
+    def get_keyset_ordering(self):
+        """
+        Returns the query ordered so that no two rows have the same position, by
+        adding the primary key to the ordering when needed, and its ordering.
+        """
+        ordering = self.get_ordering()
+        if not ordering.is_unique():
+            queryset = self.queryset.order_by(*(ordering.order_by + ['pk']))
+            ordering = self.get_ordering(queryset)
+        return self.queryset.order_by(*ordering.order_by), ordering
+
+    def _keyset_iterator(self, database, queryset, ordering, chunk_size):
+        last_row = None
+        while True:
+            chunk = queryset if last_row is None else queryset.filter(ordering.get_keyset_filter(last_row))
+            rows = list(chunk.using(database)[:chunk_size])
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                return
+            last_row = rows[-1]
+
+    def _server_side_cursors(self, database):
+        connection = connections[database]
+        return connection.vendor == 'postgresql' and not connection.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS')
+
+    def iterator(self, chunk_size=2000):
+        """
+        Streams the rows of every shard, merged in order, keeping at most
+        `chunk_size` rows per shard in memory. Postgres shards use a server side
+        cursor while the other databases fetch the rows in chunks, each starting
+        after the last row of the previous chunk, which requires the ordering to
+        be unique so the primary key is added to it when it isn't.
+
+        The rows are fetched in the calling thread since a server side cursor
+        belongs to the connection that opened it.
+        """
+        if self.group_aggregates:
+            return iter(self)
+
+        ordering = self.get_ordering()
+        keyset_queryset, keyset_ordering = self.get_keyset_ordering()
+        # The rows of an unordered query are returned one shard after the other.
+        queryset = keyset_queryset if ordering.ordered else self.queryset
+        if self.high_mark is not None:
+            queryset = queryset[:self.high_mark]
+
+        iterators = []
+        for database in self.get_read_databases():
+            if self._server_side_cursors(database):
+                iterators.append(queryset.using(database).iterator(chunk_size=chunk_size))
+            else:
+                iterators.append(self._keyset_iterator(database, keyset_queryset, keyset_ordering, chunk_size))
+        merge_ordering = keyset_ordering if ordering.ordered else ordering
+        return islice(merge_ordering.merge(iterators), self.low_mark, self.high_mark)
+
+    def _plan_fetch(self, then=None):
+        queryset = self.queryset
+        if self.group_aggregates:
+            combine = self._sort_groups
+        else:
+            if self.high_mark is not None:
+                # No shard can contribute more than the end of the slice.
+                queryset = queryset[:self.high_mark]
+            ordering = self.get_ordering()
+
+            def combine(results):
+                return list(islice(ordering.merge(results), self.low_mark, self.high_mark))
+
+        def cache(results):
+            self._result_cache = combine(results)
+            return then(self._result_cache) if then else self._result_cache
+        return self.get_read_databases(), lambda database: list(queryset.using(database)), cache
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._execute(self._plan_fetch())
+
+    async def alist(self):
+        """
+        Returns the rows of every shard, like `list(queryset)`, running the
+        query on the shards concurrently without blocking the event loop.
+        """
+        if self._result_cache is None:
+            await self._aexecute(self._plan_fetch())
+        return list(self._result_cache)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            if k.step is not None or (k.start is not None and k.start < 0) or (k.stop is not None and k.stop < 0):
+                raise DjangoShardingException('Only non-negative slices without a step are supported across shards.')
+            if self._result_cache is not None:
+                return self._result_cache[k]
+            clone = self._clone()
+            clone.set_limits(k.start, k.stop)
+            return clone
+        if k < 0:
+            raise DjangoShardingException('Negative indexing is not supported across shards.')
+        if self._result_cache is not None:
+            return self._result_cache[k]
+        rows = list(self[k:k + 1])
+        if not rows:
+            raise IndexError('index out of range')
+        return rows[0]
+
+    def set_limits(self, low=None, high=None):
+        """
+        Narrows the slice of the merged rows, the same way Django's Query.set_limits does.
+        """
+        if high is not None:
+            self.high_mark = min(self.high_mark, self.low_mark + high) if self.high_mark is not None else self.low_mark + high
+        if low is not None:
+            self.low_mark = min(self.high_mark, self.low_mark + low) if self.high_mark is not None else self.low_mark + low
+
+    def __iter__(self):
+        self._fetch_all()
+        return iter(self._result_cache)
+
+    def __len__(self):
+        self._fetch_all()
+        return len(self._result_cache)
+
+    def __bool__(self):
+        self._fetch_all()
+        return bool(self._result_cache)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<CrossShardQuerySet {} on {}>'.format(self.queryset.model.__name__, self.shard_group)
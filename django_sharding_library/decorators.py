@@ -20,11 +20,32 @@ def shard_storage_config(shard_group='default', shared_field='shard'):
     return configure
 
 
-def model_config(shard_group=None, database=None, skip_runtime_checks=False):
+def ticket_server_config(databases):
+    """
+    A decorator for spreading a TableStrategyModel across several ticket servers
+    which each issue interleaved IDs. The order of the databases must never change
+    as it decides the offset of the IDs each of them hands out.
+    """
+    def configure(cls):
+        for database in databases:
+            if database not in settings.DATABASES or settings.DATABASES[database].get('PRIMARY'):
+                raise NonExistentDatabaseException(
+                    'Unable to place {} in {} as that is not an existing primary database in the system.'.format(cls._meta.model_name, database)
+                )
+        setattr(cls, 'django_sharding__ticket_databases', list(databases))
+        return cls
+    return configure
+
+
+def model_config(shard_group=None, database=None, skip_runtime_checks=False, shard_key_field=None):
     """
     A decorator for marking a model as being either sharded or stored on a
     particular database. When sharding, it does some verification to ensure
     that the model is defined correctly.
+
+    The `shard_key_field` of a sharded model is the field holding the primary
+    key of the model it is sharded by, which lets queries across shards skip
+    the shards that can't contain the rows.
     """
     def configure(cls):
         if database and shard_group:
@@ -33,6 +54,9 @@ def model_config(shard_group=None, database=None, skip_runtime_checks=False):
         if not database and not shard_group:
             raise ShardedModelInitializationException('The model should be either sharded or stored on a database in the `model_config` decorator is used.')
 
+        if database and shard_key_field:
+            raise ShardedModelInitializationException('A model stored on a particular database cannot have a shard_key_field.')
+
         if database:
             if (database not in settings.DATABASES or settings.DATABASES[database].get('PRIMARY')) and skip_runtime_checks is False:
                 raise NonExistentDatabaseException(
@@ -68,6 +92,11 @@ def model_config(shard_group=None, database=None, skip_runtime_checks=False):
             if not callable(getattr(cls, 'get_shard', None)):
                 raise ShardedModelInitializationException('You must define a get_shard method on the sharded model.')
 
+            if shard_key_field:
+                if shard_key_field not in [field.name for field in cls._meta.fields]:
+                    raise ShardedModelInitializationException('The shard_key_field {} is not a field on {}.'.format(shard_key_field, cls._meta.model_name))
+                setattr(cls, 'django_sharding__shard_key_field', shard_key_field)
+
             setattr(cls, 'django_sharding__shard_group', shard_group)
             setattr(cls, 'django_sharding__is_sharded', True)
 
@@ -16,3 +16,30 @@ class InvalidShowMigrationsException(DjangoShardingException):
 
 class NonExistentDatabaseException(DjangoShardingException):
     pass
+
+
+class InvalidCursorException(DjangoShardingException):
+    pass
+
+
+class CrossShardTimeoutException(DjangoShardingException):
+    def __init__(self, message, databases):
+        super(CrossShardTimeoutException, self).__init__(message)
+        self.databases = databases
+
+
+class ShardKeyFrozenException(DjangoShardingException):
+    def __init__(self, message, shard_group, shard_key):
+        super(ShardKeyFrozenException, self).__init__(message)
+        self.shard_group = shard_group
+        self.shard_key = shard_key
+
+
+class ShardKeyMoveException(DjangoShardingException):
+    pass
+
+
+class ShardReadOnlyException(DjangoShardingException):
+    def __init__(self, message, database):
+        super(ShardReadOnlyException, self).__init__(message)
+        self.database = database
@@ -1,9 +1,18 @@
+import uuid
+
 from django.apps import apps
 from django.conf import settings
-from django.db.models import AutoField, CharField, ForeignKey, BigIntegerField, OneToOneField
+from django.db.models import AutoField, CharField, ForeignKey, BigIntegerField, OneToOneField, UUIDField
 
 from django_sharding_library.constants import Backends
-from django_sharding_library.utils import create_postgres_global_sequence, create_postgres_shard_id_function, get_next_sharded_id
+from django_sharding_library.id_layout import get_id_layout
+from django_sharding_library.registry import get_model_metadata
+from django_sharding_library.utils import (
+    create_postgres_global_sequence,
+    create_postgres_shard_id_function,
+    get_next_sharded_id,
+    get_shard_for_shard_id,
+)
 
 
 try:
@@ -80,6 +89,49 @@ class ShardedUUID4Field(ShardedIDFieldMixin, CharField):
     def get_pk_value_on_save(self, instance):
         return self.strategy.get_next_id(instance.get_shard())
 
+    def get_shard_from_id(self, instance_id):
+        # The ids are the name of the database followed by a dash and a uuid4.
+        database = str(instance_id)[:-37]
+        if database in settings.DATABASES and not settings.DATABASES[database].get('PRIMARY'):
+            return database
+        return None
+
+
+class ShardedUUID7Field(ShardedIDFieldMixin, UUIDField):
+    """
+    A 16-byte, time-ordered UUID (version 7 layout) with the shard id of the
+    database embedded in it. It is stored in a native `uuid` column on Postgres
+    and a `binary(16)` column on MySQL so that it stays compact and the inserts
+    land at the end of the index.
+    """
+    def __init__(self, *args, **kwargs):
+        from django_sharding_library.id_generation_strategies import TimeOrderedUUIDStrategy
+        kwargs['strategy'] = TimeOrderedUUIDStrategy()
+        return super(ShardedUUID7Field, self).__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.settings_dict['ENGINE'] in Backends.MYSQL:
+            return 'binary(16)'
+        return super(ShardedUUID7Field, self).db_type(connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if connection.settings_dict['ENGINE'] in Backends.MYSQL:
+            value = self.to_python(value)
+            return value.bytes if value is not None else None
+        return super(ShardedUUID7Field, self).get_db_prep_value(value, connection, prepared)
+
+    def from_db_value(self, value, expression, connection, *args):
+        if isinstance(value, (bytes, bytearray)):
+            return uuid.UUID(bytes=bytes(value))
+        return value
+
+    def get_pk_value_on_save(self, instance):
+        return self.strategy.get_next_id(instance._state.db or instance.get_shard())
+
+    def get_shard_from_id(self, instance_id):
+        shard_group = getattr(self.model, 'django_sharding__shard_group', None)
+        return get_shard_for_shard_id(shard_group, self.strategy.get_shard_id_from_id(instance_id))
+
 
 class ShardStorageFieldMixin(object):
     """
@@ -141,21 +193,69 @@ class ShardForeignKeyStorageFieldMixin(ShardStorageFieldMixin):
         self.save_shard(model_instance)
         return super(ShardForeignKeyStorageFieldMixin, self).pre_save(model_instance, add)
 
+    def get_bucketer(self):
+        shard_group = getattr(self, 'django_sharding__shard_group')
+        metadata = get_model_metadata(getattr(self, 'model', None))
+        if metadata is not None and metadata.shard_group == shard_group and metadata.bucketer is not None:
+            return metadata.bucketer
+        app_config_app_label = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('APP_CONFIG_APP', 'django_sharding')
+        return apps.get_app_config(app_config_app_label).get_bucketer(shard_group)
+
     def save_shard(self, model_instance):
         shard_key = model_instance.get_shard_key()
         if not getattr(model_instance, self.name):
             shard_storage_table = getattr(self, 'django_sharding__shard_storage_table')
-            shard_group = getattr(self, 'django_sharding__shard_group')
-
-            app_config_app_label = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('APP_CONFIG_APP', 'django_sharding')
-            bucketer = apps.get_app_config(app_config_app_label).get_bucketer(shard_group)
-            shard = bucketer.pick_shard(model_instance)
+            shard = self.get_bucketer().pick_shard(model_instance)
             shard_object, _ = shard_storage_table.objects.get_or_create(shard_key=shard_key)
             if not shard_object.shard:
                 shard_object.shard = shard
                 shard_object.save()
             setattr(model_instance, self.name, shard_object)
 
+    def save_shards(self, model_instances):
+        """
+        Assigns the shard to each of the instances in a batch which does not have
+        one yet, using a fixed number of queries rather than a few per instance.
+        Call it before `bulk_create` so that the field has nothing left to do.
+        """
+        instances_by_shard_key = {}
+        shard_storage_table = getattr(self, 'django_sharding__shard_storage_table')
+        shard_key_field = shard_storage_table._meta.get_field('shard_key')
+        for model_instance in model_instances:
+            if getattr(model_instance, self.name):
+                continue
+            shard_key = shard_key_field.to_python(model_instance.get_shard_key())
+            instances_by_shard_key.setdefault(shard_key, []).append(model_instance)
+
+        if not instances_by_shard_key:
+            return
+
+        shard_objects = shard_storage_table.objects.in_bulk(list(instances_by_shard_key), field_name='shard_key')
+        bucketer = self.get_bucketer()
+        new_shard_objects = []
+        shard_keys_by_shard = {}
+        for shard_key, instances in instances_by_shard_key.items():
+            shard_object = shard_objects.get(shard_key)
+            if shard_object is not None and shard_object.shard:
+                continue
+            shard = bucketer.pick_shard(instances[0])
+            if shard_object is None:
+                new_shard_objects.append(shard_storage_table(shard_key=shard_key, shard=shard))
+            else:
+                shard_keys_by_shard.setdefault(shard, []).append(shard_key)
+
+        if new_shard_objects or shard_keys_by_shard:
+            # Another process may have stored a shard for some of the keys in the
+            # meantime, so only fill the gaps and read back what was kept.
+            shard_storage_table.objects.bulk_create(new_shard_objects, ignore_conflicts=True)
+            for shard, shard_keys in shard_keys_by_shard.items():
+                shard_storage_table.objects.filter(shard_key__in=shard_keys, shard='').update(shard=shard)
+            shard_objects = shard_storage_table.objects.in_bulk(list(instances_by_shard_key), field_name='shard_key')
+
+        for shard_key, instances in instances_by_shard_key.items():
+            for model_instance in instances:
+                setattr(model_instance, self.name, shard_objects[shard_key])
+
 
 class ShardForeignKeyStorageField(ShardForeignKeyStorageFieldMixin, ForeignKey):
     """
@@ -211,15 +311,12 @@ class PostgresShardGeneratedIDField(BasePostgresShardGeneratedIDField, BigIntege
     """
 
     def get_shard_from_id(self, instance_id):
-        group = getattr(self, 'django_sharding__shard_group', None)
-        shard_id_to_find = int(bin(instance_id)[-23:-10], 2)  # We know where the shard id is stored in the PK's bits.
-
-        # We can check the shard id from the PK against the shard ID in the databases config
-        for alias, db_settings in settings.DATABASES.items():
-            if db_settings["SHARD_GROUP"] == group and db_settings["SHARD_ID"] == shard_id_to_find:
-                return alias
+        group = getattr(self, 'django_sharding__shard_group', None) or getattr(self.model, 'django_sharding__shard_group', None)
+        shard_id_to_find = get_id_layout(group).get_shard_id(instance_id)  # We know where the shard id is stored in the PK's bits.
 
-        return None  # Return None if we could not determine the shard so we can fall through to the next shard grab attempt
+        # We can check the shard id from the PK against the shard ID in the databases config.
+        # Return None if we could not determine the shard so we can fall through to the next shard grab attempt.
+        return get_shard_for_shard_id(group, shard_id_to_find)
 
     def get_pk_value_on_save(self, instance):
         return self.generate_id(instance)
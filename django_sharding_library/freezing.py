@@ -0,0 +1,180 @@
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from django_sharding_library.exceptions import DjangoShardingException
+
+
+class _Snapshot(object):
+    """
+    The frozen shard keys and read-only shards as last read, which is replaced
+    as a whole rather than changed so it can be read without the lock.
+    """
+    def __init__(self, version=None, keys=frozenset(), shards=frozenset(), checked_at=None):
+        self.version = version
+        self.keys = keys
+        self.shards = shards
+        self.checked_at = checked_at
+
+
+_snapshot = _Snapshot()
+_tables_exist = {'value': None}
+_lock = threading.Lock()
+
+
+def get_frozen_refresh_interval():
+    """
+    Returns how many seconds a process may go on using the frozen shard keys
+    and read-only shards it last read, which is also how long a change takes
+    to reach every process.
+    """
+    return getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('FROZEN_REFRESH_INTERVAL', 1.0)
+
+
+def are_writes_checked():
+    """
+    Returns whether the router refuses the writes to read-only shards and
+    frozen shard keys, which the `CHECK_FROZEN_WRITES` setting can turn off.
+    """
+    return getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('CHECK_FROZEN_WRITES', True)
+
+
+def _get_model(model_name):
+    if not apps.is_installed('django_sharding'):
+        return None
+    return apps.get_model('django_sharding', model_name)
+
+
+def _check_tables_exist():
+    """
+    Returns whether the tables of the django_sharding app exist, looking once
+    per process, or again after the next migration, whether they do or not.
+    """
+    if _tables_exist['value'] is None:
+        # Writes happen before the tables are migrated, such as in data migrations.
+        model = _get_model('FrozenVersion')
+        connection = connections[router.db_for_read(model) or 'default']
+        _tables_exist['value'] = model._meta.db_table in connection.introspection.table_names()
+    return _tables_exist['value']
+
+
+def _refresh(snapshot):
+    """
+    Reads the version of the frozen shard keys and read-only shards, and reads
+    them again only if the version changed since they were last read.
+    """
+    if _get_model('FrozenVersion') is None or not _check_tables_exist():
+        return snapshot
+    version = _get_model('FrozenVersion').objects.filter(pk=1).values_list('version', flat=True).first() or 0
+    if version == snapshot.version:
+        return snapshot
+    return _Snapshot(
+        version=version,
+        keys=frozenset(_get_model('FrozenShardKey').objects.values_list('shard_group', 'shard_key')),
+        shards=frozenset(_get_model('ReadOnlyShard').objects.values_list('database', flat=True)),
+    )
+
+
+def _is_fresh(snapshot, now):
+    return snapshot.checked_at is not None and now - snapshot.checked_at < get_frozen_refresh_interval()
+
+
+def _get_frozen():
+    global _snapshot
+    snapshot = _snapshot
+    if _is_fresh(snapshot, time.time()):
+        return snapshot.keys, snapshot.shards
+    # Only wait for another thread reading them when there are none to go on with.
+    if not _lock.acquire(snapshot.checked_at is None):
+        return snapshot.keys, snapshot.shards
+    try:
+        snapshot = _snapshot
+        now = time.time()
+        if not _is_fresh(snapshot, now):
+            snapshot = _refresh(snapshot)
+            _snapshot = _Snapshot(snapshot.version, snapshot.keys, snapshot.shards, checked_at=now)
+            snapshot = _snapshot
+    finally:
+        _lock.release()
+    return snapshot.keys, snapshot.shards
+
+
+def get_frozen_shard_keys():
+    """
+    Returns the `(shard_group, shard_key)` pairs which are frozen. The version
+    is checked at most once every `FROZEN_REFRESH_INTERVAL` seconds and the
+    frozen shard keys are only read again when it changed.
+    """
+    return _get_frozen()[0]
+
+
+def get_read_only_shards():
+    """
+    Returns the shards which are read-only, cached like `get_frozen_shard_keys`.
+    """
+    return _get_frozen()[1]
+
+
+def clear_frozen_cache():
+    global _snapshot
+    with _lock:
+        _snapshot = _Snapshot()
+        _tables_exist['value'] = None
+
+
+@receiver(post_migrate)
+def clear_frozen_cache_after_migrating(**kwargs):
+    # The tables may have just been created.
+    _tables_exist['value'] = None
+
+
+def is_shard_key_frozen(shard_group, shard_key):
+    return (shard_group, str(shard_key)) in get_frozen_shard_keys()
+
+
+def has_frozen_shard_keys(shard_group):
+    return any(group == shard_group for group, shard_key in get_frozen_shard_keys())
+
+
+def is_shard_read_only(database):
+    return database in get_read_only_shards()
+
+
+def _change(change):
+    """
+    Makes a change to the frozen shard keys or read-only shards along with the
+    version, so that every process reads them again.
+    """
+    version_model = _get_model('FrozenVersion')
+    with transaction.atomic(using=router.db_for_write(version_model)):
+        change()
+        version_model.objects.get_or_create(pk=1)
+        version_model.objects.filter(pk=1).update(version=F('version') + 1)
+    clear_frozen_cache()
+
+
+def freeze_shard_key(shard_group, shard_key):
+    _change(lambda: _get_model('FrozenShardKey').objects.get_or_create(shard_group=shard_group, shard_key=str(shard_key)))
+
+
+def unfreeze_shard_key(shard_group, shard_key):
+    _change(lambda: _get_model('FrozenShardKey').objects.filter(shard_group=shard_group, shard_key=str(shard_key)).delete())
+
+
+def mark_shard_read_only(database):
+    """
+    Makes the router refuse to write to a primary shard while still reading from it.
+    """
+    if not settings.DATABASES.get(database, {}).get('SHARD_GROUP') or settings.DATABASES[database].get('PRIMARY'):
+        raise DjangoShardingException('{} is not a primary shard.'.format(database))
+    _change(lambda: _get_model('ReadOnlyShard').objects.get_or_create(database=database))
+
+
+def mark_shard_writable(database):
+    _change(lambda: _get_model('ReadOnlyShard').objects.filter(database=database).delete())
@@ -1,11 +1,16 @@
+import time
 import uuid
+from itertools import count
 
 from django.apps import apps
 from django.db import connections, transaction
+from django.db.utils import InterfaceError, OperationalError
 from django.utils.deconstruct import deconstructible
 
 from django_sharding_library.constants import Backends
+from django_sharding_library.exceptions import DjangoShardingException
 from django_sharding_library.models import TableStrategyModel
+from django_sharding_library.utils import configure_postgres_stepped_sequence
 
 
 class BaseIDGenerationStrategy(object):
@@ -24,36 +29,95 @@ class TableStrategy(BaseIDGenerationStrategy):
     """
     Uses an autoincrement field, on a TableStrategyModel model `backing_model`
     to generate unique IDs.
+
+    When the backing model is decorated with `ticket_server_config`, the IDs are
+    issued round-robin by each of its ticket servers, which each hand out every
+    Mth ID starting at their own offset.
     """
-    def __init__(self, backing_model_name):
+    def __init__(self, backing_model_name, retry_unhealthy_after=30):
         self.backing_model_name = backing_model_name
+        self.retry_unhealthy_after = retry_unhealthy_after
+        self._ticket_counter = count()
+        self._unhealthy_until = {}
+        self._prepared_databases = set()
 
-    def get_next_id(self, database=None):
-        """
-        Returns a new unique integer identifier for an object using an
-        auto-incrimenting field in the database.
-        """
+    def get_backing_model(self):
         app_label = self.backing_model_name.split('.')[0]
         app = apps.get_app_config(app_label)
         backing_model = app.get_model(self.backing_model_name[len(app_label) + 1:])
 
         if not issubclass(backing_model, TableStrategyModel):
             raise ValueError("Unsupported model used for generating IDs")
+        return backing_model
+
+    def get_next_id(self, database=None):
+        """
+        Returns a new unique integer identifier for an object using an
+        auto-incrimenting field in the database.
+        """
+        backing_model = self.get_backing_model()
+        ticket_databases = getattr(backing_model, 'django_sharding__ticket_databases', None)
+        if ticket_databases:
+            return self._get_next_id_from_ticket_servers(backing_model, ticket_databases)
 
-        from django.conf import settings
         backing_table_db = getattr(backing_model, 'database', 'default')
-        if settings.DATABASES[backing_table_db]['ENGINE'] in Backends.MYSQL:
+        return self._get_next_id_from_database(backing_model, backing_table_db)
+
+    def _get_next_id_from_ticket_servers(self, backing_model, ticket_databases):
+        start = next(self._ticket_counter) % len(ticket_databases)
+        candidates = ticket_databases[start:] + ticket_databases[:start]
+        now = time.time()
+        healthy = [db for db in candidates if self._unhealthy_until.get(db, 0) <= now]
+        # When every server has recently failed, try them all anyway rather than failing outright.
+        unhealthy = [db for db in candidates if db not in healthy]
+
+        for ticket_database in healthy + unhealthy:
+            try:
+                return self._get_next_id_from_database(
+                    backing_model,
+                    ticket_database,
+                    increment=len(ticket_databases),
+                    offset=ticket_databases.index(ticket_database) + 1,
+                )
+            except (InterfaceError, OperationalError):
+                self._unhealthy_until[ticket_database] = time.time() + self.retry_unhealthy_after
+                connections[ticket_database].close()
+        raise DjangoShardingException('Unable to generate an ID as none of the ticket servers {} are available.'.format(ticket_databases))
+
+    def _get_next_id_from_database(self, backing_model, backing_table_db, increment=None, offset=None):
+        from django.conf import settings
+        engine = settings.DATABASES[backing_table_db]['ENGINE']
+        if engine in Backends.MYSQL:
             with transaction.atomic(backing_table_db):
                 cursor = connections[backing_table_db].cursor()
+                if increment:
+                    cursor.execute(
+                        "SET SESSION auto_increment_increment = %s, auto_increment_offset = %s", [increment, offset]
+                    )
                 sql = "REPLACE INTO `{0}` (`stub`) VALUES ({1})".format(
                     backing_model._meta.db_table, True
                 )
-                cursor.execute(sql)
+                try:
+                    cursor.execute(sql)
+                    # Read before the variables are reset, which clears it.
+                    id = getattr(cursor.cursor.cursor, 'lastrowid', None)
+                finally:
+                    if increment:
+                        # The ticket server may be a shard as well, whose other tables mustn't be stepped.
+                        cursor.execute("SET SESSION auto_increment_increment = DEFAULT, auto_increment_offset = DEFAULT")
 
-            if getattr(cursor.cursor.cursor, 'lastrowid', None):
-                id = cursor.cursor.cursor.lastrowid
-            else:
+            if not id and increment:
+                id = backing_model.objects.using(backing_table_db).get(stub=True).id
+            elif not id:
                 id = backing_model.objects.get(stub=True).id
+        elif increment:
+            if engine not in Backends.POSTGRES:
+                raise DjangoShardingException('Ticket servers are only supported on MySQL and Postgres.')
+            if backing_table_db not in self._prepared_databases:
+                configure_postgres_stepped_sequence(backing_model._meta.db_table, backing_table_db, increment, offset)
+                self._prepared_databases.add(backing_table_db)
+            with transaction.atomic(backing_table_db):
+                id = backing_model.objects.using(backing_table_db).create(stub=None).id
         else:
             with transaction.atomic(backing_table_db):
                 id = backing_model.objects.create(stub=None).id
@@ -72,3 +136,50 @@ class UUIDStrategy(BaseIDGenerationStrategy):
         from django.conf import settings
         assert database in settings.DATABASES
         return '{}-{}'.format(database, uuid.uuid4())
+
+
+@deconstructible
+class TimeOrderedUUIDStrategy(BaseIDGenerationStrategy):
+    """
+    Generates 16-byte, time-ordered UUIDs following the version 7 layout with
+    the shard id of the database embedded in the 12 `rand_a` bits:
+
+        48 bits of unix time in milliseconds | 4 bits of version (7) |
+        12 bits of shard id | 2 bits of variant | 62 random bits
+    """
+    TIMESTAMP_SHIFT = 80
+    SHARD_ID_SHIFT = 64
+    SHARD_ID_BITS = 12
+    RANDOM_BITS = 62
+
+    def get_next_id(self, database):
+        """
+        Generate a cross-shard UUID using the current time and the shard id of the database.
+        """
+        from django.conf import settings
+        assert database in settings.DATABASES
+        shard_id = settings.DATABASES[database].get('SHARD_ID', 0)
+        if shard_id >= 1 << self.SHARD_ID_BITS:
+            raise ValueError('The shard id of {} does not fit in {} bits.'.format(database, self.SHARD_ID_BITS))
+
+        value = int(time.time() * 1000) << self.TIMESTAMP_SHIFT
+        value |= 0x7 << 76
+        value |= shard_id << self.SHARD_ID_SHIFT
+        value |= 0x2 << self.RANDOM_BITS
+        value |= uuid.uuid4().int & ((1 << self.RANDOM_BITS) - 1)
+        return uuid.UUID(int=value)
+
+    @classmethod
+    def get_shard_id_from_id(cls, value):
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return (value.int >> cls.SHARD_ID_SHIFT) & ((1 << cls.SHARD_ID_BITS) - 1)
+
+    @classmethod
+    def get_timestamp_from_id(cls, value):
+        """
+        Returns the unix time, in milliseconds, at which the id was generated.
+        """
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value.int >> cls.TIMESTAMP_SHIFT
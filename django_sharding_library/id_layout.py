@@ -0,0 +1,135 @@
+import math
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+
+DEFAULT_SHARD_BITS = 13
+DEFAULT_SEQUENCE_BITS = 10
+
+
+CapacityForecast = namedtuple('CapacityForecast', [
+    'inserts_per_second',
+    'inserts_per_millisecond',
+    'sequence_capacity',
+    'sequence_utilization',
+    'wraparound_probability',
+    'exhaustion_millis',
+    'years_remaining',
+])
+
+
+class ShardedIDLayout(object):
+    """
+    Describes how a 64 bit sharded ID is split into the milliseconds since the
+    SHARD_EPOCH, the shard id and a per-shard sequence, from the most to the
+    least significant bits. The sign bit is never used so the IDs stay positive.
+    """
+    def __init__(self, shard_bits=DEFAULT_SHARD_BITS, sequence_bits=DEFAULT_SEQUENCE_BITS):
+        if shard_bits < 1 or sequence_bits < 1 or shard_bits + sequence_bits > 32:
+            raise ValueError('The shard and sequence bits must both be positive and may not use more than 32 bits in total.')
+        self.shard_bits = shard_bits
+        self.sequence_bits = sequence_bits
+        self.time_bits = 63 - shard_bits - sequence_bits
+
+    def __eq__(self, other):
+        return isinstance(other, ShardedIDLayout) and (self.shard_bits, self.sequence_bits) == (other.shard_bits, other.sequence_bits)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'ShardedIDLayout(shard_bits={}, sequence_bits={})'.format(self.shard_bits, self.sequence_bits)
+
+    @property
+    def shard_shift(self):
+        return self.sequence_bits
+
+    @property
+    def time_shift(self):
+        return self.shard_bits + self.sequence_bits
+
+    @property
+    def max_shard_id(self):
+        return (1 << self.shard_bits) - 1
+
+    @property
+    def sequence_modulus(self):
+        return 1 << self.sequence_bits
+
+    def compose(self, millis_since_epoch, shard_id, sequence):
+        if shard_id > self.max_shard_id:
+            raise ValueError('The shard id {} does not fit in {} bits.'.format(shard_id, self.shard_bits))
+        sharded_id = millis_since_epoch << self.time_shift
+        sharded_id |= shard_id << self.shard_shift
+        sharded_id |= sequence % self.sequence_modulus
+        return sharded_id
+
+    def get_millis_since_epoch(self, sharded_id):
+        return sharded_id >> self.time_shift
+
+    def get_shard_id(self, sharded_id):
+        return (sharded_id >> self.shard_shift) & self.max_shard_id
+
+    def get_sequence(self, sharded_id):
+        return sharded_id & (self.sequence_modulus - 1)
+
+    def forecast(self, inserts_per_second, shard_epoch, now_millis=None, peak_factor=1.0):
+        """
+        Forecasts the capacity of the layout for a single shard inserting at the given rate.
+
+        The sequence wraps every `sequence_modulus` inserts, so a shard doing more
+        than that many inserts in one millisecond generates duplicate IDs. The
+        arrivals in a millisecond are modelled as a Poisson process whose mean is
+        the average rate scaled by `peak_factor`.
+        """
+        if now_millis is None:
+            now_millis = int(time.time() * 1000)
+        inserts_per_millisecond = inserts_per_second / 1000.0 * peak_factor
+        exhaustion_millis = shard_epoch + (1 << self.time_bits)
+        return CapacityForecast(
+            inserts_per_second=inserts_per_second,
+            inserts_per_millisecond=inserts_per_millisecond,
+            sequence_capacity=self.sequence_modulus,
+            sequence_utilization=inserts_per_millisecond / self.sequence_modulus,
+            wraparound_probability=_poisson_tail(inserts_per_millisecond, self.sequence_modulus),
+            exhaustion_millis=exhaustion_millis,
+            years_remaining=(exhaustion_millis - now_millis) / (1000.0 * 60 * 60 * 24 * 365.25),
+        )
+
+
+def _poisson_tail(mean, threshold):
+    """
+    Returns the probability that a Poisson variable with the given mean is larger than the threshold.
+    """
+    if mean <= 0:
+        return 0.0
+    if mean > threshold:
+        # The sum below converges slowly past the mean, take the complement instead.
+        return 1.0 - sum(math.exp(k * math.log(mean) - mean - math.lgamma(k + 1)) for k in range(threshold + 1))
+    probability = 0.0
+    k = threshold + 1
+    while True:
+        term = math.exp(k * math.log(mean) - mean - math.lgamma(k + 1))
+        probability += term
+        if term < probability * 1e-12 or term == 0.0:
+            return probability
+        k += 1
+
+
+def get_id_layout(shard_group):
+    """
+    Returns the layout of the sharded IDs for the shard group, as configured by
+    the `ID_LAYOUT` key of the shard group in the DJANGO_SHARDING_SETTINGS.
+    """
+    group_settings = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get(shard_group, None) or {}
+    layout_settings = group_settings.get('ID_LAYOUT', {})
+    return ShardedIDLayout(
+        shard_bits=layout_settings.get('SHARD_BITS', DEFAULT_SHARD_BITS),
+        sequence_bits=layout_settings.get('SEQUENCE_BITS', DEFAULT_SEQUENCE_BITS),
+    )
+
+
+def get_id_layout_for_database(db_alias):
+    return get_id_layout(settings.DATABASES[db_alias].get('SHARD_GROUP'))
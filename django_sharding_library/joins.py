@@ -0,0 +1,138 @@
+import pickle
+import tempfile
+from collections import defaultdict
+
+from django_sharding_library.exceptions import DjangoShardingException
+
+
+def _get_key_getter(field_name):
+    def get_key(row):
+        if isinstance(row, dict):
+            return row[field_name]
+        return getattr(row, field_name)
+    return get_key
+
+
+class _SpillFile(object):
+    """
+    A temporary file holding `(key, row)` pairs which don't fit in memory.
+    """
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+
+    def write(self, key, row):
+        pickle.dump((key, row), self.file, pickle.HIGHEST_PROTOCOL)
+
+    def read(self):
+        self.file.seek(0)
+        while True:
+            try:
+                yield pickle.load(self.file)
+            except EOFError:
+                return
+
+    def close(self):
+        self.file.close()
+
+
+class _Partitions(object):
+    """
+    Splits the rows into spill files by the hash of their key, so rows with the
+    same key on either side of the join end up in the same partition.
+    """
+    def __init__(self, count):
+        self.files = [_SpillFile() for _ in range(count)]
+
+    def write(self, key, row):
+        self.files[hash(key) % len(self.files)].write(key, row)
+
+    def close(self):
+        for spill_file in self.files:
+            spill_file.close()
+
+
+def _get_rows(queryset, get_key, chunk_size):
+    for row in queryset.iterator(chunk_size=chunk_size):
+        key = get_key(row)
+        # As in SQL, NULL never equals anything.
+        if key is not None:
+            yield key, row
+
+
+def _probe(table, probe_rows, build_is_left):
+    for key, probe_row in probe_rows:
+        for build_row in table.get(key, ()):
+            yield (build_row, probe_row) if build_is_left else (probe_row, build_row)
+
+
+def join_across(left, right, on, build='right', chunk_size=2000, max_rows_in_memory=100000, partitions=16):
+    """
+    Joins two querysets which live on different databases, such as a sharded
+    model and a model on the default database, in the application rather than
+    with a SQL `JOIN` the router doesn't allow across databases.
+
+    The `build` side is read into a hash table keyed by the join field and the
+    other side is streamed past it, yielding a `(left_row, right_row)` pair for
+    every match, which costs one scan of each side rather than a query per row:
+
+        comments = Comment.objects.across_shards().filter(created__gte=since)
+        for comment, profile in join_across(comments, Profile.objects.all(), on=('user_pk', 'user_id')):
+            ...
+
+    `on` is the name of a field present on both sides or a `(left_field,
+    right_field)` pair. The rows may be model instances or the dictionaries of
+    `values()`. Both sides are fetched with `iterator(chunk_size)`, and the
+    pairs come out in the order of the streamed side.
+
+    When the build side has more than `max_rows_in_memory` rows both sides are
+    split by the hash of their key into `partitions` temporary files, which are
+    then joined one pair at a time so only one partition of the build side is
+    in memory at once. The pairs are then grouped by partition rather than in
+    the order of the streamed side.
+    """
+    if build not in ('left', 'right'):
+        raise DjangoShardingException('The build side of a join must be either "left" or "right", not {}.'.format(build))
+    if isinstance(on, (list, tuple)):
+        left_field, right_field = on
+    else:
+        left_field = right_field = on
+
+    build_is_left = build == 'left'
+    build_queryset, probe_queryset = (left, right) if build_is_left else (right, left)
+    build_field, probe_field = (left_field, right_field) if build_is_left else (right_field, left_field)
+    build_rows = _get_rows(build_queryset, _get_key_getter(build_field), chunk_size)
+    probe_rows = _get_rows(probe_queryset, _get_key_getter(probe_field), chunk_size)
+
+    table = defaultdict(list)
+    size = 0
+    for key, row in build_rows:
+        table[key].append(row)
+        size += 1
+        if size > max_rows_in_memory:
+            break
+    else:
+        for pair in _probe(table, probe_rows, build_is_left):
+            yield pair
+        return
+
+    build_partitions = _Partitions(partitions)
+    probe_partitions = _Partitions(partitions)
+    try:
+        for key, rows in table.items():
+            for row in rows:
+                build_partitions.write(key, row)
+        table = None
+        for key, row in build_rows:
+            build_partitions.write(key, row)
+        for key, row in probe_rows:
+            probe_partitions.write(key, row)
+
+        for build_file, probe_file in zip(build_partitions.files, probe_partitions.files):
+            partition_table = defaultdict(list)
+            for key, row in build_file.read():
+                partition_table[key].append(row)
+            for pair in _probe(partition_table, probe_file.read(), build_is_left):
+                yield pair
+    finally:
+        build_partitions.close()
+        probe_partitions.close()
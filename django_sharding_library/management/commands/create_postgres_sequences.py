@@ -1,7 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 
-from django_sharding_library.utils import create_postgres_global_sequence, create_postgres_shard_id_function, verify_postres_id_field_setup_correctly
+from django_sharding_library.utils import check_postgres_shard_id_function, setup_postgres_shard_id, verify_postres_id_field_setup_correctly
 
 
 class Command(BaseCommand):
@@ -29,6 +32,14 @@ class Command(BaseCommand):
             '--dry-run', action='store_true', dest='dry_run', default=False,
             help="Check they exist but make no changes to the database.",
         )
+        parser.add_argument(
+            '--check-only', action='store_true', dest='check_only', default=False,
+            help="Check the epoch, shard id and ID layout the function was created with match the settings, making no changes.",
+        )
+        parser.add_argument(
+            '--parallel', action='store', dest='parallel', type=int, default=8,
+            help="The number of databases to set up at the same time.",
+        )
 
     def get_all_but_replica_dbs(self):
         return sorted(list(filter(
@@ -44,23 +55,41 @@ class Command(BaseCommand):
         else:
             databases = [options['database']]
 
-        has_errors = False
+        databases = [database for database in databases if settings.DATABASES[database].get('SHARD_ID', None) is not None]
+        with ThreadPoolExecutor(max_workers=max(min(options['parallel'], len(databases)), 1)) as executor:
+            results = list(executor.map(lambda database: self.setup_database(database, options), databases))
 
-        for database in databases:
-            sequence_name = options["sequence_name"]
-            try:
-                shard_id = settings.DATABASES[database].get('SHARD_ID', None)
-                if shard_id is None:
-                    continue
-                if not options["dry_run"]:
-                    create_postgres_global_sequence(sequence_name=sequence_name, db_alias=database, reset_sequence=options["reset_sequence"])
-                    create_postgres_shard_id_function(sequence_name=sequence_name, db_alias=database, shard_id=shard_id)
-                if not verify_postres_id_field_setup_correctly(sequence_name=sequence_name, db_alias=database, function_name="next_sharded_id"):
-                    raise Exception("The sequence could not be found.")
-                self.stdout.write(getattr(self.style, "SUCCESS", lambda a: a)("\nDatabase {} with shard id {}:sequence {} is present").format(database, shard_id, sequence_name))
-            except Exception as e:
-                self.stdout.write(getattr(self.style, "ERROR", lambda a: a)("\nDatabase {}: Error occured: {}").format(database, str(e)))
+        has_errors = False
+        for success, message in results:
+            if success:
+                self.stdout.write(getattr(self.style, "SUCCESS", lambda a: a)(message))
+            else:
+                self.stdout.write(getattr(self.style, "ERROR", lambda a: a)(message))
                 has_errors = True
 
         if has_errors:
             raise CommandError("Some databases do not have the sequence on them.")
+
+    def setup_database(self, database, options):
+        """
+        Sets up or checks a database from a worker thread, returning whether it
+        succeeded and the message to print.
+        """
+        sequence_name = options["sequence_name"]
+        shard_id = settings.DATABASES[database]['SHARD_ID']
+        try:
+            if options["check_only"]:
+                problems = check_postgres_shard_id_function(sequence_name=sequence_name, db_alias=database, shard_id=shard_id)
+                if problems:
+                    raise Exception(" ".join(problems))
+            elif options["dry_run"]:
+                if not verify_postres_id_field_setup_correctly(sequence_name=sequence_name, db_alias=database, function_name="next_sharded_id"):
+                    raise Exception("The sequence could not be found.")
+            elif not setup_postgres_shard_id(sequence_name=sequence_name, db_alias=database, shard_id=shard_id, reset_sequence=options["reset_sequence"]):
+                raise Exception("The sequence could not be found.")
+            return True, "\nDatabase {} with shard id {}:sequence {} is present".format(database, shard_id, sequence_name)
+        except Exception as e:
+            return False, "\nDatabase {}: Error occured: {}".format(database, str(e))
+        finally:
+            # Each worker thread opened its own connection.
+            connections[database].close()
@@ -1,10 +1,26 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
+from django.core.management.base import CommandError
 from django.core.management.commands.migrate import Command as MigrationCommand
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from six import StringIO
 
 from django_sharding_library.exceptions import InvalidMigrationException
+from django_sharding_library.utils import get_applied_migrations, get_replica_lag, get_replicas_for_database
 
 
 class Command(MigrationCommand):
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self._loader = None
+        self._loader_lock = threading.Lock()
+        self._plans = {}
+
     def handle(self, *args, **options):
         if not options['database'] or options['database'] == 'all':
             databases = self.get_all_but_replica_dbs()
@@ -13,13 +29,217 @@ class Command(MigrationCommand):
         else:
             databases = [options['database']]
 
+        if options.get('rolling'):
+            self.migrate_rolling(databases, args, options)
+            return
+
+        if options.get('parallel', 1) > 1 and len(databases) > 1:
+            self.migrate_in_parallel(databases, args, options)
+            return
+
         for database in databases:
             options['database'] = database
             # Writen in green text to stand out from the surrouding headings
             if options['verbosity'] >= 1:
                 self.stdout.write(getattr(self.style, "MIGRATE_SUCCESS", getattr(self.style, "SUCCESS", lambda a: a))("\nDatabase: {}\n").format(database))
+            if not self.should_migrate(database, options):
+                if options['verbosity'] >= 1:
+                    self.stdout.write("  No migrations to apply.")
+                continue
             super(Command, self).handle(*args, **options)
 
+    def migrate_database(self, database, args, options):
+        """
+        Migrates one database from a worker thread, with a command of its own
+        so its output can be buffered, and returns that output.
+        """
+        stdout, stderr = StringIO(), StringIO()
+        command = MigrationCommand(stdout=stdout, stderr=stderr, no_color=options.get('no_color', False), force_color=options.get('force_color', False))
+        if options['verbosity'] >= 1:
+            stdout.write(getattr(command.style, "MIGRATE_SUCCESS", getattr(command.style, "SUCCESS", lambda a: a))("\nDatabase: {}\n").format(database))
+        if not self.should_migrate(database, options):
+            if options['verbosity'] >= 1:
+                stdout.write("  No migrations to apply.\n")
+            return stdout.getvalue()
+        try:
+            MigrationCommand.handle(command, *args, **dict(options, database=database))
+        except Exception as e:
+            e.django_sharding_output = stdout.getvalue() + stderr.getvalue()
+            raise
+        finally:
+            # Each worker thread opened its own connection.
+            connections[database].close()
+        return stdout.getvalue() + stderr.getvalue()
+
+    def migrate_in_parallel(self, databases, args, options):
+        """
+        Migrates up to `--parallel` databases at a time, each on its own
+        connection. The output of each database is printed in order once they
+        are all done, followed by the databases which failed. With
+        `--fail-fast` the databases which haven't started yet are skipped
+        after the first failure.
+        """
+        # Prompting from several threads at once isn't possible.
+        options = dict(options, interactive=False)
+        failed = threading.Event()
+
+        def migrate(database):
+            if failed.is_set():
+                return None
+            try:
+                return self.migrate_database(database, args, options)
+            except Exception:
+                if options.get('fail_fast'):
+                    failed.set()
+                raise
+
+        with ThreadPoolExecutor(max_workers=options['parallel']) as executor:
+            futures = [(database, executor.submit(migrate, database)) for database in databases]
+
+        failures = []
+        for database, future in futures:
+            error = future.exception()
+            if error is not None:
+                self.stdout.write(getattr(error, 'django_sharding_output', ''))
+                failures.append((database, error))
+            elif future.result() is None:
+                failures.append((database, 'Skipped after an earlier failure.'))
+            else:
+                self.stdout.write(future.result())
+
+        if failures:
+            for database, error in failures:
+                self.stderr.write(getattr(self.style, "ERROR", lambda a: a)("Database {}: {}".format(database, error)))
+            raise CommandError('Migrations failed on {} of {} databases: {}.'.format(
+                len(failures), len(databases), ', '.join(database for database, error in failures)
+            ))
+
+    def migrate_rolling(self, databases, args, options):
+        """
+        Migrates the canary database on its own and then the others in waves of
+        `--wave-size` databases, waiting between waves until the replicas of
+        the databases just migrated are within `--max-replica-lag` seconds of
+        their primary. With `--skip-up-to-date` the databases without any
+        migration to apply are skipped, so an interrupted rollout resumes where
+        it stopped.
+        """
+        canary = options.get('canary')
+        if canary is not None and canary not in databases:
+            raise CommandError('The canary {} is not one of the databases being migrated.'.format(canary))
+
+        pending = [database for database in databases if self.should_migrate(database, options)]
+        if options['verbosity'] >= 1:
+            for database in databases:
+                if database not in pending:
+                    self.stdout.write("Database {} is already migrated.".format(database))
+        if not pending:
+            return
+
+        if canary not in pending:
+            canary = pending[0]
+        rest = [database for database in pending if database != canary]
+        wave_size = max(options.get('wave_size', 1), 1)
+        waves = [[canary]] + [rest[i:i + wave_size] for i in range(0, len(rest), wave_size)]
+
+        for index, wave in enumerate(waves):
+            if index:
+                self.wait_for_replicas(waves[index - 1], options)
+            if options['verbosity'] >= 1:
+                name = 'Canary' if index == 0 else 'Wave {} of {}'.format(index, len(waves) - 1)
+                self.stdout.write(getattr(self.style, "MIGRATE_HEADING", lambda a: a)("\n{}: {}".format(name, ', '.join(wave))))
+            # A failed wave raises, stopping the rollout before the next one.
+            self.migrate_in_parallel(wave, args, dict(options, parallel=len(wave)))
+
+    def get_migration_loader(self):
+        """
+        Returns the migrations on disk, loaded once for every database since
+        they don't depend on what any database has applied.
+        """
+        with self._loader_lock:
+            if self._loader is None:
+                self._loader = MigrationLoader(None, ignore_no_migrations=True)
+            return self._loader
+
+    def get_unapplied_migrations(self, database, options):
+        """
+        Returns the migrations the database is missing, in the order they would
+        be applied, or None when only Django's own plan can tell. The plan is
+        worked out once for each set of applied migrations, so the databases
+        of a shard group which are at the same point share it and each costs
+        one query for its `django_migrations` table.
+        """
+        loader = self.get_migration_loader()
+        if loader.replacements:
+            # Whether a squashed migration replaces the ones it squashes depends on what was applied.
+            return None
+        targets = loader.graph.leaf_nodes()
+        if options.get('app_label'):
+            targets = [key for key in targets if key[0] == options['app_label']]
+
+        applied = frozenset(get_applied_migrations(database))
+        key = (applied, tuple(targets))
+        if key not in self._plans:
+            plan = []
+            for target in targets:
+                for migration in loader.graph.forwards_plan(target):
+                    if migration not in applied and migration not in plan:
+                        plan.append(migration)
+            self._plans[key] = plan
+        return self._plans[key]
+
+    def should_migrate(self, database, options):
+        """
+        Returns whether to run Django's `migrate` on the database. Every
+        database is migrated unless `--skip-up-to-date` is given, as skipping
+        one also skips its `pre_migrate` and `post_migrate` receivers.
+        """
+        return not options.get('skip_up_to_date') or self.has_unapplied_migrations(database, options)
+
+    def has_unapplied_migrations(self, database, options):
+        """
+        Returns whether migrating the database would apply any migration, so
+        with `--skip-up-to-date` the databases which are up to date can skip
+        Django's `migrate` and the loading of the migrations and project state
+        it does for each of them.
+        """
+        if options.get('migration_name') or options.get('run_syncdb'):
+            # Moving to a particular migration may mean unapplying some, and
+            # the apps without migrations are synced on every run.
+            return True
+        if options.get('app_label') and options['app_label'] not in self.get_migration_loader().migrated_apps:
+            # Leave it to migrate to report the app.
+            return True
+        unapplied = self.get_unapplied_migrations(database, options)
+        if unapplied is None:
+            executor = MigrationExecutor(connections[database])
+            targets = executor.loader.graph.leaf_nodes()
+            if options.get('app_label'):
+                targets = [key for key in targets if key[0] == options['app_label']]
+            unapplied = executor.migration_plan(targets)
+        return bool(unapplied)
+
+    def wait_for_replicas(self, databases, options):
+        """
+        Waits until every replica of the databases is no more than
+        `--max-replica-lag` seconds behind, checking every
+        `--replica-lag-interval` seconds for up to `--replica-lag-timeout`.
+        """
+        replicas = [replica for database in databases for replica in get_replicas_for_database(database)]
+        if not replicas:
+            return
+        deadline = time.time() + options['replica_lag_timeout']
+        while True:
+            lags = [(replica, get_replica_lag(replica)) for replica in replicas]
+            lagging = [(replica, lag) for replica, lag in lags if lag is not None and lag > options['max_replica_lag']]
+            if not lagging:
+                return
+            description = ', '.join('{} ({:.1f}s)'.format(replica, lag) for replica, lag in lagging)
+            if time.time() >= deadline:
+                raise CommandError('Gave up waiting for the replicas to catch up: {}.'.format(description))
+            if options['verbosity'] >= 1:
+                self.stdout.write(getattr(self.style, "WARNING", lambda a: a)("Waiting for the replicas to catch up: {}".format(description)))
+            time.sleep(options['replica_lag_interval'])
+
     def get_all_but_replica_dbs(self):
         return list(filter(
             lambda db: not settings.DATABASES[db].get('PRIMARY', None),
@@ -31,3 +251,39 @@ class Command(MigrationCommand):
         parser._option_string_actions['--database'].default = None
         parser._option_string_actions['--database'].help = u'Nominates a database to synchronize. Defaults to all databases.'
         parser._option_string_actions['--database'].choices = ['all'] + self.get_all_but_replica_dbs()
+        parser.add_argument(
+            '--skip-up-to-date', action='store_true', dest='skip_up_to_date', default=False,
+            help='Skip the databases which have no migration to apply, without sending them the pre_migrate and post_migrate signals.',
+        )
+        parser.add_argument(
+            '--parallel', action='store', dest='parallel', type=int, default=1,
+            help='The number of databases to migrate at the same time, each on its own connection.',
+        )
+        parser.add_argument(
+            '--fail-fast', action='store_true', dest='fail_fast', default=False,
+            help='With --parallel, skip the databases which have not started migrating after the first failure.',
+        )
+        parser.add_argument(
+            '--rolling', action='store_true', dest='rolling', default=False,
+            help='Migrate a canary database first and then the others in waves, waiting for the replicas to catch up in between.',
+        )
+        parser.add_argument(
+            '--canary', action='store', dest='canary', default=None,
+            help='With --rolling, the database to migrate first. Defaults to the first database to migrate.',
+        )
+        parser.add_argument(
+            '--wave-size', action='store', dest='wave_size', type=int, default=1,
+            help='With --rolling, the number of databases to migrate at the same time after the canary.',
+        )
+        parser.add_argument(
+            '--max-replica-lag', action='store', dest='max_replica_lag', type=float, default=10.0,
+            help='With --rolling, the number of seconds the replicas may be behind before the next wave starts.',
+        )
+        parser.add_argument(
+            '--replica-lag-interval', action='store', dest='replica_lag_interval', type=float, default=5.0,
+            help='With --rolling, the number of seconds between checks of the replica lag.',
+        )
+        parser.add_argument(
+            '--replica-lag-timeout', action='store', dest='replica_lag_timeout', type=float, default=600.0,
+            help='With --rolling, the number of seconds to wait for the replicas to catch up before giving up.',
+        )
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from django_sharding_library.exceptions import ShardKeyMoveException
+from django_sharding_library.rebalancing import move_shard_key
+
+
+class Command(BaseCommand):
+    help = 'Moves the rows of a shard key to another shard, freezing its writes in the meantime. Run it again to resume an interrupted move.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shard_key', help='The shard key to move, such as the primary key of a user.')
+        parser.add_argument(
+            '--shard-group',
+            action='store',
+            dest='shard_group',
+            default='default',
+            help='The shard group of the shard key. Defaults to "default".',
+            choices=self.get_shard_groups(),
+        )
+        parser.add_argument(
+            '--target',
+            action='store',
+            dest='target',
+            required=True,
+            help='The shard to move the rows to.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            dest='batch_size',
+            type=int,
+            default=1000,
+            help='The number of rows to copy or delete at a time.',
+        )
+        parser.add_argument(
+            '--throttle',
+            action='store',
+            dest='throttle',
+            type=float,
+            default=0.0,
+            help='The number of seconds to wait after each batch, to limit the load on the shards.',
+        )
+
+    def get_shard_groups(self):
+        return sorted(set(filter(None, [settings.DATABASES[db].get('SHARD_GROUP', None) for db in settings.DATABASES])))
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] >= 1 else None
+        try:
+            move = move_shard_key(
+                options['shard_group'],
+                options['shard_key'],
+                options['target'],
+                batch_size=options['batch_size'],
+                throttle=options['throttle'],
+                log=log,
+            )
+        except ShardKeyMoveException as e:
+            raise CommandError(str(e))
+        if options['verbosity'] >= 1:
+            self.stdout.write(getattr(self.style, "SUCCESS", lambda a: a)("Moved {} from {} to {}.".format(move.shard_key, move.source, move.target)))
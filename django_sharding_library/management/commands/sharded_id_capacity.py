@@ -0,0 +1,107 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from django_sharding_library.constants import Backends
+from django_sharding_library.id_layout import get_id_layout_for_database
+from django_sharding_library.utils import get_postgres_sequence_value
+
+
+class Command(BaseCommand):
+    help = 'Forecasts epoch exhaustion and per-millisecond sequence wraparound of the sharded IDs for each shard.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='store',
+            dest='database',
+            default=None,
+            help='Nominates a shard to report on. Defaults to "all" shards.',
+            choices=['all'] + self.get_all_shard_dbs(),
+        )
+        parser.add_argument(
+            '--sequence-name',
+            action='store',
+            dest='sequence_name',
+            default='global_id_sequence',
+            help='The name of the sequence used to generate the IDs.',
+        )
+        parser.add_argument(
+            '--sample-seconds',
+            action='store',
+            dest='sample_seconds',
+            type=float,
+            default=10.0,
+            help='How long to observe the sequences for in order to measure the insert rate.',
+        )
+        parser.add_argument(
+            '--inserts-per-second',
+            action='store',
+            dest='inserts_per_second',
+            type=float,
+            default=None,
+            help='Use this insert rate for every shard rather than observing it.',
+        )
+        parser.add_argument(
+            '--peak-factor',
+            action='store',
+            dest='peak_factor',
+            type=float,
+            default=1.0,
+            help='The ratio of the busiest millisecond to the average rate, used for the wraparound risk.',
+        )
+
+    def get_all_shard_dbs(self):
+        return sorted(list(filter(
+            lambda db: not settings.DATABASES[db].get('PRIMARY', None) and settings.DATABASES[db].get('SHARD_ID', None) is not None,
+            settings.DATABASES.keys()
+        )))
+
+    def handle(self, *args, **options):
+        if not options['database'] or options['database'] == 'all':
+            databases = self.get_all_shard_dbs()
+        elif options['database'] not in self.get_all_shard_dbs():
+            raise CommandError('You must report on an existing primary shard.')
+        else:
+            databases = [options['database']]
+
+        if options['inserts_per_second'] is not None:
+            rates = {database: options['inserts_per_second'] for database in databases}
+        else:
+            rates = self.observe_insert_rates(databases, options['sequence_name'], options['sample_seconds'])
+
+        for database in databases:
+            if database not in rates:
+                self.stdout.write(getattr(self.style, "WARNING", lambda a: a)(
+                    "\nDatabase {}: unable to observe the insert rate, pass --inserts-per-second.".format(database)
+                ))
+                continue
+
+            layout = get_id_layout_for_database(database)
+            forecast = layout.forecast(rates[database], settings.SHARD_EPOCH, peak_factor=options['peak_factor'])
+            style = getattr(self.style, "SUCCESS", lambda a: a)
+            if forecast.wraparound_probability > 1e-9 or forecast.years_remaining < 5:
+                style = getattr(self.style, "ERROR", lambda a: a)
+
+            self.stdout.write(style("\nDatabase {} with shard id {}:".format(database, settings.DATABASES[database]['SHARD_ID'])))
+            self.stdout.write("  layout: {} time bits, {} shard bits, {} sequence bits".format(
+                layout.time_bits, layout.shard_bits, layout.sequence_bits
+            ))
+            self.stdout.write("  inserts: {:.2f}/s, {:.4f}/ms at peak, {:.4%} of the {} IDs available per ms".format(
+                forecast.inserts_per_second, forecast.inserts_per_millisecond, forecast.sequence_utilization, forecast.sequence_capacity
+            ))
+            self.stdout.write("  probability of a millisecond wrapping the sequence: {:.3g}".format(forecast.wraparound_probability))
+            self.stdout.write("  epoch exhausted on {:%Y-%m-%d}, in {:.1f} years".format(
+                datetime.utcfromtimestamp(forecast.exhaustion_millis / 1000.0), forecast.years_remaining
+            ))
+
+    def observe_insert_rates(self, databases, sequence_name, sample_seconds):
+        databases = [database for database in databases if settings.DATABASES[database]['ENGINE'] in Backends.POSTGRES]
+        start_time = time.time()
+        start_values = {database: get_postgres_sequence_value(sequence_name, database) for database in databases}
+        time.sleep(sample_seconds)
+        end_values = {database: get_postgres_sequence_value(sequence_name, database) for database in databases}
+        elapsed = time.time() - start_time
+        return {database: (end_values[database] - start_values[database]) / elapsed for database in databases}
@@ -0,0 +1,69 @@
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from django_sharding_library.planning import get_copy_plan
+
+
+class Command(BaseCommand):
+    help = 'Shows the order to copy the sharded models of each shard group in and how each one is filtered by the shard key.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shard-group',
+            action='store',
+            dest='shard_group',
+            default=None,
+            help='Nominates a shard group to plan. Defaults to all shard groups.',
+            choices=self.get_shard_groups(),
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            dest='json',
+            default=False,
+            help='Writes the plans as JSON.',
+        )
+
+    def get_shard_groups(self):
+        return sorted(set(filter(None, [settings.DATABASES[db].get('SHARD_GROUP', None) for db in settings.DATABASES])))
+
+    def handle(self, *args, **options):
+        shard_groups = [options['shard_group']] if options['shard_group'] else self.get_shard_groups()
+        plans = [get_copy_plan(shard_group) for shard_group in shard_groups]
+
+        if options['json']:
+            self.stdout.write(json.dumps(OrderedDict((plan.shard_group, self.get_json_plan(plan)) for plan in plans), indent=2))
+            return
+
+        for plan in plans:
+            self.stdout.write(getattr(self.style, "MIGRATE_HEADING", lambda a: a)("Shard group {}:".format(plan.shard_group)))
+            if not plan.steps:
+                self.stdout.write("  No models can be filtered by the shard key.")
+            for index, step in enumerate(plan.steps):
+                line = "  {}. {} by {}".format(index + 1, step.label, step.shard_key_lookup)
+                if step.dependencies:
+                    line += ", after {}".format(', '.join(model._meta.label for model in step.dependencies))
+                self.stdout.write(line)
+                if step.id_encodes_shard:
+                    self.stdout.write(getattr(self.style, "WARNING", lambda a: a)("     The primary keys of {} embed their shard, so its rows can't be moved.".format(step.label)))
+            if plan.unreachable:
+                self.stdout.write(getattr(self.style, "WARNING", lambda a: a)("  Not linked to the shard key: {}".format(
+                    ', '.join(model._meta.label for model in plan.unreachable)
+                )))
+
+    def get_json_plan(self, plan):
+        return OrderedDict([
+            ('steps', [
+                OrderedDict([
+                    ('model', step.label),
+                    ('filter', step.shard_key_lookup),
+                    ('depends_on', [model._meta.label for model in step.dependencies]),
+                    ('id_encodes_shard', step.id_encodes_shard),
+                ])
+                for step in plan.steps
+            ]),
+            ('unreachable', [model._meta.label for model in plan.unreachable]),
+        ])
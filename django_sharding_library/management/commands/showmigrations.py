@@ -1,7 +1,14 @@
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 from django.core.management.commands.showmigrations import Command as ShowMigrationsCommand
+from django.db.migrations.loader import MigrationLoader
 
+from django_sharding_library.cross_shard import gather_from_databases
 from django_sharding_library.exceptions import InvalidShowMigrationsException
+from django_sharding_library.utils import get_applied_migrations
 
 
 class Command(ShowMigrationsCommand):
@@ -13,6 +20,10 @@ class Command(ShowMigrationsCommand):
         else:
             databases = [options['database']]
 
+        if options.get('matrix'):
+            self.show_matrix(databases, options)
+            return
+
         for database in databases:
             options['database'] = database
             # Writen in green text to stand out from the surrouding headings
@@ -20,6 +31,100 @@ class Command(ShowMigrationsCommand):
                 self.stdout.write(getattr(self.style, "MIGRATE_SUCCESS", getattr(self.style, "SUCCESS", lambda a: a))("\nDatabase: {}\n").format(database))
             super(Command, self).handle(*args, **options)
 
+    def get_migration_plan(self):
+        """
+        Returns every migration in the order they're applied, from a graph built
+        once without looking at any database.
+        """
+        graph = MigrationLoader(None, ignore_no_migrations=True).graph
+        plan = OrderedDict()
+        for leaf in graph.leaf_nodes():
+            for key in graph.forwards_plan(leaf):
+                plan[key] = True
+        return list(plan)
+
+    def get_applied_migrations(self, database):
+        return get_applied_migrations(database)
+
+    def get_matrix(self, databases, app_labels):
+        """
+        Returns the databases each migration is applied on, including those
+        only known from the `django_migrations` table of some database, along
+        with the databases which couldn't be read.
+        """
+        with ThreadPoolExecutor(max_workers=min(len(databases), 32)) as executor:
+            applied, errors = gather_from_databases(databases, self.get_applied_migrations, executor)
+
+        migrations = self.get_migration_plan()
+        known = set(migrations)
+        for database_applied in applied.values():
+            migrations.extend(sorted(key for key in database_applied if key not in known))
+            known.update(database_applied)
+        if app_labels:
+            migrations = [key for key in migrations if key[0] in app_labels]
+
+        matrix = OrderedDict()
+        for key in sorted(migrations, key=lambda key: key[0]):
+            matrix[key] = [database for database in applied if key in applied[database]]
+        return list(applied), matrix, errors
+
+    def show_matrix(self, databases, options):
+        """
+        Prints whether each migration is applied on every database, none of
+        them or only some, listing the databases that differ from the others.
+        """
+        databases, matrix, errors = self.get_matrix(databases, options['app_label'])
+        diverged = []
+        rows = []
+        for (app_label, name), applied_on in matrix.items():
+            missing_on = [database for database in databases if database not in applied_on]
+            if not missing_on:
+                status = 'applied'
+            elif not applied_on:
+                status = 'pending'
+            else:
+                status = 'diverged'
+                diverged.append((app_label, name))
+            rows.append((app_label, name, status, applied_on, missing_on))
+
+        if options.get('json'):
+            self.stdout.write(json.dumps({
+                'databases': databases,
+                'errors': OrderedDict((database, str(error)) for database, error in errors.items()),
+                'in_sync': not diverged and not errors,
+                'migrations': [self.get_json_row(*row) for row in rows],
+            }, indent=2))
+            return
+
+        self.stdout.write("Databases: {}".format(', '.join(databases)))
+        current_app_label = None
+        for app_label, name, status, applied_on, missing_on in rows:
+            if app_label != current_app_label:
+                self.stdout.write(self.style.MIGRATE_LABEL(app_label))
+                current_app_label = app_label
+            if status == 'applied':
+                self.stdout.write(" [X] {}".format(name))
+            elif status == 'pending':
+                self.stdout.write(" [ ] {}".format(name))
+            elif len(applied_on) <= len(missing_on):
+                self.stdout.write(" [~] {}  only applied on: {}".format(name, ', '.join(applied_on)))
+            else:
+                self.stdout.write(" [~] {}  not applied on: {}".format(name, ', '.join(missing_on)))
+
+        for database, error in errors.items():
+            self.stderr.write(getattr(self.style, "ERROR", lambda a: a)("Database {}: {}".format(database, error)))
+        if diverged:
+            self.stdout.write(getattr(self.style, "WARNING", lambda a: a)("{} migrations are only applied on some of the databases.".format(len(diverged))))
+        elif not errors:
+            self.stdout.write(getattr(self.style, "SUCCESS", lambda a: a)("The databases are in sync."))
+
+    def get_json_row(self, app_label, name, status, applied_on, missing_on):
+        row = OrderedDict([('app', app_label), ('name', name), ('status', status)])
+        if status == 'diverged':
+            row['applied_on'] = applied_on
+            row['missing_on'] = missing_on
+        return row
+
     def get_all_but_replica_dbs(self):
         return list(filter(
             lambda db: not settings.DATABASES[db].get('PRIMARY', None),
@@ -31,3 +136,11 @@ class Command(ShowMigrationsCommand):
         parser._option_string_actions['--database'].default = None
         parser._option_string_actions['--database'].help = u'Nominates a database to synchronize. Defaults to all databases.'
         parser._option_string_actions['--database'].choices = ['all'] + self.get_all_but_replica_dbs()
+        parser.add_argument(
+            '--matrix', action='store_true', dest='matrix', default=False,
+            help='Shows each migration once with the databases it is applied on, reading every database in parallel.',
+        )
+        parser.add_argument(
+            '--json', action='store_true', dest='json', default=False,
+            help='With --matrix, writes the matrix as JSON.',
+        )
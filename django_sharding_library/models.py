@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.db import models
 
+from django_sharding_library.exceptions import DjangoShardingException
 from django_sharding_library.fields import BigAutoField
 
 
@@ -71,6 +72,48 @@ class ShardLookupQuerySet(models.QuerySet):
         return super().bulk_create(objs, batch_size)
 
 
+class ShardedManager(models.Manager):
+    """
+    A manager for sharded models which can run queries across all the shards
+    of the shard group at once.
+    """
+    def across_shards(self, shard_group=None, use_replicas=False, max_workers=None, timeout=None, allow_partial=False):
+        """
+        Returns a query run on every shard of the shard group. With a `timeout`,
+        in seconds, the shards which haven't answered by then are cancelled and
+        a `CrossShardTimeoutException` is raised, unless `allow_partial` is set
+        in which case the results of the other shards are returned and the
+        shards that did not answer are listed in `missing_shards`.
+        """
+        from django_sharding_library.cross_shard import CrossShardQuerySet
+
+        shard_group = shard_group or getattr(self.model, 'django_sharding__shard_group', None)
+        if not shard_group:
+            raise DjangoShardingException('Unable to identify the shard_group for the {} model'.format(self.model))
+        return CrossShardQuerySet(
+            self.get_queryset(), shard_group, use_replicas=use_replicas, max_workers=max_workers, timeout=timeout, allow_partial=allow_partial,
+        )
+
+    def in_bulk_across_shards(self, id_list, shard_group=None, use_replicas=False, max_workers=None):
+        """
+        Returns a dictionary of the primary keys to the objects with those primary
+        keys, running at most one query per shard. See `CrossShardQuerySet.in_bulk`.
+        """
+        return self.across_shards(shard_group=shard_group, use_replicas=use_replicas, max_workers=max_workers).in_bulk(id_list)
+
+    def bulk_update_across_shards(self, objs, fields, batch_size=None, shard_group=None, max_workers=None):
+        """
+        Updates the fields of the objects on the shards they live on. See `CrossShardQuerySet.bulk_update`.
+        """
+        return self.across_shards(shard_group=shard_group, max_workers=max_workers).bulk_update(objs, fields, batch_size=batch_size)
+
+    def delete_by_ids(self, id_list, shard_group=None, max_workers=None):
+        """
+        Deletes the objects with the primary keys from the shards they live on. See `CrossShardQuerySet.delete_by_ids`.
+        """
+        return self.across_shards(shard_group=shard_group, max_workers=max_workers).delete_by_ids(id_list)
+
+
 class ShardLookupBaseModel(models.Model):
     """
     Unfortunatly when you call `model.objects.using(db).create(...) Django
@@ -0,0 +1,81 @@
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django_sharding_library.exceptions import DjangoShardingException, InvalidCursorException
+
+
+class CrossShardPage(object):
+    def __init__(self, object_list, next_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.paginator = paginator
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return '<CrossShardPage of {} objects>'.format(len(self.object_list))
+
+
+class CrossShardPaginator(object):
+    """
+    Paginates a cross shard query with cursors rather than page numbers.
+
+    Each cursor holds the position in the ordering of the last row of the
+    previous page, so every shard is only asked for the `per_page` rows after
+    it rather than skipping the rows of all the previous pages with an
+    `OFFSET`. Fetching a deep page costs the same as fetching the first one.
+
+        paginator = CrossShardPaginator(TestModel.objects.across_shards().order_by('-id'), per_page=20)
+        page = paginator.page()
+        next_page = paginator.page(page.next_cursor)
+    """
+    def __init__(self, cross_shard_queryset, per_page):
+        if cross_shard_queryset.low_mark or cross_shard_queryset.high_mark is not None:
+            raise DjangoShardingException('Cannot paginate a sliced query across shards.')
+        if cross_shard_queryset.group_aggregates:
+            raise DjangoShardingException('Cannot paginate a query grouped across shards.')
+        if per_page < 1:
+            raise ValueError('per_page must be at least 1.')
+        self.cross_shard_queryset = cross_shard_queryset
+        self.per_page = per_page
+        self.queryset, self.ordering = cross_shard_queryset.get_keyset_ordering()
+
+    def page(self, cursor=None):
+        cross_shard_queryset = self.cross_shard_queryset._clone(self.queryset)
+        if cursor:
+            cross_shard_queryset = cross_shard_queryset.filter(
+                self.ordering.get_keyset_filter_for_values(self.decode_cursor(cursor))
+            )
+        # Ask for one extra row to know whether there is a next page.
+        rows = list(cross_shard_queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode_cursor(self.ordering.get_values(rows[-1]))
+        return CrossShardPage(rows, next_cursor, self)
+
+    def encode_cursor(self, values):
+        data = json.dumps({'o': self.ordering.order_by, 'v': values}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4)).decode('utf-8'))
+            order_by, values = data['o'], data['v']
+        except (TypeError, ValueError, KeyError):
+            raise InvalidCursorException('The cursor {} is invalid.'.format(cursor))
+        if order_by != self.ordering.order_by or len(values) != len(order_by):
+            raise InvalidCursorException('The cursor {} belongs to a query with a different ordering.'.format(cursor))
+        return values
@@ -0,0 +1,180 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.signals import setting_changed
+from django.db.models.constants import LOOKUP_SEP
+from django.dispatch import receiver
+
+from django_sharding_library.exceptions import DjangoShardingException
+from django_sharding_library.registry import get_all_model_metadata
+
+
+_copy_plans = {}
+
+
+class CopyStep(object):
+    """
+    One sharded model of a copy plan, with the lookup from the model to the
+    shard key and the models of the plan its foreign keys point to.
+    """
+    def __init__(self, model, shard_key_lookup, dependencies):
+        self.model = model
+        self.shard_key_lookup = shard_key_lookup
+        self.dependencies = dependencies
+
+    @property
+    def label(self):
+        return self.model._meta.label
+
+    @property
+    def id_encodes_shard(self):
+        """
+        Whether the primary keys embed the shard they were created on, in which
+        case the rows can't be moved to another shard without changing them.
+        """
+        return callable(getattr(self.model._meta.pk, 'get_shard_from_id', None))
+
+    def get_shard_key(self, instance):
+        """
+        Returns the shard key of an instance of the model by following the
+        foreign keys of the lookup, which may query the models they point to,
+        or None when one of them is unset.
+        """
+        names = self.shard_key_lookup.split(LOOKUP_SEP)
+        for name in names[:-1]:
+            try:
+                instance = getattr(instance, name)
+            except ObjectDoesNotExist:
+                return None
+            if instance is None:
+                return None
+        return getattr(instance, instance._meta.get_field(names[-1]).attname)
+
+    def get_queryset(self, database, shard_key):
+        return self.model._base_manager.using(database).filter(**{self.shard_key_lookup: shard_key}).order_by('pk')
+
+    def __repr__(self):
+        return '<CopyStep: {} by {}>'.format(self.label, self.shard_key_lookup)
+
+
+class CopyPlan(object):
+    """
+    The sharded models of a shard group which can be filtered by shard key, in
+    an order which copies the rows a foreign key points to before the rows
+    pointing to them, along with the models which can't be filtered by it.
+    """
+    def __init__(self, shard_group, steps, unreachable):
+        self.shard_group = shard_group
+        self.steps = steps
+        self.unreachable = unreachable
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def models(self):
+        return [step.model for step in self.steps]
+
+    def get_step(self, model):
+        for step in self.steps:
+            if step.model is model:
+                return step
+        return None
+
+
+def _get_forward_relations(model, models):
+    """
+    Yields the concrete foreign keys and one to one fields, including the
+    `PostgresShardForeignKey` and `PostgresShardOneToOne`, from the model to
+    the other models given.
+    """
+    for field in model._meta.concrete_fields:
+        if field.is_relation and field.related_model in models and field.related_model is not model:
+            yield field
+
+
+def _get_shard_key_lookups(models):
+    """
+    Returns the shortest lookup from each model to the shard key, which is the
+    `shard_key_field` of the model or a foreign key followed by the lookup of
+    the model it points to.
+    """
+    lookups = {}
+    for model in models:
+        shard_key_field = getattr(model, 'django_sharding__shard_key_field', None)
+        if shard_key_field:
+            lookups[model] = shard_key_field
+
+    # Each pass adds the models one more foreign key away from the shard key.
+    while True:
+        found = {}
+        for model in models:
+            if model in lookups:
+                continue
+            for field in _get_forward_relations(model, lookups):
+                lookup = LOOKUP_SEP.join([field.name, lookups[field.related_model]])
+                if model not in found or lookup.count(LOOKUP_SEP) < found[model].count(LOOKUP_SEP):
+                    found[model] = lookup
+        if not found:
+            return lookups
+        lookups.update(found)
+
+
+def _sort_by_dependencies(shard_group, dependencies):
+    """
+    Returns the models with each one after the models it depends on, keeping
+    the models in order of their labels when they don't depend on each other.
+    """
+    remaining = dict((model, set(models)) for model, models in dependencies.items())
+    ordered = []
+    while remaining:
+        ready = sorted((model for model, models in remaining.items() if not models), key=lambda model: model._meta.label)
+        if not ready:
+            raise DjangoShardingException('The foreign keys of {} in the {} shard group form a cycle, so no copy order keeps them valid.'.format(
+                ', '.join(sorted(model._meta.label for model in remaining)), shard_group
+            ))
+        for model in ready:
+            ordered.append(model)
+            del remaining[model]
+        for models in remaining.values():
+            models.difference_update(ready)
+    return ordered
+
+
+def build_copy_plan(shard_group):
+    """
+    Builds the copy plan of the shard group from the models configured with
+    `model_config(shard_group=...)`.
+    """
+    models = [metadata.model for metadata in get_all_model_metadata() if metadata.is_sharded and metadata.shard_group == shard_group]
+    lookups = _get_shard_key_lookups(models)
+    dependencies = dict(
+        (model, [field.related_model for field in _get_forward_relations(model, lookups)])
+        for model in lookups
+    )
+    steps = [
+        CopyStep(model, lookups[model], sorted(set(dependencies[model]), key=lambda model: model._meta.label))
+        for model in _sort_by_dependencies(shard_group, dependencies)
+    ]
+    unreachable = sorted((model for model in models if model not in lookups), key=lambda model: model._meta.label)
+    return CopyPlan(shard_group, steps, unreachable)
+
+
+def get_copy_plan(shard_group):
+    """
+    Returns the copy plan of the shard group, built once per process.
+    """
+    if shard_group not in _copy_plans:
+        _copy_plans[shard_group] = build_copy_plan(shard_group)
+    return _copy_plans[shard_group]
+
+
+def clear_copy_plans():
+    _copy_plans.clear()
+
+
+@receiver(setting_changed)
+def clear_copy_plans_on_setting_changed(setting, **kwargs):
+    if setting in ('DATABASES', 'INSTALLED_APPS'):
+        clear_copy_plans()
@@ -0,0 +1,160 @@
+from django.apps import apps
+from django.conf import settings
+from django.db.models.expressions import Col
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual, In, LessThan, LessThanOrEqual, Range
+from django.db.models.sql.where import AND, WhereNode
+
+from django_sharding_library.registry import get_model_metadata
+
+
+class FieldConstraints(object):
+    """
+    The values a field is restricted to by the filters of a query.
+    """
+    def __init__(self):
+        self.values = None
+        self.lower = None
+        self.upper = None
+
+    def add_values(self, values):
+        values = set(values)
+        self.values = values if self.values is None else self.values & values
+
+    def add_lower(self, lower):
+        self.lower = lower if self.lower is None else max(self.lower, lower)
+
+    def add_upper(self, upper):
+        self.upper = upper if self.upper is None else min(self.upper, upper)
+
+    @property
+    def has_range(self):
+        return self.lower is not None or self.upper is not None
+
+
+def _get_lookups(where_node):
+    """
+    Yields the lookups which every row returned by the query must match, which
+    are those not under an OR or a NOT.
+    """
+    if where_node.negated or (where_node.connector != AND and len(where_node.children) > 1):
+        return
+    for child in where_node.children:
+        if isinstance(child, WhereNode):
+            for lookup in _get_lookups(child):
+                yield lookup
+        else:
+            yield child
+
+
+def get_field_constraints(queryset, field):
+    """
+    Returns the constraints the filters of the query place on a field of the
+    model, ignoring any filter which isn't a plain comparison with values.
+    """
+    constraints = FieldConstraints()
+    for lookup in _get_lookups(queryset.query.where):
+        lhs = getattr(lookup, 'lhs', None)
+        if not isinstance(lhs, Col) or lhs.target != field or lhs.alias != queryset.query.base_table:
+            continue
+        rhs = lookup.rhs
+        if hasattr(rhs, 'resolve_expression') or hasattr(rhs, 'as_sql'):
+            continue
+
+        if isinstance(lookup, Exact):
+            if rhs is not None:
+                constraints.add_values([rhs])
+        elif isinstance(lookup, In):
+            constraints.add_values(value for value in rhs if value is not None)
+        elif isinstance(lookup, (GreaterThan, GreaterThanOrEqual)):
+            constraints.add_lower(rhs)
+        elif isinstance(lookup, (LessThan, LessThanOrEqual)):
+            constraints.add_upper(rhs)
+        elif isinstance(lookup, Range):
+            constraints.add_lower(rhs[0])
+            constraints.add_upper(rhs[1])
+    return constraints
+
+
+def get_bucketer(model, shard_group):
+    metadata = get_model_metadata(model)
+    if metadata is not None and metadata.shard_group == shard_group and metadata.bucketer is not None:
+        return metadata.bucketer
+    app_config_app_label = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('APP_CONFIG_APP', 'django_sharding')
+    return apps.get_app_config(app_config_app_label).get_bucketer(shard_group)
+
+
+def get_shards_for_shard_keys(model, shard_group, keys):
+    """
+    Returns the shards of the shard keys, using the batch API of the bucketer
+    when it can derive the shard from the key and the `get_shards_from_shard_keys`
+    static method of the model otherwise, which takes a list of shard keys and
+    returns a dictionary of the shard keys to their shard. Returns None if any
+    is unknown, or if neither can look them up in one go.
+    """
+    try:
+        return set(get_bucketer(model, shard_group).get_shards_for_keys(keys).values())
+    except NotImplementedError:
+        pass
+
+    get_shards_from_shard_keys = getattr(model, 'get_shards_from_shard_keys', None)
+    if not callable(get_shards_from_shard_keys):
+        return None
+    keys = list(keys)
+    shards = get_shards_from_shard_keys(keys)
+    if any(not shards.get(key) for key in keys):
+        return None
+    return set(shards[key] for key in keys)
+
+
+def get_shards_for_ids(model, ids):
+    """
+    Returns the shards encoded in the primary keys, or None if the primary key field doesn't encode them.
+    """
+    pk_field = model._meta.pk
+    if not callable(getattr(pk_field, 'get_shard_from_id', None)):
+        return None
+    shards = set()
+    for pk in ids:
+        shard = pk_field.get_shard_from_id(pk)
+        if not shard:
+            return None
+        shards.add(shard)
+    return shards
+
+
+def prune_shards(queryset, shard_group, shards):
+    """
+    Returns the shards, out of those given, which may contain rows matching the
+    filters of the query:
+
+    * an equality or an `IN` on the primary key keeps the shards encoded in the IDs,
+    * an equality or an `IN` on the `shard_key_field` of the model keeps the
+      shards of those keys,
+    * a range on the `shard_key_field` keeps the shards holding that range,
+      when the bucketer is a `RangeBucketingStrategy`.
+
+    The IDs also embed the time they were generated at, but not which shards
+    existed at that time, so time ranges can't narrow the shards down.
+    """
+    model = queryset.model
+    remaining = set(shards)
+
+    pk_constraints = get_field_constraints(queryset, model._meta.pk)
+    if pk_constraints.values is not None:
+        id_shards = get_shards_for_ids(model, pk_constraints.values)
+        if id_shards is not None:
+            remaining &= id_shards
+
+    shard_key_field_name = getattr(model, 'django_sharding__shard_key_field', None)
+    if shard_key_field_name:
+        key_constraints = get_field_constraints(queryset, model._meta.get_field(shard_key_field_name))
+        if key_constraints.values is not None:
+            key_shards = get_shards_for_shard_keys(model, shard_group, key_constraints.values)
+            if key_shards is not None:
+                remaining &= key_shards
+        if key_constraints.has_range:
+            bucketer = get_bucketer(model, shard_group)
+            if callable(getattr(bucketer, 'get_shards_for_range', None)):
+                remaining &= set(bucketer.get_shards_for_range(key_constraints.lower, key_constraints.upper))
+
+    return [shard for shard in shards if shard in remaining]
@@ -0,0 +1,221 @@
+import time
+
+from django.apps import apps
+from django.db import connections
+from six.moves import zip_longest
+
+from django_sharding_library.exceptions import ShardKeyMoveException
+from django_sharding_library.fields import ShardForeignKeyStorageFieldMixin
+from django_sharding_library.freezing import freeze_shard_key, get_frozen_refresh_interval, unfreeze_shard_key
+from django_sharding_library.planning import get_copy_plan
+from django_sharding_library.registry import get_all_model_metadata
+from django_sharding_library.utils import get_shards_for_group
+
+
+def get_shard_key_directory(shard_group):
+    """
+    Returns a `(model, key_field_name, shard_field_name)` tuple for each model
+    storing the shard of the keys of the shard group: the tables inheriting
+    from `ShardStorageModel` used by a `ShardForeignKeyStorageField` and the
+    unsharded models storing their own shard, such as a user with the
+    `ShardedByMixin`, whose primary key is the shard key.
+    """
+    directory = []
+    for metadata in get_all_model_metadata():
+        if metadata.shard_group != shard_group or metadata.shard_field is None or metadata.is_sharded:
+            continue
+        if isinstance(metadata.shard_field, ShardForeignKeyStorageFieldMixin):
+            entry = (getattr(metadata.shard_field, 'django_sharding__shard_storage_table'), 'shard_key', 'shard')
+        else:
+            entry = (metadata.model, metadata.model._meta.pk.name, metadata.shard_field.name)
+        if entry not in directory:
+            directory.append(entry)
+    return directory
+
+
+def get_shard_for_shard_key(shard_group, shard_key):
+    """
+    Returns the shard the directory of the shard group has for the key, or None
+    if it has none.
+    """
+    shards = set()
+    for model, key_field_name, shard_field_name in get_shard_key_directory(shard_group):
+        shards.update(filter(None, model._base_manager.filter(**{key_field_name: shard_key}).values_list(shard_field_name, flat=True)))
+    if len(shards) > 1:
+        raise ShardKeyMoveException('The shard key {} is stored on several shards: {}.'.format(shard_key, ', '.join(sorted(shards))))
+    return shards.pop() if shards else None
+
+
+class ShardKeyMover(object):
+    """
+    Moves the rows of one shard key to another shard, one resumable step at a
+    time, recording its progress on a `ShardKeyMove`.
+    """
+    def __init__(self, move, batch_size=1000, throttle=0.0, log=None):
+        self.move = move
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.log = log or (lambda message: None)
+        self.steps = get_copy_plan(move.shard_group).steps
+
+    def save_progress(self, status=None, model='', last_pk=''):
+        if status is not None:
+            self.move.status = status
+        self.move.model = model
+        self.move.last_pk = last_pk
+        self.move.save()
+
+    def pause(self):
+        if self.throttle:
+            time.sleep(self.throttle)
+
+    def get_remaining_steps(self, steps):
+        """
+        Returns the models the current step hasn't finished with yet.
+        """
+        labels = [step.label for step in steps]
+        if self.move.model in labels:
+            return steps[labels.index(self.move.model):]
+        return steps
+
+    def insert(self, model, rows):
+        """
+        Inserts the rows on the target as they are, without the `pre_save` of
+        their fields, which would give the `auto_now` fields and the generated
+        ids new values, ignoring the rows which are already there.
+        """
+        fields = model._meta.concrete_fields
+        batch_size = max(connections[self.move.target].ops.bulk_batch_size(fields, rows), 1)
+        for start in range(0, len(rows), batch_size):
+            model._base_manager._insert(rows[start:start + batch_size], fields=fields, raw=True, using=self.move.target, ignore_conflicts=True)
+
+    def delete_copies(self):
+        """
+        Deletes the rows of the shard key copied to the target so far.
+        """
+        move = self.move
+        for step in reversed(self.steps):
+            self.log('Deleting {} from {}'.format(step.label, move.target))
+            step.get_queryset(move.target, move.shard_key).delete()
+
+    def copy(self):
+        move = self.move
+        for step in self.get_remaining_steps(self.steps):
+            self.log('Copying {} from {} to {}'.format(step.label, move.source, move.target))
+            last_pk = move.last_pk if move.model == step.label else ''
+            while True:
+                rows = step.get_queryset(move.source, move.shard_key)
+                if last_pk:
+                    rows = rows.filter(pk__gt=last_pk)
+                batch = list(rows[:self.batch_size])
+                if not batch:
+                    break
+                # A batch copied before an interruption is copied again, so ignore the rows already there.
+                self.insert(step.model, batch)
+                last_pk = str(batch[-1].pk)
+                self.save_progress(model=step.label, last_pk=last_pk)
+                self.pause()
+        self.save_progress(status=move.VERIFYING)
+
+    def verify(self):
+        move = self.move
+        for step in self.steps:
+            self.log('Verifying {} on {}'.format(step.label, move.target))
+            field_names = [field.attname for field in step.model._meta.concrete_fields]
+            source_rows = step.get_queryset(move.source, move.shard_key).values_list(*field_names).iterator(chunk_size=self.batch_size)
+            target_rows = step.get_queryset(move.target, move.shard_key).values_list(*field_names).iterator(chunk_size=self.batch_size)
+            for source_row, target_row in zip_longest(source_rows, target_rows):
+                if source_row != target_row:
+                    # Copying again would leave the rows which differ as they are.
+                    self.delete_copies()
+                    self.save_progress(status=move.COPYING)
+                    raise ShardKeyMoveException('The {} rows of the shard key {} on {} differ from those on {}: {} != {}. The copies were deleted, so moving it again copies them again.'.format(
+                        step.label, move.shard_key, move.target, move.source, target_row, source_row
+                    ))
+        self.save_progress(status=move.SWITCHING)
+
+    def switch(self):
+        move = self.move
+        for model, key_field_name, shard_field_name in get_shard_key_directory(move.shard_group):
+            self.log('Switching {} to {}'.format(model._meta.label, move.target))
+            model._base_manager.filter(**{key_field_name: move.shard_key}).update(**{shard_field_name: move.target})
+        self.save_progress(status=move.DELETING)
+
+    def delete(self):
+        move = self.move
+        # The rows pointing to others are deleted before the rows they point to.
+        for step in self.get_remaining_steps(list(reversed(self.steps))):
+            self.log('Deleting {} from {}'.format(step.label, move.source))
+            while True:
+                pks = list(step.get_queryset(move.source, move.shard_key).values_list('pk', flat=True)[:self.batch_size])
+                if not pks:
+                    break
+                step.model._base_manager.using(move.source).filter(pk__in=pks).delete()
+                self.save_progress(model=step.label)
+                self.pause()
+        unfreeze_shard_key(move.shard_group, move.shard_key)
+        self.save_progress(status=move.DONE)
+
+    def run(self):
+        steps = [
+            (self.move.COPYING, self.copy),
+            (self.move.VERIFYING, self.verify),
+            (self.move.SWITCHING, self.switch),
+            (self.move.DELETING, self.delete),
+        ]
+        for status, step in steps:
+            if self.move.status == status:
+                step()
+        return self.move
+
+
+def move_shard_key(shard_group, shard_key, target, batch_size=1000, throttle=0.0, log=None):
+    """
+    Moves every row of a shard key to the target shard without stopping the
+    reads of that key:
+
+    1. the shard key is frozen so the router refuses to write its rows, and
+       the move waits `FROZEN_REFRESH_INTERVAL` for every process to notice,
+    2. the rows of each sharded model of the copy plan of the shard group are
+       copied to the target in batches of `batch_size`, as they are, after
+       the rows they have a foreign key to,
+    3. the rows on the target are compared with those on the source, and
+       when they differ the copies are deleted and the move goes back to 2,
+    4. the shard stored for the key is switched to the target,
+    5. the rows are deleted from the source and the key is unfrozen.
+
+    The progress is stored on a `ShardKeyMove`, so calling this again after
+    an interruption or a failed verification carries on where the move
+    stopped. `throttle` is the number of seconds to wait after each batch.
+    Returns the `ShardKeyMove`.
+    """
+    if not apps.is_installed('django_sharding'):
+        raise ShardKeyMoveException('Moving shard keys requires the django_sharding app to be installed.')
+    ShardKeyMove = apps.get_model('django_sharding', 'ShardKeyMove')
+    if target not in get_shards_for_group(shard_group):
+        raise ShardKeyMoveException('{} is not a primary shard of the {} shard group.'.format(target, shard_group))
+
+    unmovable = [step.label for step in get_copy_plan(shard_group) if step.id_encodes_shard]
+    if unmovable:
+        raise ShardKeyMoveException('The primary keys of {} embed the shard they were created on, so their rows cannot be moved.'.format(', '.join(unmovable)))
+
+    shard_key = str(shard_key)
+    move = ShardKeyMove.objects.filter(shard_group=shard_group, shard_key=shard_key).exclude(status=ShardKeyMove.DONE).first()
+    if move is not None:
+        if move.target != target:
+            raise ShardKeyMoveException('The shard key {} is already being moved to {}.'.format(shard_key, move.target))
+        if log:
+            log('Resuming the move of {} from {} to {} at the {} step'.format(shard_key, move.source, move.target, move.status))
+    else:
+        source = get_shard_for_shard_key(shard_group, shard_key)
+        if source is None:
+            raise ShardKeyMoveException('The shard key {} has no shard in the {} shard group.'.format(shard_key, shard_group))
+        if source == target:
+            raise ShardKeyMoveException('The shard key {} is already on {}.'.format(shard_key, target))
+        freeze_shard_key(shard_group, shard_key)
+        move = ShardKeyMove.objects.create(shard_group=shard_group, shard_key=shard_key, source=source, target=target)
+        if log:
+            log('Froze {}, waiting for every process to notice'.format(shard_key))
+        time.sleep(get_frozen_refresh_interval())
+
+    return ShardKeyMover(move, batch_size=batch_size, throttle=throttle, log=log).run()
@@ -0,0 +1,106 @@
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from django_sharding_library.utils import get_possible_databases_for_model
+
+
+_model_metadata = {}
+
+
+class ShardedModelMetadata(object):
+    """
+    The sharding configuration of a model, worked out once when the app is
+    ready so that the signals, fields and router don't have to inspect the
+    model on every save.
+    """
+    def __init__(self, model, shard_group=None, shard_field=None, stores_shard=False, use_signal=False,
+                 bucketer=None, id_field=None):
+        self.model = model
+        self.shard_group = shard_group
+        self.shard_field = shard_field
+        self.stores_shard = stores_shard
+        self.use_signal = use_signal
+        self.bucketer = bucketer
+        self.id_field = id_field
+        self.is_sharded = getattr(model, 'django_sharding__is_sharded', False)
+        self.shard_key_field = getattr(model, 'django_sharding__shard_key_field', None)
+        self.database = getattr(model, 'django_sharding__database', None)
+        self._databases = None
+
+    @property
+    def databases(self):
+        if self._databases is None:
+            self._databases = get_possible_databases_for_model(model=self.model)
+        return self._databases
+
+    def clear_cached_databases(self):
+        self._databases = None
+
+    @classmethod
+    def from_model(cls, model, bucketers):
+        from django_sharding_library.fields import BasePostgresShardGeneratedIDField, ShardedIDFieldMixin
+
+        shard_group = getattr(model, 'django_sharding__shard_group', None)
+        stores_shard = False
+        use_signal = False
+        shard_field = None
+
+        shard_fields = list(filter(lambda field: getattr(field, 'django_sharding__stores_shard', False), model._meta.fields))
+        if getattr(model, 'django_sharding__stores_shard', False) and shard_group:
+            shard_field_name = getattr(model, 'django_sharding__shard_field', None)
+            if not shard_field_name:
+                raise Exception('The model {} must have a `shard_field` attribute'.format(model))
+            if not shard_fields:
+                shard_fields = list(filter(lambda field: field.name == shard_field_name, model._meta.fields))
+            stores_shard = True
+            use_signal = True
+        elif shard_fields:
+            if len(shard_fields) > 1:
+                raise Exception('The model {} has multiple fields for shard storage: {}'.format(model, shard_fields))
+            shard_group = getattr(shard_fields[0], 'django_sharding__shard_group', None)
+            if not shard_group:
+                raise Exception('The model {} with the shard field must have a `shard_group` attribute'.format(model))
+            stores_shard = True
+            use_signal = getattr(shard_fields[0], 'django_sharding__use_signal', False)
+
+        # The signal handler finds the field the same way and refuses to pick between several.
+        if len(shard_fields) == 1:
+            shard_field = shard_fields[0]
+
+        id_field = model._meta.pk
+        if not isinstance(id_field, (ShardedIDFieldMixin, BasePostgresShardGeneratedIDField)):
+            id_field = None
+
+        return cls(
+            model=model,
+            shard_group=shard_group,
+            shard_field=shard_field,
+            stores_shard=stores_shard,
+            use_signal=use_signal,
+            bucketer=bucketers.get(shard_group),
+            id_field=id_field,
+        )
+
+
+def populate(models, bucketers):
+    """
+    Builds the metadata for each of the models, replacing any previous registry.
+    """
+    _model_metadata.clear()
+    for model in models:
+        _model_metadata[model] = ShardedModelMetadata.from_model(model, bucketers)
+
+
+def get_model_metadata(model):
+    return _model_metadata.get(model)
+
+
+def get_all_model_metadata():
+    return list(_model_metadata.values())
+
+
+@receiver(setting_changed)
+def clear_cached_databases(setting, **kwargs):
+    if setting == 'DATABASES':
+        for metadata in _model_metadata.values():
+            metadata.clear_cached_databases()
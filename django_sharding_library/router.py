@@ -1,7 +1,14 @@
+import weakref
+
 from django.apps import apps
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
-from django_sharding_library.exceptions import DjangoShardingException, InvalidMigrationException
+from django_sharding_library.exceptions import DjangoShardingException, InvalidMigrationException, ShardKeyFrozenException, ShardReadOnlyException
+from django_sharding_library.freezing import are_writes_checked, has_frozen_shard_keys, is_shard_key_frozen, is_shard_read_only
+from django_sharding_library.planning import get_copy_plan
+from django_sharding_library.registry import get_model_metadata
 from django_sharding_library.utils import (
     is_model_class_on_database,
     get_database_for_model_instance,
@@ -9,6 +16,9 @@ from django_sharding_library.utils import (
 )
 
 
+_routers = weakref.WeakSet()
+
+
 class ShardedRouter(object):
     """
     A router that is shard-aware and will prevent running migrations on
@@ -19,6 +29,12 @@ class ShardedRouter(object):
     def get_shard_for_instance(self, instance):
         return instance._state.db or instance.get_shard()
 
+    def get_possible_databases(self, model):
+        metadata = get_model_metadata(model)
+        if metadata is not None:
+            return metadata.databases
+        return get_possible_databases_for_model(model=model)
+
     def get_read_db_routing_strategy(self, shard_group):
         app_config_app_label = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('APP_CONFIG_APP', 'django_sharding')
         return apps.get_app_config(app_config_app_label).get_routing_strategy(shard_group)
@@ -42,7 +58,7 @@ class ShardedRouter(object):
         return shard
 
     def db_for_read(self, model, **hints):
-        possible_databases = get_possible_databases_for_model(model=model)
+        possible_databases = self.get_possible_databases(model)
         if len(possible_databases) == 1:
             return possible_databases[0]
 
@@ -56,25 +72,76 @@ class ShardedRouter(object):
         return None
 
     def db_for_write(self, model, **hints):
-        possible_databases = get_possible_databases_for_model(model=model)
+        possible_databases = self.get_possible_databases(model)
         if len(possible_databases) == 1:
+            self.check_database_is_writable(possible_databases[0])
             return possible_databases[0]
 
         shard = self._get_shard(model, **hints)
 
         if shard:
+            if hints.get("instance", None) is not None:
+                self.check_shard_key_is_writable(model, hints["instance"])
             db_config = settings.DATABASES[shard]
-            return db_config.get('PRIMARY', shard)
+            database = db_config.get('PRIMARY', shard)
+            self.check_database_is_writable(database)
+            return database
         return None
 
+    def check_database_is_writable(self, database):
+        """
+        Refuses to write to a shard marked as read-only, such as during maintenance.
+        Only the databases of a shard group can be read-only, so the writes to
+        the others don't look at the read-only shards.
+        """
+        if not settings.DATABASES.get(database, {}).get('SHARD_GROUP') or not are_writes_checked():
+            return
+        if is_shard_read_only(database):
+            raise ShardReadOnlyException('The shard {} is read-only.'.format(database), database=database)
+
+    def check_shard_key_is_writable(self, model, instance):
+        """
+        Refuses to write a sharded instance whose shard key is frozen, such as
+        while its rows are moved to another shard. The models without a
+        `shard_key_field` are checked through the foreign keys the copy plan
+        of their shard group follows to the shard key, which may take a query
+        per foreign key, and only while a shard key of the group is frozen.
+        The frozen shard keys are cached by each process, see
+        `get_frozen_shard_keys`.
+        """
+        if not are_writes_checked():
+            return
+        if not isinstance(instance, model):
+            # Assigning a foreign key gives the instance it points to as the hint.
+            return
+        metadata = get_model_metadata(model)
+        if metadata is None or not metadata.shard_group:
+            return
+        if metadata.shard_key_field:
+            shard_key = getattr(instance, model._meta.get_field(metadata.shard_key_field).attname)
+        else:
+            if not has_frozen_shard_keys(metadata.shard_group):
+                return
+            step = get_copy_plan(metadata.shard_group).get_step(model)
+            if step is None:
+                # The rows of the models outside of the copy plan aren't moved.
+                return
+            shard_key = step.get_shard_key(instance)
+        if shard_key is not None and is_shard_key_frozen(metadata.shard_group, shard_key):
+            raise ShardKeyFrozenException(
+                'The shard key {} of the {} shard group is frozen and cannot be written to.'.format(shard_key, metadata.shard_group),
+                shard_group=metadata.shard_group,
+                shard_key=shard_key,
+            )
+
     def allow_relation(self, obj1, obj2, **hints):
         """
         Only allow relationships between two items which are both on only one database or
         between sharded items on the same shard.
         """
 
-        object1_databases = get_possible_databases_for_model(model=obj1._meta.model)
-        object2_databases = get_possible_databases_for_model(model=obj2._meta.model)
+        object1_databases = self.get_possible_databases(obj1._meta.model)
+        object2_databases = self.get_possible_databases(obj2._meta.model)
 
         if (len(object1_databases) == len(object2_databases) == 1) and (object1_databases == object2_databases):
             return True
@@ -95,6 +162,25 @@ class ShardedRouter(object):
         if model:
             model_name = model.__name__
 
+        # Migrations ask about the same models for every operation on every
+        # database, and the answer only changes with the settings.
+        cache = self.get_allow_migrate_cache()
+        key = (db, app_label, model_name)
+        if key not in cache:
+            cache[key] = self._allow_migrate(db, app_label, model_name)
+        return cache[key]
+
+    def get_allow_migrate_cache(self):
+        cache = self.__dict__.get('_allow_migrate_cache')
+        if cache is None:
+            cache = self.__dict__['_allow_migrate_cache'] = {}
+            _routers.add(self)
+        return cache
+
+    def clear_allow_migrate_cache(self):
+        self.__dict__.pop('_allow_migrate_cache', None)
+
+    def _allow_migrate(self, db, app_label, model_name):
         # Return true if any model in the app is on this database.
         if not model_name:
             app = apps.get_app_config(app_label)
@@ -133,3 +219,10 @@ class ShardedRouter(object):
             raise InvalidMigrationException(
                 e.args[0]
             )
+
+
+@receiver(setting_changed)
+def clear_allow_migrate_caches(setting, **kwargs):
+    if setting in ('DATABASES', 'DJANGO_SHARDING_SETTINGS', 'INSTALLED_APPS'):
+        for router in list(_routers):
+            router.clear_allow_migrate_cache()
@@ -1,7 +1,13 @@
+import os
+import zlib
+from bisect import bisect_right
 from itertools import cycle
+from operator import itemgetter
 from random import choice, randint
 from six import next
 
+from django_sharding_library.exceptions import DjangoShardingException
+
 
 class BaseBucketingStrategy(object):
     """
@@ -32,6 +38,14 @@ class BaseBucketingStrategy(object):
         """
         raise NotImplementedError
 
+    def get_shards_for_keys(self, keys):
+        """
+        Returns a dictionary of the primary keys of the models sharded by to
+        their shard, without loading the models. Only strategies which derive
+        the shard from the primary key can implement this.
+        """
+        raise NotImplementedError
+
 
 class BaseShardedModelBucketingStrategy(BaseBucketingStrategy):
     """
@@ -42,6 +56,9 @@ class BaseShardedModelBucketingStrategy(BaseBucketingStrategy):
         sharded_field = getattr(model_sharded_by, 'django_sharding__shard_field')
         return getattr(model_sharded_by, sharded_field)
 
+    def get_shards_for_keys(self, keys):
+        raise NotImplementedError
+
 
 class RoundRobinBucketingStrategy(BaseShardedModelBucketingStrategy):
     """
@@ -82,18 +99,33 @@ class ModBucketingStrategy(BaseBucketingStrategy):
     A shard selection strategy that assigns shards based on the mod of the
     models pk.
     Note: It is only deterministic as long as the number of shards do not
-    change.
+    change. The key is hashed with CRC32 rather than `hash`, which is salted
+    per process for strings, so that every process picks the same shard.
+    `legacy_hash=True` keeps the `hash` of the earlier versions for the keys
+    already placed with it, which only gives the same shard in every process
+    when `PYTHONHASHSEED` is set.
     """
-    def __init__(self, shard_group, databases):
+    def __init__(self, shard_group, databases, legacy_hash=False):
         super(ModBucketingStrategy, self).__init__(shard_group)
         self.shards = self.get_shards(databases)
+        self.legacy_hash = legacy_hash
 
     def pick_shard(self, model_sharded_by):
-        return self.shards[hash(str(model_sharded_by.pk)) % len(self.shards)]
+        return self.get_shard_for_key(model_sharded_by.pk)
 
     def get_shard(self, model_sharded_by):
         return self.pick_shard(model_sharded_by)
 
+    def get_shard_for_key(self, key):
+        if self.legacy_hash:
+            return self.shards[hash(str(key)) % len(self.shards)]
+        return self.shards[zlib.crc32(str(key).encode('utf-8')) % len(self.shards)]
+
+    def get_shards_for_keys(self, keys):
+        if self.legacy_hash and os.environ.get('PYTHONHASHSEED', 'random') == 'random':
+            raise NotImplementedError('The legacy hash picks a different shard in each process unless PYTHONHASHSEED is set.')
+        return {key: self.get_shard_for_key(key) for key in keys}
+
 
 class SavedModBucketingStrategy(BaseShardedModelBucketingStrategy, ModBucketingStrategy):
     """
@@ -103,3 +135,47 @@ class SavedModBucketingStrategy(BaseShardedModelBucketingStrategy, ModBucketingS
     the model. It is non-deterministic as the number of shards may change.
     """
     pass
+
+
+class RangeBucketingStrategy(BaseBucketingStrategy):
+    """
+    A shard selection strategy that assigns shards based on ranges of the
+    models pk. The ranges are given as a list of `(lower_bound, shard)` pairs
+    where each shard holds the keys from its lower bound, inclusive, up to the
+    lower bound of the next range. Keys below the first bound go to the first
+    shard.
+    This is deterministic as long as the ranges do not change.
+    """
+    def __init__(self, shard_group, databases, ranges):
+        super(RangeBucketingStrategy, self).__init__(shard_group)
+        shards = self.get_shards(databases)
+        if not ranges:
+            raise DjangoShardingException('The RangeBucketingStrategy requires at least one range.')
+        for lower_bound, shard in ranges:
+            if shard not in shards:
+                raise DjangoShardingException('{} is not a shard in the {} shard group.'.format(shard, shard_group))
+        self.ranges = sorted(ranges, key=itemgetter(0))
+        self.lower_bounds = [lower_bound for lower_bound, shard in self.ranges]
+
+    def _get_range_index(self, key):
+        return max(bisect_right(self.lower_bounds, key) - 1, 0)
+
+    def get_shard_for_key(self, key):
+        return self.ranges[self._get_range_index(key)][1]
+
+    def pick_shard(self, model_sharded_by):
+        return self.get_shard_for_key(model_sharded_by.pk)
+
+    def get_shard(self, model_sharded_by):
+        return self.pick_shard(model_sharded_by)
+
+    def get_shards_for_keys(self, keys):
+        return {key: self.get_shard_for_key(key) for key in keys}
+
+    def get_shards_for_range(self, lower=None, upper=None):
+        """
+        Returns the shards holding keys between the bounds, inclusive. A bound of None is unbounded.
+        """
+        first = 0 if lower is None else self._get_range_index(lower)
+        last = len(self.ranges) - 1 if upper is None else self._get_range_index(upper)
+        return sorted(set(shard for lower_bound, shard in self.ranges[first:last + 1]))
@@ -1,6 +1,8 @@
 from django.apps import apps
 from django.conf import settings
 
+from django_sharding_library.registry import get_model_metadata
+
 
 def save_shard_handler(sender, instance, **kwargs):
     """
@@ -10,6 +12,13 @@ def save_shard_handler(sender, instance, **kwargs):
     def shard_handler(sender, instance, **kwargs):
         save_shard_handler(sender, instance, **kwargs)
     """
+    metadata = get_model_metadata(sender)
+    if metadata is not None and metadata.shard_field is not None and metadata.bucketer is not None:
+        shard_field_name = metadata.shard_field.name
+        if not getattr(instance, shard_field_name, None):
+            setattr(instance, shard_field_name, metadata.bucketer.pick_shard(instance))
+        return
+
     app_config_app_label = getattr(settings, 'DJANGO_SHARDING_SETTINGS', {}).get('APP_CONFIG_APP', 'django_sharding')
     bucketer = apps.get_app_config(app_config_app_label).get_bucketer(sender.django_sharding__shard_group)
     shard_fields = list(filter(lambda field: getattr(field, 'django_sharding__stores_shard', False), sender._meta.fields))
@@ -1,16 +1,25 @@
+postgres_create_sequence_sql = """DO
+$$
+BEGIN
+        CREATE SEQUENCE %s;
+EXCEPTION WHEN duplicate_table THEN
+        -- do nothing, it's already there
+END
+$$ LANGUAGE plpgsql;"""
+
 postgres_shard_id_function_sql = """CREATE OR REPLACE FUNCTION next_sharded_id(OUT result bigint) AS $$
 DECLARE
     start_epoch bigint := %(shard_epoch)d;
     seq_id bigint;
     now_millis bigint;
-    shard_id int := %(shard_id)d;
+    shard_id bigint := %(shard_id)d;
 BEGIN
     -- there is a typo here in the online example, which is corrected here
-    SELECT nextval('%(sequence_name)s') %% 1024 INTO seq_id;
+    SELECT nextval('%(sequence_name)s') %% %(sequence_modulus)d INTO seq_id;
 
     SELECT FLOOR(EXTRACT(EPOCH FROM clock_timestamp()) * 1000) INTO now_millis;
-    result := (now_millis - start_epoch) << 23;
-    result := result | (shard_id << 10);
+    result := (now_millis - start_epoch) << %(time_shift)d;
+    result := result | (shard_id << %(shard_shift)d);
     result := result | (seq_id);
 END;
 $$ LANGUAGE PLPGSQL;"""
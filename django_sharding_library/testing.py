@@ -0,0 +1,192 @@
+import os
+import shutil
+import sys
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import get_unique_databases_and_mirrors
+
+from django_sharding_library.constants import Backends
+from django_sharding_library.registry import get_all_model_metadata
+
+
+def _log(connection, message):
+    log = getattr(connection.creation, 'log', None)
+    if log is not None:
+        log(message)
+    else:
+        sys.stderr.write(message + '\n')
+
+
+def _can_clone(template, connection):
+    """
+    Returns whether the test database of the connection can be copied from the
+    test database of the template rather than migrated.
+    """
+    engine = connection.settings_dict['ENGINE']
+    if engine != template.settings_dict['ENGINE']:
+        return False
+    if engine in Backends.SQLITE:
+        return True
+    if engine in Backends.POSTGRES:
+        # A template database can only be copied on the server it lives on.
+        return all(connection.settings_dict.get(key) == template.settings_dict.get(key) for key in ('HOST', 'PORT', 'USER'))
+    return False
+
+
+def _clone_postgres_test_database(template, connection, test_database_name, verbosity, keepdb):
+    quote_name = connection.ops.quote_name
+    # CREATE DATABASE ... TEMPLATE requires that nothing is connected to the template.
+    template.close()
+    with template.creation._nodb_cursor() as cursor:
+        if keepdb:
+            cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', [test_database_name])
+            if cursor.fetchone() is not None:
+                return
+        if verbosity >= 1:
+            _log(connection, 'Cloning test database for alias {!r} from {!r}...'.format(connection.alias, template.alias))
+        cursor.execute('DROP DATABASE IF EXISTS {}'.format(quote_name(test_database_name)))
+        cursor.execute('CREATE DATABASE {} WITH TEMPLATE {}'.format(quote_name(test_database_name), quote_name(template.settings_dict['NAME'])))
+
+
+def _clone_sqlite_test_database(template, connection, test_database_name, verbosity, keepdb):
+    if connection.creation.is_in_memory_db(test_database_name):
+        if verbosity >= 1:
+            _log(connection, 'Cloning test database for alias {!r} from {!r}...'.format(connection.alias, template.alias))
+        _use_test_database(connection, test_database_name)
+        template.ensure_connection()
+        connection.ensure_connection()
+        template.connection.backup(connection.connection)
+        return
+
+    if keepdb and os.access(test_database_name, os.F_OK):
+        return
+    if verbosity >= 1:
+        _log(connection, 'Cloning test database for alias {!r} from {!r}...'.format(connection.alias, template.alias))
+    if os.access(test_database_name, os.F_OK):
+        os.remove(test_database_name)
+    shutil.copy(template.settings_dict['NAME'], test_database_name)
+
+
+def _use_test_database(connection, test_database_name):
+    connection.close()
+    settings.DATABASES[connection.alias]['NAME'] = test_database_name
+    connection.settings_dict['NAME'] = test_database_name
+
+
+def _setup_postgres_shard_ids(connection):
+    """
+    A copied database has the sequence and stored procedure of its template, so
+    they are created again with the shard id of the copy.
+    """
+    from django_sharding_library.fields import BasePostgresShardGeneratedIDField
+
+    if connection.settings_dict['ENGINE'] not in Backends.POSTGRES:
+        return
+    for metadata in get_all_model_metadata():
+        if isinstance(metadata.id_field, BasePostgresShardGeneratedIDField) and connection.alias in metadata.databases:
+            BasePostgresShardGeneratedIDField.migration_receiver(using=connection.alias)
+            return
+
+
+def clone_test_database(template_alias, alias, verbosity=1, keepdb=False, serialize=True):
+    """
+    Creates the test database of the alias as a copy of the test database of the
+    template, which must already be set up, using `CREATE DATABASE ... TEMPLATE`
+    on Postgres and a copy of the database on SQLite.
+
+    Like `create_test_db`, the alias is pointed at the test database until
+    `destroy_test_db` is given the original name, which `teardown_databases`
+    does with the names returned by `setup_sharded_test_databases`.
+    """
+    template = connections[template_alias]
+    connection = connections[alias]
+    old_database_name = connection.settings_dict['NAME']
+    test_database_name = connection.creation._get_test_db_name()
+
+    try:
+        if connection.settings_dict['ENGINE'] in Backends.POSTGRES:
+            _clone_postgres_test_database(template, connection, test_database_name, verbosity, keepdb)
+        else:
+            _clone_sqlite_test_database(template, connection, test_database_name, verbosity, keepdb)
+
+        _use_test_database(connection, test_database_name)
+        _setup_postgres_shard_ids(connection)
+        if serialize:
+            connection._test_serialized_contents = connection.creation.serialize_db_to_string()
+        connection.ensure_connection()
+    except Exception:
+        # Nothing will destroy a test database which failed to be set up, so
+        # its name isn't left in the settings.
+        _use_test_database(connection, old_database_name)
+        raise
+    return test_database_name
+
+
+def setup_sharded_test_databases(verbosity, interactive, keepdb=False, debug_sql=False, parallel=0, aliases=None, serialized_aliases=None, **kwargs):
+    """
+    Sets up the test databases like Django's `setup_databases`, except that only
+    the first shard of each shard group is migrated. The test databases of the
+    other shards of the group are copies of it, which is much faster than
+    running the migrations again when there are many shards.
+
+    Returns the same configuration as `setup_databases`, for `teardown_databases`.
+    """
+    test_databases, mirrored_aliases = get_unique_databases_and_mirrors(aliases)
+    templates = {}
+    old_names = []
+
+    for db_name, database_aliases in test_databases.values():
+        first_alias = None
+        for alias in database_aliases:
+            connection = connections[alias]
+            old_names.append((connection, db_name, first_alias is None))
+
+            if first_alias is not None:
+                connection.creation.set_as_test_mirror(connections[first_alias].settings_dict)
+                continue
+
+            first_alias = alias
+            if serialized_aliases is not None:
+                serialize = alias in serialized_aliases
+            else:
+                serialize = connection.settings_dict['TEST'].get('SERIALIZE', True)
+
+            shard_group = connection.settings_dict.get('SHARD_GROUP')
+            template_alias = templates.get(shard_group) if shard_group else None
+            if template_alias is not None and _can_clone(connections[template_alias], connection):
+                clone_test_database(template_alias, alias, verbosity=verbosity, keepdb=keepdb, serialize=serialize)
+            else:
+                connection.creation.create_test_db(verbosity=verbosity, autoclobber=not interactive, keepdb=keepdb, serialize=serialize)
+                if shard_group:
+                    templates.setdefault(shard_group, alias)
+
+            if parallel > 1:
+                for index in range(parallel):
+                    connection.creation.clone_test_db(suffix=str(index + 1), verbosity=verbosity, keepdb=keepdb)
+
+    for alias, mirror_alias in mirrored_aliases.items():
+        connections[alias].creation.set_as_test_mirror(connections[mirror_alias].settings_dict)
+
+    if debug_sql:
+        for alias in connections:
+            connections[alias].force_debug_cursor = True
+
+    return old_names
+
+
+class ShardedDiscoverRunner(DiscoverRunner):
+    """
+    A test runner which copies the test database of the first shard of each
+    shard group to the other shards rather than migrating each of them.
+    """
+    def setup_databases(self, **kwargs):
+        return setup_sharded_test_databases(
+            self.verbosity,
+            self.interactive,
+            keepdb=self.keepdb,
+            debug_sql=self.debug_sql,
+            parallel=self.parallel,
+            **kwargs
+        )
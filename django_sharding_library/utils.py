@@ -1,6 +1,11 @@
+import re
+
 from django.db import connections, DatabaseError, transaction
 from django.conf import settings
-from django_sharding_library.sql import postgres_shard_id_function_sql
+from django_sharding_library.constants import Backends
+from django_sharding_library.id_layout import get_id_layout_for_database
+from django_sharding_library.sql import postgres_create_sequence_sql, postgres_shard_id_function_sql
+from django.db.migrations.recorder import MigrationRecorder
 from django.db.models import signals
 
 from django_sharding_library.exceptions import DjangoShardingException
@@ -9,16 +14,8 @@ from django_sharding_library.exceptions import DjangoShardingException
 def create_postgres_global_sequence(sequence_name, db_alias, reset_sequence=False):
     cursor = connections[db_alias].cursor()
     sid = transaction.savepoint(db_alias)
-    create_sequence_if_not_exists_sql = """DO
-$$
-BEGIN
-        CREATE SEQUENCE %s;
-EXCEPTION WHEN duplicate_table THEN
-        -- do nothing, it's already there
-END
-$$ LANGUAGE plpgsql;"""
     try:
-        cursor.execute(create_sequence_if_not_exists_sql % sequence_name)
+        cursor.execute(postgres_create_sequence_sql % sequence_name)
     except DatabaseError:
         transaction.savepoint_rollback(sid, using=db_alias)
     else:
@@ -28,12 +25,124 @@ $$ LANGUAGE plpgsql;"""
     cursor.close()
 
 
+def get_postgres_shard_id_function_parameters(sequence_name, db_alias, shard_id):
+    layout = get_id_layout_for_database(db_alias)
+    if shard_id > layout.max_shard_id:
+        raise DjangoShardingException('The shard id {} of {} does not fit in the {} shard bits of the ID layout.'.format(
+            shard_id, db_alias, layout.shard_bits
+        ))
+    return {
+        'shard_epoch': settings.SHARD_EPOCH,
+        'shard_id': shard_id,
+        'sequence_name': sequence_name,
+        'sequence_modulus': layout.sequence_modulus,
+        'shard_shift': layout.shard_shift,
+        'time_shift': layout.time_shift,
+    }
+
+
 def create_postgres_shard_id_function(sequence_name, db_alias, shard_id):
+    parameters = get_postgres_shard_id_function_parameters(sequence_name, db_alias, shard_id)
+    cursor = connections[db_alias].cursor()
+    cursor.execute(postgres_shard_id_function_sql % parameters)
+    cursor.close()
+
+
+def setup_postgres_shard_id(sequence_name, db_alias, shard_id, reset_sequence=False, function_name='next_sharded_id'):
+    """
+    Creates the sequence if it's missing, replaces the function generating the
+    IDs and checks they both exist, all in a single round trip to the database.
+    Returns whether they exist.
+    """
+    parameters = get_postgres_shard_id_function_parameters(sequence_name, db_alias, shard_id)
+    statements = [postgres_create_sequence_sql % sequence_name]
+    if reset_sequence:
+        statements.append("SELECT setval('%s', 1, false);" % (sequence_name,))
+    statements.append(postgres_shard_id_function_sql % parameters)
+    statements.append(
+        "SELECT EXISTS (SELECT 1 FROM pg_class c WHERE c.relkind = 'S' AND c.relname = '%s') "
+        "AND EXISTS (SELECT 1 FROM pg_proc p WHERE p.proname = '%s');" % (sequence_name, function_name)
+    )
+    with connections[db_alias].cursor() as cursor:
+        cursor.execute('\n'.join(statements))
+        return bool(cursor.fetchone()[0])
+
+
+_shard_id_function_patterns = [
+    ('shard_epoch', re.compile(r'start_epoch bigint := (-?\d+);')),
+    # The functions created before the ID layout was configurable declare an int.
+    ('shard_id', re.compile(r'shard_id (?:int|bigint) := (-?\d+);')),
+    ('sequence_name', re.compile(r"nextval\('([^']+)'\)")),
+    ('sequence_modulus', re.compile(r"nextval\('[^']+'\) % (\d+)")),
+    ('time_shift', re.compile(r'\(now_millis - start_epoch\) << (\d+);')),
+    ('shard_shift', re.compile(r'\(shard_id << (\d+)\)')),
+]
+
+
+def check_postgres_shard_id_function(sequence_name, db_alias, shard_id, function_name='next_sharded_id'):
+    """
+    Reads the body of the function generating the IDs, in a single query, and
+    returns how the epoch, shard id, sequence and ID layout it was created with
+    differ from the settings. Returns an empty list when they all match.
+    """
+    expected = get_postgres_shard_id_function_parameters(sequence_name, db_alias, shard_id)
+    with connections[db_alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT (SELECT p.prosrc FROM pg_proc p WHERE p.proname = '%s' LIMIT 1), "
+            "EXISTS (SELECT 1 FROM pg_class c WHERE c.relkind = 'S' AND c.relname = '%s');" % (function_name, sequence_name)
+        )
+        source, has_sequence = cursor.fetchone()
+
+    problems = []
+    if not has_sequence:
+        problems.append('The sequence {} does not exist.'.format(sequence_name))
+    if source is None:
+        problems.append('The function {} does not exist.'.format(function_name))
+        return problems
+    for name, pattern in _shard_id_function_patterns:
+        match = pattern.search(source)
+        found = match.group(1) if match else None
+        if found is not None and name != 'sequence_name':
+            found = int(found)
+        if found != expected[name]:
+            problems.append('The {} of the function is {} rather than {}.'.format(name, found, expected[name]))
+    return problems
+
+
+def configure_postgres_stepped_sequence(table_name, db_alias, increment, offset):
+    """
+    Steps the sequence behind the `id` column of the table so that it only hands
+    out values equal to the offset modulo the increment. It is a no-op when the
+    sequence is already stepped that way.
+    """
+    with transaction.atomic(db_alias):
+        cursor = connections[db_alias].cursor()
+        # Serialize the configuration across the processes starting up at the same time.
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", [table_name])
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id');", [table_name])
+        sequence_name = cursor.fetchone()[0]
+        cursor.execute("SELECT seqincrement FROM pg_sequence WHERE seqrelid = %s::regclass;", [sequence_name])
+        current_increment = cursor.fetchone()[0]
+        cursor.execute("SELECT last_value, is_called FROM %s;" % (sequence_name,))
+        last_value, is_called = cursor.fetchone()
+        if current_increment == increment and last_value % increment == offset % increment:
+            cursor.close()
+            return
+
+        # Start above anything handed out so far, at the first value belonging to this server.
+        next_value = last_value + 1 if is_called else last_value
+        next_value += (offset - next_value) % increment
+        cursor.execute("ALTER SEQUENCE %s INCREMENT BY %d;" % (sequence_name, increment))
+        cursor.execute("SELECT setval(%s, %s, false);", [sequence_name, next_value])
+        cursor.close()
+
+
+def get_postgres_sequence_value(sequence_name, db_alias):
     cursor = connections[db_alias].cursor()
-    cursor.execute(postgres_shard_id_function_sql % {'shard_epoch': settings.SHARD_EPOCH,
-                                                     'shard_id': shard_id,
-                                                     'sequence_name': sequence_name})
+    cursor.execute("SELECT last_value FROM %s;" % (sequence_name,))
+    value = cursor.fetchone()[0]
     cursor.close()
+    return value
 
 
 def verify_postres_id_field_setup_correctly(sequence_name, db_alias, function_name):
@@ -63,6 +172,10 @@ def register_migration_signal_for_model_receiver(model, function, dispatch_uid=N
 
 
 def is_model_class_on_database(model, database):
+    ticket_databases = getattr(model, 'django_sharding__ticket_databases', None)
+    if ticket_databases:
+        return database in ticket_databases
+
     specific_database = getattr(model, 'django_sharding__database', None)
     is_sharded = getattr(model, 'django_sharding__is_sharded', False)
 
@@ -99,11 +212,91 @@ def get_database_for_model_instance(instance):
     elif len(possible_databases) == 0:
         pass
     else:
+        # Some sharded ID fields encode the shard in the value, which saves a lookup.
+        pk_field = instance._meta.pk
+        if instance.pk is not None and callable(getattr(pk_field, 'get_shard_from_id', None)):
+            shard = pk_field.get_shard_from_id(instance.pk)
+            if shard:
+                return shard
         return instance.get_shard()
 
     raise DjangoShardingException("Unable to deduce datbase for model instance")
 
 
+def get_shards_for_group(shard_group):
+    """
+    Returns the primary databases of the shard group.
+    """
+    return sorted(
+        alias for alias, db_settings in settings.DATABASES.items()
+        if db_settings.get('SHARD_GROUP') == shard_group and not db_settings.get('PRIMARY')
+    )
+
+
+def get_shard_for_shard_id(shard_group, shard_id):
+    """
+    Returns the primary database in the shard group with the given numeric shard id, or None.
+    """
+    for alias, db_settings in settings.DATABASES.items():
+        if db_settings.get('SHARD_GROUP') == shard_group and db_settings.get('SHARD_ID') == shard_id and not db_settings.get('PRIMARY'):
+            return alias
+    return None
+
+
+def get_applied_migrations(database):
+    """
+    Returns the `(app_label, name)` of the migrations recorded as applied on
+    the database with a single query.
+    """
+    connection = connections[database]
+    table = MigrationRecorder.Migration._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT app, name FROM {}'.format(connection.ops.quote_name(table)))
+            return set(tuple(row) for row in cursor.fetchall())
+    except DatabaseError:
+        # A database which was never migrated has no table to read.
+        if table not in connection.introspection.table_names():
+            return set()
+        raise
+
+
+def get_replicas_for_database(database):
+    """
+    Returns the replicas of a primary database.
+    """
+    return sorted(alias for alias, db_settings in settings.DATABASES.items() if db_settings.get('PRIMARY') == database)
+
+
+def get_replica_lag(replica):
+    """
+    Returns how many seconds the replica is behind its primary, or None when
+    the backend doesn't report it or the database isn't replicating.
+    """
+    engine = connections[replica].settings_dict['ENGINE']
+    cursor = connections[replica].cursor()
+    try:
+        if engine in Backends.POSTGRES:
+            # A replica which has replayed everything it received isn't behind,
+            # however long ago its last transaction was.
+            cursor.execute(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END;"
+            )
+            lag = cursor.fetchone()[0]
+        elif engine in Backends.MYSQL:
+            cursor.execute("SHOW SLAVE STATUS;")
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            lag = dict(zip([column[0] for column in cursor.description], row)).get('Seconds_Behind_Master')
+        else:
+            return None
+    finally:
+        cursor.close()
+    return None if lag is None else float(lag)
+
+
 def get_next_sharded_id(shard):
     cursor = connections[shard].cursor()
     cursor.execute("SELECT next_sharded_id();")
@@ -1,14 +1,17 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
-from django_sharding_library.decorators import model_config, shard_storage_config
+from django_sharding_library.decorators import model_config, shard_storage_config, ticket_server_config
 from django_sharding_library.fields import (
     TableShardedIDField,
     ShardForeignKeyStorageField,
     PostgresShardGeneratedIDAutoField,
-    PostgresShardGeneratedIDField
+    PostgresShardGeneratedIDField,
+    PostgresShardForeignKey,
+    PostgresShardOneToOne,
+    ShardedUUID7Field,
 )
-from django_sharding_library.models import ShardedByMixin, ShardStorageModel, TableStrategyModel
+from django_sharding_library.models import ShardedByMixin, ShardedManager, ShardStorageModel, TableStrategyModel
 from django_sharding_library.constants import Backends
 
 
@@ -19,6 +22,13 @@ class ShardedModelIDs(TableStrategyModel):
     pass
 
 
+# A model for use with a sharded model to generate pk's using
+# interleaved autoincrement fields on several ticket servers.
+@ticket_server_config(databases=['app_shard_001', 'app_shard_002'])
+class TicketServerModelIDs(TableStrategyModel):
+    pass
+
+
 # An implementation of the extension of a the Django user to add
 # the mixin provided in order to save the shard on the user.
 @shard_storage_config()
@@ -52,12 +62,14 @@ class ShardedTestModelIDs(TableStrategyModel):
 # generate uuid's for its instances.
 
 
-@model_config(shard_group='default')
+@model_config(shard_group='default', shard_key_field='user_pk')
 class TestModel(models.Model):
     id = TableShardedIDField(primary_key=True, source_table_name='tests.ShardedTestModelIDs')
     random_string = models.CharField(max_length=120)
     user_pk = models.PositiveIntegerField()
 
+    objects = ShardedManager()
+
     def get_shard(self):
         from django.contrib.auth import get_user_model
         return get_user_model().objects.get(pk=self.user_pk).shard
@@ -68,6 +80,56 @@ class TestModel(models.Model):
         user = get_user_model()
         return user.objects.get(pk=user_pk).shard
 
+    @staticmethod
+    def get_shards_from_shard_keys(user_pks):
+        from django.contrib.auth import get_user_model
+        return dict(get_user_model().objects.filter(pk__in=user_pks).values_list('pk', 'shard'))
+
+
+# Sharded models without a shard key field, which are linked to the shard key
+# through their foreign keys. The replicas share the database of their primary
+# in the tests, so checking the constraints from them would find the tables locked.
+
+
+@model_config(shard_group='default')
+class TestModelComment(models.Model):
+    id = TableShardedIDField(primary_key=True, source_table_name='tests.ShardedTestModelIDs')
+    test_model = PostgresShardForeignKey(TestModel, on_delete=models.CASCADE, db_constraint=False)
+    text = models.CharField(max_length=120)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedManager()
+
+    def get_shard(self):
+        return self.test_model.get_shard()
+
+
+@model_config(shard_group='default')
+class TestModelCommentEdit(models.Model):
+    id = TableShardedIDField(primary_key=True, source_table_name='tests.ShardedTestModelIDs')
+    comment = PostgresShardOneToOne(TestModelComment, on_delete=models.CASCADE, db_constraint=False)
+    text = models.CharField(max_length=120)
+
+    def get_shard(self):
+        return self.comment.get_shard()
+
+
+# An example of a sharded model which uses the `TimeOrderedUUIDStrategy` to
+# generate compact, time-ordered uuid's for its instances.
+
+
+@model_config(shard_group='default')
+class ShardedUUID7TestModel(models.Model):
+    id = ShardedUUID7Field(primary_key=True)
+    random_string = models.CharField(max_length=120)
+    user_pk = models.PositiveIntegerField()
+
+    objects = ShardedManager()
+
+    def get_shard(self):
+        from django.contrib.auth import get_user_model
+        return get_user_model().objects.get(pk=self.user_pk).shard
+
 
 @model_config(database='default')
 class UnshardedTestModel(models.Model):
@@ -1,11 +1,42 @@
+import threading
+
+from django.conf import settings
 from django.core.management import call_command
-from django.test import TestCase
-from mock import call, patch
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from mock import MagicMock, call, patch
+from six import StringIO
+
+from django_sharding_library.sql import postgres_shard_id_function_sql
+from django_sharding_library.utils import check_postgres_shard_id_function, setup_postgres_shard_id
+
+
+def get_shard_databases():
+    return [database for database, db_settings in settings.DATABASES.items() if not db_settings.get('PRIMARY') and db_settings.get('SHARD_ID') is not None]
+
+
+# The body of the function created by the earlier versions, which declared the shard id as an int.
+legacy_function_source = """
+DECLARE
+    start_epoch bigint := %(shard_epoch)d;
+    seq_id bigint;
+    now_millis bigint;
+    shard_id int := 7;
+BEGIN
+    -- there is a typo here in the online example, which is corrected here
+    SELECT nextval('global_id_sequence') %% 1024 INTO seq_id;
+
+    SELECT FLOOR(EXTRACT(EPOCH FROM clock_timestamp()) * 1000) INTO now_millis;
+    result := (now_millis - start_epoch) << 23;
+    result := result | (shard_id << 10);
+    result := result | (seq_id);
+END;
+"""
 
 
-mock_create_sequence_path = 'django_sharding_library.management.commands.create_postgres_sequences.create_postgres_global_sequence'
-mock_create_func_path = 'django_sharding_library.management.commands.create_postgres_sequences.create_postgres_shard_id_function'
+mock_setup_path = 'django_sharding_library.management.commands.create_postgres_sequences.setup_postgres_shard_id'
 mock_verify_path = 'django_sharding_library.management.commands.create_postgres_sequences.verify_postres_id_field_setup_correctly'
+mock_check_path = 'django_sharding_library.management.commands.create_postgres_sequences.check_postgres_shard_id_function'
 
 
 class MigrationCommandTestCase(TestCase):
@@ -13,126 +44,160 @@ class MigrationCommandTestCase(TestCase):
 
     def test_defauls_migrates_all_primary_dbs_with_shard_id(self):
         with patch(mock_verify_path, return_value=True) as mock_verify:
-            with patch(mock_create_func_path) as mock_create_func:
-                with patch(mock_create_sequence_path) as mock_create_sequence:
-                    call_command('create_postgres_sequences')
+            with patch(mock_setup_path, return_value=True) as mock_setup:
+                call_command('create_postgres_sequences')
 
-        mock_verify.assert_has_calls(
+        mock_setup.assert_has_calls(
             [
-                call(db_alias='app_shard_001', function_name='next_sharded_id', sequence_name='global_id_sequence'),
-                call(db_alias='app_shard_002', function_name='next_sharded_id', sequence_name='global_id_sequence')
-            ]
+                call(db_alias='app_shard_001', reset_sequence=False, sequence_name='global_id_sequence', shard_id=0),
+                call(db_alias='app_shard_002', reset_sequence=False, sequence_name='global_id_sequence', shard_id=1)
+            ],
+            any_order=True
         )
+        self.assertEqual(mock_setup.call_count, len(get_shard_databases()))
+        mock_verify.assert_not_called()
 
-        mock_create_func.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', sequence_name='global_id_sequence', shard_id=0),
-                call(db_alias='app_shard_002', sequence_name='global_id_sequence', shard_id=1)
-            ]
-        )
+    def test_reset_sequences(self):
+        with patch(mock_setup_path, return_value=True) as mock_setup:
+            call_command('create_postgres_sequences', '--reset-sequence')
 
-        mock_create_sequence.assert_has_calls(
+        mock_setup.assert_has_calls(
             [
-                call(db_alias='app_shard_001', reset_sequence=False, sequence_name='global_id_sequence'),
-                call(db_alias='app_shard_002', reset_sequence=False, sequence_name='global_id_sequence')
-            ]
+                call(db_alias='app_shard_001', reset_sequence=True, sequence_name='global_id_sequence', shard_id=0),
+                call(db_alias='app_shard_002', reset_sequence=True, sequence_name='global_id_sequence', shard_id=1)
+            ],
+            any_order=True
         )
 
-    def test_reset_sequences(self):
-        with patch(mock_verify_path, return_value=True) as mock_verify:
-            with patch(mock_create_func_path) as mock_create_func:
-                with patch(mock_create_sequence_path) as mock_create_sequence:
-                    call_command('create_postgres_sequences', '--reset-sequence')
+    def test_specify_database(self):
+        with patch(mock_setup_path, return_value=True) as mock_setup:
+            call_command('create_postgres_sequences', '--database=app_shard_001')
 
-        mock_verify.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', function_name='next_sharded_id', sequence_name='global_id_sequence'),
-                call(db_alias='app_shard_002', function_name='next_sharded_id', sequence_name='global_id_sequence')
-            ]
-        )
+        mock_setup.assert_called_once_with(db_alias='app_shard_001', reset_sequence=False, sequence_name='global_id_sequence', shard_id=0)
 
-        mock_create_func.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', sequence_name='global_id_sequence', shard_id=0),
-                call(db_alias='app_shard_002', sequence_name='global_id_sequence', shard_id=1)
-            ]
-        )
+    def test_specify_sequence_name(self):
+        with patch(mock_setup_path, return_value=True) as mock_setup:
+            call_command('create_postgres_sequences', '--sequence-name=test_sequence_name')
 
-        mock_create_sequence.assert_has_calls(
+        mock_setup.assert_has_calls(
             [
-                call(db_alias='app_shard_001', reset_sequence=True, sequence_name='global_id_sequence'),
-                call(db_alias='app_shard_002', reset_sequence=True, sequence_name='global_id_sequence')
-            ]
+                call(db_alias='app_shard_001', reset_sequence=False, sequence_name='test_sequence_name', shard_id=0),
+                call(db_alias='app_shard_002', reset_sequence=False, sequence_name='test_sequence_name', shard_id=1)
+            ],
+            any_order=True
         )
 
-    def test_specify_database(self):
+    def test_dry_run(self):
         with patch(mock_verify_path, return_value=True) as mock_verify:
-            with patch(mock_create_func_path) as mock_create_func:
-                with patch(mock_create_sequence_path) as mock_create_sequence:
-                    call_command('create_postgres_sequences', '--database=app_shard_001')
+            with patch(mock_setup_path) as mock_setup:
+                call_command('create_postgres_sequences', '--dry-run')
 
         mock_verify.assert_has_calls(
             [
                 call(db_alias='app_shard_001', function_name='next_sharded_id', sequence_name='global_id_sequence'),
-            ]
+                call(db_alias='app_shard_002', function_name='next_sharded_id', sequence_name='global_id_sequence')
+            ],
+            any_order=True
         )
+        mock_setup.assert_not_called()
 
-        mock_create_func.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', sequence_name='global_id_sequence', shard_id=0),
-            ]
-        )
+    def test_check_only(self):
+        problems = {'app_shard_002': ['The shard_id of the function is 4 rather than 1.']}
+        stdout = StringIO()
+        with patch(mock_check_path, side_effect=lambda sequence_name, db_alias, shard_id: problems.get(db_alias, [])) as mock_check:
+            with patch(mock_setup_path) as mock_setup:
+                with self.assertRaises(CommandError):
+                    call_command('create_postgres_sequences', '--check-only', stdout=stdout)
 
-        mock_create_sequence.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', reset_sequence=False, sequence_name='global_id_sequence'),
-            ]
-        )
+        self.assertEqual(mock_check.call_count, len(get_shard_databases()))
+        mock_setup.assert_not_called()
+        output = stdout.getvalue()
+        self.assertIn('Database app_shard_001 with shard id 0:sequence global_id_sequence is present', output)
+        self.assertIn('Database app_shard_002: Error occured: The shard_id of the function is 4 rather than 1.', output)
+        # The output is in the order of the databases.
+        self.assertLess(output.index('app_shard_001'), output.index('app_shard_002'))
 
-    def test_specify_sequence_name(self):
-        with patch(mock_verify_path, return_value=True) as mock_verify:
-            with patch(mock_create_func_path) as mock_create_func:
-                with patch(mock_create_sequence_path) as mock_create_sequence:
-                    call_command('create_postgres_sequences', '--sequence-name=test_sequence_name')
-
-        mock_verify.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', function_name='next_sharded_id', sequence_name='test_sequence_name'),
-                call(db_alias='app_shard_002', function_name='next_sharded_id', sequence_name='test_sequence_name')
-            ]
-        )
-
-        mock_create_func.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', sequence_name='test_sequence_name', shard_id=0),
-                call(db_alias='app_shard_002', sequence_name='test_sequence_name', shard_id=1)
-            ]
-        )
+    def test_sets_up_the_databases_in_parallel(self):
+        both_started = threading.Barrier(2, timeout=5)
 
-        mock_create_sequence.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', reset_sequence=False, sequence_name='test_sequence_name'),
-                call(db_alias='app_shard_002', reset_sequence=False, sequence_name='test_sequence_name')
-            ]
-        )
+        def setup(**kwargs):
+            both_started.wait()
+            return True
 
-    def test_dry_run(self):
-        with patch(mock_verify_path, return_value=True) as mock_verify:
-            with patch(mock_create_func_path) as mock_create_func:
-                with patch(mock_create_sequence_path) as mock_create_sequence:
-                    call_command('create_postgres_sequences', '--dry-run')
+        with patch(mock_setup_path, side_effect=setup) as mock_setup:
+            call_command('create_postgres_sequences', '--parallel=2')
+        self.assertEqual(mock_setup.call_count, len(get_shard_databases()))
 
-        mock_verify.assert_has_calls(
-            [
-                call(db_alias='app_shard_001', function_name='next_sharded_id', sequence_name='global_id_sequence'),
-                call(db_alias='app_shard_002', function_name='next_sharded_id', sequence_name='global_id_sequence')
-            ]
-        )
 
-        mock_create_func.assert_has_calls(
-            []
-        )
+class PostgresShardIDSetupTestCase(TestCase):
+    databases = '__all__'
 
-        mock_create_sequence.assert_has_calls(
-            []
-        )
+    def setUp(self):
+        self.cursor = MagicMock()
+        connection = MagicMock()
+        connection.cursor.return_value.__enter__.return_value = self.cursor
+        patcher = patch('django_sharding_library.utils.connections', {'app_shard_001': connection})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_setup_is_a_single_round_trip(self):
+        self.cursor.fetchone.return_value = (True,)
+        self.assertTrue(setup_postgres_shard_id('global_id_sequence', 'app_shard_001', 7, reset_sequence=True))
+
+        self.cursor.execute.assert_called_once()
+        sql = self.cursor.execute.call_args[0][0]
+        self.assertIn('CREATE SEQUENCE global_id_sequence;', sql)
+        self.assertIn("SELECT setval('global_id_sequence', 1, false);", sql)
+        self.assertIn('shard_id bigint := 7;', sql)
+        self.assertIn("c.relname = 'global_id_sequence'", sql)
+
+        self.cursor.fetchone.return_value = (False,)
+        self.assertFalse(setup_postgres_shard_id('global_id_sequence', 'app_shard_001', 7))
+        self.assertNotIn('setval', self.cursor.execute.call_args[0][0])
+
+    def get_function_source(self, **overrides):
+        parameters = {
+            'shard_epoch': settings.SHARD_EPOCH,
+            'shard_id': 7,
+            'sequence_name': 'global_id_sequence',
+            'sequence_modulus': 1024,
+            'shard_shift': 10,
+            'time_shift': 23,
+        }
+        parameters.update(overrides)
+        sql = postgres_shard_id_function_sql % parameters
+        return sql[sql.index('$$') + 2:sql.rindex('$$')]
+
+    def test_check_matches_the_function_to_the_settings(self):
+        self.cursor.fetchone.return_value = (self.get_function_source(), True)
+        self.assertEqual(check_postgres_shard_id_function('global_id_sequence', 'app_shard_001', 7), [])
+        self.cursor.execute.assert_called_once()
+
+    def test_check_reads_the_functions_of_the_earlier_versions(self):
+        self.cursor.fetchone.return_value = (legacy_function_source % {'shard_epoch': settings.SHARD_EPOCH}, True)
+        self.assertEqual(check_postgres_shard_id_function('global_id_sequence', 'app_shard_001', 7), [])
+        self.assertEqual(check_postgres_shard_id_function('global_id_sequence', 'app_shard_001', 3), [
+            'The shard_id of the function is 7 rather than 3.',
+        ])
+
+    def test_check_reports_the_differences(self):
+        self.cursor.fetchone.return_value = (self.get_function_source(shard_id=3, shard_epoch=5), True)
+        self.assertEqual(check_postgres_shard_id_function('global_id_sequence', 'app_shard_001', 7), [
+            'The shard_epoch of the function is 5 rather than {}.'.format(settings.SHARD_EPOCH),
+            'The shard_id of the function is 3 rather than 7.',
+        ])
+
+        with override_settings(DJANGO_SHARDING_SETTINGS={'default': {'ID_LAYOUT': {'SHARD_BITS': 12, 'SEQUENCE_BITS': 11}}}):
+            self.assertEqual(check_postgres_shard_id_function('global_id_sequence', 'app_shard_001', 7), [
+                'The shard_epoch of the function is 5 rather than {}.'.format(settings.SHARD_EPOCH),
+                'The shard_id of the function is 3 rather than 7.',
+                'The sequence_modulus of the function is 1024 rather than 2048.',
+                'The shard_shift of the function is 10 rather than 11.',
+            ])
+
+    def test_check_reports_missing_objects(self):
+        self.cursor.fetchone.return_value = (None, False)
+        self.assertEqual(check_postgres_shard_id_function('global_id_sequence', 'app_shard_001', 7), [
+            'The sequence global_id_sequence does not exist.',
+            'The function next_sharded_id does not exist.',
+        ])
@@ -0,0 +1,477 @@
+import threading
+import time
+
+from django.apps import apps
+from django.db.models import Avg, Count, Max, Min, StdDev, Sum
+from django.db import IntegrityError, OperationalError
+from django.db.models.query import QuerySet
+from django.test import TransactionTestCase, override_settings
+from mock import MagicMock, patch
+
+from django_sharding_library.cross_shard import get_cross_shard_executor, get_cross_shard_semaphore, set_statement_timeout
+from django_sharding_library.exceptions import CrossShardTimeoutException, DjangoShardingException
+from tests.models import ShardedUUID7TestModel, TestModel, TestModelComment
+
+
+class CrossShardQuerySetTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Interleave the ids across the two shards so that a merge is needed to order them.
+        for pk in range(1, 11):
+            database = 'app_shard_001' if pk % 2 else 'app_shard_002'
+            TestModel.objects.using(database).create(id=pk, random_string='string {}'.format(pk % 3), user_pk=pk)
+
+    def test_returns_the_rows_of_every_shard(self):
+        rows = TestModel.objects.across_shards()
+        self.assertEqual(sorted(row.id for row in rows), list(range(1, 11)))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual({row._state.db for row in rows}, {'app_shard_001', 'app_shard_002'})
+
+    def test_filters_every_shard(self):
+        rows = TestModel.objects.across_shards().filter(user_pk__gt=3).exclude(user_pk=10)
+        self.assertEqual(sorted(row.id for row in rows), [4, 5, 6, 7, 8, 9])
+
+    def test_merges_the_rows_in_order(self):
+        rows = TestModel.objects.across_shards().order_by('-id')
+        self.assertEqual([row.id for row in rows], list(range(10, 0, -1)))
+
+    def test_merges_on_several_fields(self):
+        rows = TestModel.objects.across_shards().order_by('random_string', '-id')
+        self.assertEqual([row.id for row in rows], [9, 6, 3, 10, 7, 4, 1, 8, 5, 2])
+
+    def test_slice_is_global_top_n(self):
+        rows = TestModel.objects.across_shards().order_by('-id')[2:5]
+        self.assertEqual([row.id for row in rows], [8, 7, 6])
+
+    def test_slice_is_pushed_down_to_each_shard(self):
+        with patch.object(QuerySet, '__getitem__', autospec=True, side_effect=QuerySet.__getitem__) as mock_getitem:
+            rows = list(TestModel.objects.across_shards().order_by('id')[1:3])
+        self.assertEqual([row.id for row in rows], [2, 3])
+        mock_getitem.assert_called_once_with(mock_getitem.call_args[0][0], slice(None, 3))
+
+    def test_indexing(self):
+        self.assertEqual(TestModel.objects.across_shards().order_by('id')[3].id, 4)
+        with self.assertRaises(IndexError):
+            TestModel.objects.across_shards().order_by('id')[20]
+
+    def test_values_and_values_list(self):
+        rows = TestModel.objects.across_shards().order_by('-user_pk').values('id', 'user_pk')[:3]
+        self.assertEqual(list(rows), [{'id': 10, 'user_pk': 10}, {'id': 9, 'user_pk': 9}, {'id': 8, 'user_pk': 8}])
+
+        rows = TestModel.objects.across_shards().order_by('user_pk').values_list('user_pk', 'id')[:2]
+        self.assertEqual(list(rows), [(1, 1), (2, 2)])
+
+        rows = TestModel.objects.across_shards().order_by('-id').values_list('id', flat=True)[:3]
+        self.assertEqual(list(rows), [10, 9, 8])
+
+    def test_ordering_by_a_field_that_is_not_selected(self):
+        with self.assertRaises(DjangoShardingException):
+            list(TestModel.objects.across_shards().order_by('user_pk').values_list('id'))
+
+    def test_ordering_through_a_relation(self):
+        with self.assertRaises(DjangoShardingException):
+            list(TestModelComment.objects.across_shards().order_by('test_model__user_pk'))
+        with self.assertRaises(DjangoShardingException):
+            list(TestModelComment.objects.across_shards().order_by('-test_model__user_pk').values_list('id', flat=True))
+        # A selected value can be ordered by.
+        for item in TestModel.objects.using('app_shard_001').all()[:2]:
+            TestModelComment.objects.using('app_shard_001').create(test_model=item, text='a')
+        for item in TestModel.objects.using('app_shard_002').all()[:2]:
+            TestModelComment.objects.using('app_shard_002').create(test_model=item, text='b')
+        user_pks = list(TestModelComment.objects.across_shards().order_by('test_model__user_pk').values_list('test_model__user_pk', flat=True))
+        self.assertEqual(user_pks, sorted(user_pks))
+        self.assertEqual(len(user_pks), 4)
+
+    def test_ordering_randomly(self):
+        with self.assertRaises(DjangoShardingException):
+            list(TestModel.objects.across_shards().order_by('?'))
+
+    def test_cannot_filter_once_sliced(self):
+        with self.assertRaises(DjangoShardingException):
+            TestModel.objects.across_shards().order_by('id')[:3].filter(user_pk=1)
+
+    def test_reads_from_the_replicas(self):
+        routing_strategy = apps.get_app_config('django_sharding').get_routing_strategy('default')
+        with patch.object(routing_strategy, 'pick_read_db', side_effect=lambda db: db + '_replica_001' if db == 'app_shard_001' else db):
+            databases = TestModel.objects.across_shards(use_replicas=True).get_read_databases()
+        self.assertEqual(databases, ['app_shard_001_replica_001', 'app_shard_002'])
+
+    def test_shares_the_executor(self):
+        self.assertIs(get_cross_shard_executor('default'), get_cross_shard_executor('default'))
+        # Asking for fewer workers limits the calls made on the same pool.
+        limited = get_cross_shard_executor('default', max_workers=1)
+        self.assertIs(limited.executor, get_cross_shard_executor('default'))
+        self.assertIs(get_cross_shard_executor('default', max_workers=100), get_cross_shard_executor('default'))
+        self.assertEqual(limited.submit(lambda a, b: a + b, 1, b=2).result(), 3)
+
+    def test_limits_the_concurrent_calls(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+        executor = get_cross_shard_executor('default', max_workers=2)
+        for future in [executor.submit(call) for _ in range(8)]:
+            future.result()
+        self.assertEqual(max(peak), 2)
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'default': {'CROSS_SHARD_MAX_WORKERS': 2}})
+    def test_the_calls_over_the_limit_do_not_hold_a_thread_of_the_pool(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        limited = get_cross_shard_executor('default', max_workers=1)
+        futures = [limited.submit(release.wait) for _ in range(3)]
+
+        # The pool still has a thread for the other queries.
+        self.assertEqual(get_cross_shard_executor('default').submit(lambda: 1).result(timeout=5), 1)
+
+        # The calls waiting for their turn can be cancelled.
+        self.assertTrue(futures[2].cancel())
+        release.set()
+        self.assertTrue(futures[0].result(timeout=5))
+        self.assertTrue(futures[1].result(timeout=5))
+
+    def test_limited_calls_raise_their_errors(self):
+        def fail():
+            raise ValueError('Broken')
+
+        with self.assertRaises(ValueError):
+            get_cross_shard_executor('default', max_workers=1).submit(fail).result(timeout=5)
+
+    def test_shuts_the_executors_down_when_the_settings_change(self):
+        executor = get_cross_shard_executor('default')
+        with override_settings(DJANGO_SHARDING_SETTINGS={'default': {'CROSS_SHARD_MAX_WORKERS': 3}}):
+            resized = get_cross_shard_executor('default')
+            self.assertIsNot(resized, executor)
+            self.assertEqual(resized._max_workers, 3)
+        with self.assertRaises(RuntimeError):
+            executor.submit(lambda: None)
+
+
+class CrossShardAggregationTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Three rows on one shard and one on the other so that an average of averages would be wrong.
+        TestModel.objects.using('app_shard_001').create(id=1, random_string='a', user_pk=1)
+        TestModel.objects.using('app_shard_001').create(id=2, random_string='b', user_pk=2)
+        TestModel.objects.using('app_shard_001').create(id=3, random_string='a', user_pk=3)
+        TestModel.objects.using('app_shard_002').create(id=4, random_string='b', user_pk=10)
+
+    def test_count(self):
+        self.assertEqual(TestModel.objects.across_shards().count(), 4)
+        self.assertEqual(TestModel.objects.across_shards().filter(random_string='b').count(), 2)
+        self.assertEqual(TestModel.objects.across_shards()[1:3].count(), 2)
+        self.assertEqual(TestModel.objects.across_shards()[3:].count(), 1)
+
+    def test_aggregate(self):
+        result = TestModel.objects.across_shards().aggregate(
+            Sum('user_pk'), Min('user_pk'), Max('user_pk'), average=Avg('user_pk'), total=Count('id'),
+        )
+        self.assertEqual(result, {
+            'user_pk__sum': 16, 'user_pk__min': 1, 'user_pk__max': 10, 'average': 4.0, 'total': 4,
+        })
+
+    def test_aggregate_sends_one_row_per_shard(self):
+        with patch.object(QuerySet, 'aggregate', autospec=True, side_effect=QuerySet.aggregate) as mock_aggregate:
+            TestModel.objects.across_shards().aggregate(average=Avg('user_pk'))
+        self.assertEqual(mock_aggregate.call_count, 2)
+        self.assertEqual(
+            sorted(mock_aggregate.call_args[1]),
+            ['django_sharding_average_count', 'django_sharding_average_sum'],
+        )
+
+    def test_aggregate_with_no_rows(self):
+        result = TestModel.objects.across_shards().filter(user_pk=100).aggregate(
+            total=Sum('user_pk'), average=Avg('user_pk'), number=Count('id'), lowest=Min('user_pk'),
+        )
+        self.assertEqual(result, {'total': None, 'average': None, 'number': 0, 'lowest': None})
+
+    def test_aggregates_that_cannot_be_combined(self):
+        with self.assertRaises(DjangoShardingException):
+            TestModel.objects.across_shards().aggregate(Count('user_pk', distinct=True))
+        with self.assertRaises(DjangoShardingException):
+            TestModel.objects.across_shards().aggregate(StdDev('user_pk'))
+        with self.assertRaises(DjangoShardingException):
+            TestModel.objects.across_shards()[:2].aggregate(Sum('user_pk'))
+
+    def test_group_by(self):
+        rows = TestModel.objects.across_shards().values('random_string').annotate(
+            total=Sum('user_pk'), average=Avg('user_pk'), number=Count('id'),
+        ).order_by('random_string')
+        self.assertEqual(list(rows), [
+            {'random_string': 'a', 'total': 4, 'average': 2.0, 'number': 2},
+            {'random_string': 'b', 'total': 12, 'average': 6.0, 'number': 2},
+        ])
+        self.assertEqual(rows.count(), 2)
+
+    def test_group_by_ordered_by_an_aggregate(self):
+        rows = TestModel.objects.across_shards().values('random_string').annotate(total=Sum('user_pk')).order_by('-total')[:1]
+        self.assertEqual(list(rows), [{'random_string': 'b', 'total': 12}])
+
+
+class CrossShardIteratorTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        for pk in range(1, 11):
+            database = 'app_shard_001' if pk % 2 else 'app_shard_002'
+            TestModel.objects.using(database).create(id=pk, random_string='string {}'.format(pk % 3), user_pk=pk)
+
+    def test_streams_the_rows_in_order(self):
+        rows = TestModel.objects.across_shards().order_by('-id').iterator(chunk_size=2)
+        self.assertEqual([row.id for row in rows], list(range(10, 0, -1)))
+
+    def test_fetches_the_rows_in_chunks(self):
+        with patch.object(QuerySet, '__getitem__', autospec=True, side_effect=QuerySet.__getitem__) as mock_getitem:
+            rows = TestModel.objects.across_shards().order_by('id').iterator(chunk_size=2)
+            self.assertEqual(next(rows).id, 1)
+            # Only the first chunk of each shard has been fetched.
+            self.assertEqual(mock_getitem.call_count, 2)
+            self.assertEqual([row.id for row in rows], list(range(2, 11)))
+        self.assertTrue(all(call[0][1] == slice(None, 2) for call in mock_getitem.call_args_list))
+
+    def test_uses_server_side_cursors(self):
+        cross_shard_queryset = TestModel.objects.across_shards().order_by('id')
+        with patch.object(cross_shard_queryset, '_server_side_cursors', side_effect=lambda database: database == 'app_shard_001'):
+            with patch.object(QuerySet, 'iterator', autospec=True, side_effect=QuerySet.iterator) as mock_iterator:
+                rows = list(cross_shard_queryset.iterator(chunk_size=2))
+        self.assertEqual([row.id for row in rows], list(range(1, 11)))
+        mock_iterator.assert_called_once_with(mock_iterator.call_args[0][0], chunk_size=2)
+        self.assertEqual(mock_iterator.call_args[0][0].db, 'app_shard_001')
+
+    def test_adds_the_primary_key_to_a_non_unique_ordering(self):
+        rows = TestModel.objects.across_shards().order_by('random_string').iterator(chunk_size=1)
+        self.assertEqual([row.id for row in rows], [3, 6, 9, 1, 4, 7, 10, 2, 5, 8])
+
+    def test_unordered(self):
+        rows = TestModel.objects.across_shards().filter(user_pk__gt=2).iterator(chunk_size=3)
+        self.assertEqual(sorted(row.id for row in rows), list(range(3, 11)))
+
+    def test_values_and_slices(self):
+        rows = TestModel.objects.across_shards().order_by('-random_string', 'id').values('id', 'random_string')[1:4].iterator(chunk_size=2)
+        self.assertEqual([row['id'] for row in rows], [5, 8, 1])
+
+    def test_null_ordering(self):
+        ordering = TestModel.objects.across_shards().get_ordering(TestModel.objects.order_by('random_string', 'id'))
+        row = TestModel(id=5, random_string=None)
+        self.assertEqual(
+            TestModel.objects.using('app_shard_001').filter(ordering.get_keyset_filter(row)).count(),
+            TestModel.objects.using('app_shard_001').filter(random_string__isnull=False).count(),
+        )
+
+
+class CrossShardInBulkTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def test_groups_the_ids_decoded_from_the_primary_key(self):
+        strategy = ShardedUUID7TestModel._meta.pk.strategy
+        instances = [
+            ShardedUUID7TestModel.objects.using(database).create(id=strategy.get_next_id(database), random_string='string', user_pk=1)
+            for database in ['app_shard_001', 'app_shard_002', 'app_shard_001', 'app_shard_002']
+        ]
+        ids = [instance.pk for instance in instances]
+        missing_id = strategy.get_next_id('app_shard_001')
+
+        grouped = ShardedUUID7TestModel.objects.across_shards().get_shards_for_ids(ids)
+        self.assertEqual(grouped, {'app_shard_001': [ids[0], ids[2]], 'app_shard_002': [ids[1], ids[3]]})
+
+        with patch.object(QuerySet, 'filter', autospec=True, side_effect=QuerySet.filter) as mock_filter:
+            objects = ShardedUUID7TestModel.objects.in_bulk_across_shards(ids + [missing_id])
+        self.assertEqual(mock_filter.call_count, 2)
+        self.assertEqual(objects, {instance.pk: instance for instance in instances})
+        self.assertEqual(objects[ids[1]]._state.db, 'app_shard_002')
+
+    def test_uses_the_batch_resolver_of_the_model(self):
+        TestModel.objects.using('app_shard_001').create(id=1, random_string='one', user_pk=1)
+        TestModel.objects.using('app_shard_002').create(id=2, random_string='two', user_pk=2)
+        with patch.object(TestModel, 'get_shards_from_ids', create=True, return_value={1: 'app_shard_001', 2: 'app_shard_002'}):
+            grouped = TestModel.objects.across_shards().get_shards_for_ids([1, 2])
+            objects = TestModel.objects.in_bulk_across_shards([1, 2])
+        self.assertEqual(grouped, {'app_shard_001': [1], 'app_shard_002': [2]})
+        self.assertEqual({pk: obj.random_string for pk, obj in objects.items()}, {1: 'one', 2: 'two'})
+
+    def test_looks_for_unknown_ids_on_every_shard(self):
+        TestModel.objects.using('app_shard_001').create(id=1, random_string='one', user_pk=1)
+        TestModel.objects.using('app_shard_002').create(id=2, random_string='two', user_pk=2)
+        self.assertEqual(TestModel.objects.across_shards().get_shards_for_ids([1, 2]), {None: [1, 2]})
+        objects = TestModel.objects.in_bulk_across_shards([1, 2, 3])
+        self.assertEqual({pk: obj._state.db for pk, obj in objects.items()}, {1: 'app_shard_001', 2: 'app_shard_002'})
+
+    def test_empty_list(self):
+        self.assertEqual(TestModel.objects.in_bulk_across_shards([]), {})
+
+
+class CrossShardWriteTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        for pk in range(1, 7):
+            database = 'app_shard_001' if pk % 2 else 'app_shard_002'
+            TestModel.objects.using(database).create(id=pk, random_string='string', user_pk=pk)
+
+    def test_bulk_update(self):
+        objs = list(TestModel.objects.across_shards().order_by('id'))
+        for obj in objs:
+            obj.random_string = 'updated {}'.format(obj.pk)
+
+        with patch.object(QuerySet, 'bulk_update', autospec=True, side_effect=QuerySet.bulk_update) as mock_bulk_update:
+            TestModel.objects.bulk_update_across_shards(objs[:4], ['random_string'])
+        self.assertEqual(sorted(call[0][0].db for call in mock_bulk_update.call_args_list), ['app_shard_001', 'app_shard_002'])
+
+        self.assertEqual(
+            [obj.random_string for obj in TestModel.objects.across_shards().order_by('id')],
+            ['updated 1', 'updated 2', 'updated 3', 'updated 4', 'string', 'string'],
+        )
+
+    def test_bulk_update_uses_get_shard_for_objects_not_from_a_database(self):
+        obj = TestModel(id=2, random_string='updated', user_pk=2)
+        with patch.object(TestModel, 'get_shard', return_value='app_shard_002') as mock_get_shard:
+            TestModel.objects.bulk_update_across_shards([obj], ['random_string'])
+        mock_get_shard.assert_called_once_with()
+        self.assertEqual(TestModel.objects.using('app_shard_002').get(id=2).random_string, 'updated')
+
+    def test_bulk_update_maps_replicas_to_their_primary(self):
+        obj = TestModel(id=1, random_string='updated', user_pk=1)
+        obj._state.db = 'app_shard_001_replica_001'
+        TestModel.objects.bulk_update_across_shards([obj], ['random_string'])
+        self.assertEqual(TestModel.objects.using('app_shard_001').get(id=1).random_string, 'updated')
+
+    def test_bulk_update_is_atomic_per_shard(self):
+        objs = list(TestModel.objects.across_shards().filter(id__in=[1, 3]))
+        for obj in objs:
+            obj.random_string = 'updated'
+        bulk_update = QuerySet.bulk_update
+
+        def bulk_update_then_fail(queryset, *args, **kwargs):
+            bulk_update(queryset, *args, **kwargs)
+            raise IntegrityError()
+
+        with patch.object(QuerySet, 'bulk_update', autospec=True, side_effect=bulk_update_then_fail):
+            with self.assertRaises(IntegrityError):
+                TestModel.objects.bulk_update_across_shards(objs, ['random_string'])
+        self.assertEqual(TestModel.objects.using('app_shard_001').filter(random_string='updated').count(), 0)
+
+    def test_delete_by_ids(self):
+        with patch.object(TestModel, 'get_shards_from_ids', create=True, return_value={1: 'app_shard_001', 2: 'app_shard_002'}):
+            deleted = TestModel.objects.delete_by_ids([1, 2, 2])
+        self.assertEqual(deleted, (2, {'tests.TestModel': 2}))
+        self.assertEqual(sorted(TestModel.objects.across_shards().values_list('id', flat=True)), [3, 4, 5, 6])
+
+    def test_delete_by_ids_with_unknown_shards(self):
+        deleted = TestModel.objects.delete_by_ids([3, 4, 100])
+        self.assertEqual(deleted, (2, {'tests.TestModel': 2}))
+        self.assertEqual(sorted(TestModel.objects.across_shards().values_list('id', flat=True)), [1, 2, 5, 6])
+        self.assertEqual(TestModel.objects.delete_by_ids([]), (0, {}))
+
+
+class AsyncCrossShardQuerySetTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        for pk in range(1, 7):
+            database = 'app_shard_001' if pk % 2 else 'app_shard_002'
+            TestModel.objects.using(database).create(id=pk, random_string='string', user_pk=pk)
+
+    async def test_alist(self):
+        rows = await TestModel.objects.across_shards().order_by('-id')[:4].alist()
+        self.assertEqual([row.id for row in rows], [6, 5, 4, 3])
+
+    async def test_aaggregate_and_acount(self):
+        self.assertEqual(await TestModel.objects.across_shards().aaggregate(total=Sum('user_pk'), average=Avg('user_pk')), {
+            'total': 21, 'average': 3.5,
+        })
+        self.assertEqual(await TestModel.objects.across_shards().filter(user_pk__gt=2).acount(), 4)
+
+    async def test_ain_bulk(self):
+        objects = await TestModel.objects.across_shards().ain_bulk([1, 2])
+        self.assertEqual({pk: obj._state.db for pk, obj in objects.items()}, {1: 'app_shard_001', 2: 'app_shard_002'})
+
+    async def test_shards_are_queried_concurrently(self):
+        # Each shard waits for the other, which only returns if both are queried at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+        cross_shard_queryset = TestModel.objects.across_shards()
+        results = await cross_shard_queryset._aexecute((cross_shard_queryset.get_shards(), lambda database: barrier.wait(), list))
+        self.assertEqual(sorted(results), [0, 1])
+
+    async def test_semaphore_is_shared_per_shard_group(self):
+        self.assertIs(get_cross_shard_semaphore('default'), get_cross_shard_semaphore('default'))
+        self.assertIsNot(get_cross_shard_semaphore('default'), get_cross_shard_semaphore('postgres'))
+
+
+class CrossShardTimeoutTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        for pk in range(1, 5):
+            database = 'app_shard_001' if pk % 2 else 'app_shard_002'
+            TestModel.objects.using(database).create(id=pk, random_string='string', user_pk=pk)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def slow_shard(self, database):
+        if database == 'app_shard_002':
+            self.release.wait(5)
+        return database
+
+    def test_raises_when_a_shard_is_too_slow(self):
+        cross_shard_queryset = TestModel.objects.across_shards(timeout=0.1)
+        with self.assertRaises(CrossShardTimeoutException) as context:
+            cross_shard_queryset._execute((cross_shard_queryset.get_shards(), self.slow_shard, list))
+        self.assertEqual(context.exception.databases, ['app_shard_002'])
+
+    def test_returns_the_shards_that_answered(self):
+        cross_shard_queryset = TestModel.objects.across_shards(timeout=0.1, allow_partial=True)
+        results = cross_shard_queryset._execute((cross_shard_queryset.get_shards(), self.slow_shard, list))
+        self.assertEqual(results, ['app_shard_001'])
+        self.assertEqual(cross_shard_queryset.missing_shards, ['app_shard_002'])
+
+    async def test_async_returns_the_shards_that_answered(self):
+        cross_shard_queryset = TestModel.objects.across_shards(timeout=0.1, allow_partial=True)
+        results = await cross_shard_queryset._aexecute((cross_shard_queryset.get_shards(), self.slow_shard, list))
+        self.assertEqual(results, ['app_shard_001'])
+        self.assertEqual(cross_shard_queryset.missing_shards, ['app_shard_002'])
+
+    def test_failing_shard_is_missing(self):
+        fetch_all = QuerySet._fetch_all
+
+        def fail_on_the_second_shard(queryset):
+            if queryset.db == 'app_shard_002':
+                raise OperationalError('The shard is down.')
+            fetch_all(queryset)
+
+        with patch.object(QuerySet, '_fetch_all', autospec=True, side_effect=fail_on_the_second_shard):
+            with self.assertRaises(OperationalError):
+                list(TestModel.objects.across_shards())
+
+            rows = TestModel.objects.across_shards(allow_partial=True).order_by('id')
+            self.assertEqual([row.id for row in rows], [1, 3])
+            self.assertEqual(rows.missing_shards, ['app_shard_002'])
+
+    def test_statement_timeout(self):
+        connection = MagicMock(settings_dict={'ENGINE': 'django.db.backends.postgresql'})
+        cursor = connection.cursor.return_value.__enter__.return_value
+        set_statement_timeout(connection, 250)
+        cursor.execute.assert_called_once_with('SET statement_timeout = 250')
+
+        connection = MagicMock(settings_dict={'ENGINE': 'django.db.backends.mysql'})
+        cursor = connection.cursor.return_value.__enter__.return_value
+        set_statement_timeout(connection, 250)
+        cursor.execute.assert_called_once_with('SET SESSION max_execution_time = 250')
+
+    def test_statement_timeout_is_set_from_the_deadline(self):
+        cross_shard_queryset = TestModel.objects.across_shards(timeout=10)
+        with patch('django_sharding_library.cross_shard.set_statement_timeout') as mock_set_statement_timeout:
+            with patch('django_sharding_library.cross_shard.reset_statement_timeout') as mock_reset_statement_timeout:
+                self.assertEqual(cross_shard_queryset.count(), 4)
+        self.assertEqual(mock_set_statement_timeout.call_count, 2)
+        self.assertTrue(all(0 < call[0][1] <= 10000 for call in mock_set_statement_timeout.call_args_list))
+        self.assertEqual(mock_reset_statement_timeout.call_count, 2)
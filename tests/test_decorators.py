@@ -55,6 +55,27 @@ class ModelConfigDecoratorTestCase(TestCase):
                     from django.contrib.auth import get_user_model
                     return get_user_model().objects.get(pk=self.user_pk).shard
 
+    def test_shard_key_field_must_be_a_field_of_the_model(self):
+        with self.assertRaises(ShardedModelInitializationException):
+            @model_config(shard_group='default', shard_key_field='user_id')
+            class TestModelTwo(models.Model):
+                id = TableShardedIDField(primary_key=True, source_table_name="blah")
+                user_pk = models.PositiveIntegerField()
+
+                def get_shard(self):
+                    pass
+
+    def test_puts_shard_key_field_on_the_model_class(self):
+        @model_config(shard_group='testing', shard_key_field='user_pk')
+        class TestModelFour(models.Model):
+            id = TableShardedIDField(primary_key=True, source_table_name="blah")
+            user_pk = models.PositiveIntegerField()
+
+            def get_shard(self):
+                pass
+
+        self.assertEqual(getattr(TestModelFour, 'django_sharding__shard_key_field'), 'user_pk')
+
     def test_puts_shard_group_on_the_model_class(self):
         @model_config(shard_group='testing')
         class TestModelThree(models.Model):
@@ -18,16 +18,20 @@ from django_sharding_library.fields import (
     ShardStorageFieldMixin,
     ShardForeignKeyStorageFieldMixin,
     ShardForeignKeyStorageField,
+    ShardedUUID4Field,
 )
 from django_sharding_library.id_generation_strategies import BaseIDGenerationStrategy
+from django_sharding_library.utils import get_database_for_model_instance
 from tests.models import (
     ShardedModelIDs,
     ShardedTestModelIDs,
     TestModel,
     ShardStorageTable,
+    ShardedByForiegnKeyModel,
     PostgresCustomAutoIDModel,
     PostgresCustomIDModel,
-    PostgresShardUser
+    PostgresShardUser,
+    ShardedUUID7TestModel,
 )
 
 
@@ -103,6 +107,37 @@ class TableShardedIDMixinTestCase(TestCase):
         self.assertEqual(field.strategy.call_count, 99)
 
 
+class ShardedUUID4FieldTestCase(TestCase):
+    databases = '__all__'
+
+    def test_shard_is_read_from_the_id(self):
+        field = ShardedUUID4Field()
+        self.assertEqual(field.get_shard_from_id(field.strategy.get_next_id('app_shard_002')), 'app_shard_002')
+        self.assertIsNone(field.get_shard_from_id('app_shard_005-6bd1fb4a-4a3a-4e4b-8ab8-e0a1e7a30d1b'))
+        self.assertIsNone(field.get_shard_from_id('app_shard_001_replica_001-6bd1fb4a-4a3a-4e4b-8ab8-e0a1e7a30d1b'))
+
+
+class ShardedUUID7FieldTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.user = get_user_model().objects.create_user(username='username', password='pwassword', email='test@example.com')
+
+    def test_id_is_generated_on_the_shard_of_the_instance(self):
+        instance = ShardedUUID7TestModel.objects.using(self.user.shard).create(random_string='Test String', user_pk=self.user.pk)
+        self.assertEqual(instance.pk.version, 7)
+        self.assertEqual(ShardedUUID7TestModel._meta.pk.get_shard_from_id(instance.pk), self.user.shard)
+        self.assertEqual(ShardedUUID7TestModel.objects.using(self.user.shard).get(pk=instance.pk).random_string, 'Test String')
+
+    def test_shard_is_decoded_from_id_without_calling_get_shard(self):
+        instance = ShardedUUID7TestModel.objects.using(self.user.shard).create(random_string='Test String', user_pk=self.user.pk)
+        unsaved_copy = ShardedUUID7TestModel(id=instance.pk, random_string='Test String', user_pk=self.user.pk)
+        with patch.object(ShardedUUID7TestModel, 'get_shard') as mock_get_shard:
+            self.assertEqual(get_database_for_model_instance(unsaved_copy), self.user.shard)
+        self.assertFalse(mock_get_shard.called)
+
+
 class ShardStorageFieldMixinTestCase(TestCase):
     databases = '__all__'
 
@@ -181,6 +216,68 @@ class ShardForeignKeyStorageFieldMixinTestCase(TestCase):
         self.assertTrue(latest_entry_in_storage_table.shard in settings.DATABASES)
 
 
+class ShardForeignKeyStorageFieldMixinBulkTestCase(TestCase):
+    databases = '__all__'
+
+    class FakeModel(object):
+        def __init__(self, shard_key):
+            self.shard_key = shard_key
+            self.shard = None
+
+        def get_shard_key(self):
+            return self.shard_key
+
+    def setUp(self):
+        self.sut = ShardedByForiegnKeyModel._meta.get_field('shard')
+
+    def test_save_shards_assigns_every_instance(self):
+        ShardStorageTable.objects.create(shard_key='existing', shard='app_shard_002')
+        ShardStorageTable.objects.create(shard_key='existing_without_shard', shard='')
+        models = [self.FakeModel(key) for key in ['existing', 'existing_without_shard', 'new_1', 'new_2', 'new_1', 3]]
+
+        with self.assertNumQueries(4, using='default'):
+            self.sut.save_shards(models)
+
+        self.assertEqual(models[0].shard.shard, 'app_shard_002')
+        for model in models:
+            self.assertEqual(model.shard, ShardStorageTable.objects.get(shard_key=str(model.shard_key)))
+            self.assertIn(model.shard.shard, ['app_shard_001', 'app_shard_002'])
+        self.assertEqual(models[2].shard.shard, models[4].shard.shard)
+        self.assertEqual(ShardStorageTable.objects.filter(shard_key__in=['new_1', 'new_2', '3']).count(), 3)
+
+    def test_save_shards_uses_a_single_query_when_all_are_assigned(self):
+        ShardStorageTable.objects.create(shard_key='existing', shard='app_shard_002')
+        models = [self.FakeModel('existing'), self.FakeModel('existing')]
+
+        with self.assertNumQueries(1, using='default'):
+            self.sut.save_shards(models)
+
+        self.assertEqual([model.shard.shard for model in models], ['app_shard_002', 'app_shard_002'])
+
+    def test_save_shards_skips_instances_with_a_shard(self):
+        shard_object = ShardStorageTable.objects.create(shard_key='existing', shard='app_shard_002')
+        model = self.FakeModel('other')
+        model.shard = shard_object
+
+        with self.assertNumQueries(0, using='default'):
+            self.sut.save_shards([model])
+
+        self.assertIs(model.shard, shard_object)
+
+    def test_save_shards_keeps_a_shard_stored_concurrently(self):
+        models = [self.FakeModel('raced')]
+        original_bulk_create = ShardStorageTable.objects.bulk_create
+
+        def bulk_create(objs, **kwargs):
+            ShardStorageTable.objects.create(shard_key='raced', shard='app_shard_001')
+            return original_bulk_create([ShardStorageTable(shard_key='raced', shard='app_shard_002')], **kwargs)
+
+        with patch.object(ShardStorageTable.objects, 'bulk_create', side_effect=bulk_create):
+            self.sut.save_shards(models)
+
+        self.assertEqual(models[0].shard.shard, 'app_shard_001')
+
+
 class ShardForeignKeyStorageFieldTestCase(TestCase):
     databases = '__all__'
 
@@ -0,0 +1,146 @@
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from mock import patch
+
+from django_sharding.models import FrozenShardKey, FrozenVersion
+from django_sharding_library.exceptions import DjangoShardingException, ShardReadOnlyException
+from django_sharding_library import freezing
+from django_sharding_library.freezing import (
+    clear_frozen_cache,
+    freeze_shard_key,
+    get_read_only_shards,
+    is_shard_key_frozen,
+    is_shard_read_only,
+    mark_shard_read_only,
+    mark_shard_writable,
+)
+from tests.models import ShardedTestModelIDs, ShardedUUID7TestModel, TestModel
+
+
+class FrozenCacheTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        clear_frozen_cache()
+        self.addCleanup(clear_frozen_cache)
+
+    def test_changes_bump_the_version(self):
+        freeze_shard_key('default', 1)
+        mark_shard_read_only('app_shard_002')
+        mark_shard_writable('app_shard_002')
+
+        self.assertEqual(FrozenVersion.objects.get().version, 3)
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'FROZEN_REFRESH_INTERVAL': 0})
+    def test_only_reads_the_flags_again_when_the_version_changes(self):
+        freeze_shard_key('default', 1)
+        self.assertTrue(is_shard_key_frozen('default', 1))
+
+        # A change made without bumping the version goes unnoticed.
+        FrozenShardKey.objects.create(shard_group='default', shard_key='2')
+        self.assertFalse(is_shard_key_frozen('default', 2))
+
+        FrozenVersion.objects.update(version=10)
+        self.assertTrue(is_shard_key_frozen('default', 2))
+
+    def test_the_version_is_checked_once_per_interval(self):
+        is_shard_key_frozen('default', 1)
+        with patch('django_sharding_library.freezing._refresh') as mock_refresh:
+            for _ in range(10):
+                is_shard_key_frozen('default', 1)
+                is_shard_read_only('app_shard_001')
+        self.assertFalse(mock_refresh.called)
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'FROZEN_REFRESH_INTERVAL': 0})
+    def test_missing_tables_are_only_looked_for_once(self):
+        with patch('django.db.backends.sqlite3.introspection.DatabaseIntrospection.table_names', return_value=[]) as mock_table_names:
+            for _ in range(3):
+                self.assertFalse(is_shard_read_only('app_shard_001'))
+            self.assertEqual(mock_table_names.call_count, 1)
+
+            # Migrating may create them.
+            freezing.clear_frozen_cache_after_migrating()
+            is_shard_read_only('app_shard_001')
+            self.assertEqual(mock_table_names.call_count, 2)
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'FROZEN_REFRESH_INTERVAL': 0})
+    def test_reads_do_not_wait_for_another_thread_refreshing(self):
+        mark_shard_read_only('app_shard_002')
+        self.assertTrue(is_shard_read_only('app_shard_002'))
+
+        with freezing._lock:
+            with patch('django_sharding_library.freezing._refresh') as mock_refresh:
+                self.assertTrue(is_shard_read_only('app_shard_002'))
+        self.assertFalse(mock_refresh.called)
+
+    def test_read_only_shards(self):
+        mark_shard_read_only('app_shard_002')
+        mark_shard_read_only('app_shard_002')
+
+        self.assertEqual(get_read_only_shards(), frozenset(['app_shard_002']))
+        self.assertTrue(is_shard_read_only('app_shard_002'))
+        self.assertFalse(is_shard_read_only('app_shard_001'))
+
+        mark_shard_writable('app_shard_002')
+        self.assertFalse(is_shard_read_only('app_shard_002'))
+
+    def test_only_primary_shards_can_be_read_only(self):
+        for database in ('default', 'app_shard_001_replica_001', 'missing'):
+            with self.assertRaises(DjangoShardingException):
+                mark_shard_read_only(database)
+
+
+class ReadOnlyShardRouterTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        clear_frozen_cache()
+        self.addCleanup(clear_frozen_cache)
+        self.user = get_user_model().objects.create_user(username='username', password='pwassword', email='test@example.com')
+        self.user.shard = 'app_shard_001'
+        self.user.save()
+        self.item = TestModel.objects.using('app_shard_001').create(random_string='a', user_pk=self.user.pk)
+
+    def test_writes_to_a_read_only_shard_are_rejected(self):
+        mark_shard_read_only('app_shard_001')
+
+        with self.assertRaises(ShardReadOnlyException) as context:
+            TestModel(random_string='b', user_pk=self.user.pk).save()
+        self.assertEqual(context.exception.database, 'app_shard_001')
+        item = TestModel.objects.using('app_shard_001').get(pk=self.item.pk)
+        with self.assertRaises(ShardReadOnlyException):
+            item.delete()
+        # The models stored on the shard rather than sharded are read-only too.
+        with self.assertRaises(ShardReadOnlyException):
+            ShardedTestModelIDs(stub=None).save()
+
+        # Reads and writes to the other shards keep working.
+        self.assertEqual(TestModel.objects.using('app_shard_001').get(pk=self.item.pk).random_string, 'a')
+        self.assertEqual(list(TestModel.objects.using('app_shard_001_replica_001').values_list('pk', flat=True)), [self.item.pk])
+        self.user.shard = 'app_shard_002'
+        self.user.save()
+        ShardedUUID7TestModel(random_string='b', user_pk=self.user.pk).save()
+        self.assertEqual(ShardedUUID7TestModel.objects.using('app_shard_002').count(), 1)
+
+        mark_shard_writable('app_shard_001')
+        item.random_string = 'c'
+        item.save()
+
+    def test_writes_outside_of_the_shards_are_not_checked(self):
+        with patch('django_sharding_library.router.is_shard_read_only', return_value=False) as mock_is_shard_read_only:
+            self.user.username = 'other'
+            self.user.save()
+            self.assertFalse(mock_is_shard_read_only.called)
+            TestModel(random_string='b', user_pk=self.user.pk).save()
+
+        self.assertEqual(set(call[0][0] for call in mock_is_shard_read_only.call_args_list), {'app_shard_001'})
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'CHECK_FROZEN_WRITES': False})
+    def test_the_checks_can_be_turned_off(self):
+        mark_shard_read_only('app_shard_001')
+        freeze_shard_key('default', self.user.pk)
+
+        with patch('django_sharding_library.router.is_shard_read_only') as mock_is_shard_read_only:
+            TestModel(random_string='b', user_pk=self.user.pk).save()
+        self.assertFalse(mock_is_shard_read_only.called)
+        self.assertEqual(TestModel.objects.using('app_shard_001').count(), 2)
@@ -1,12 +1,17 @@
+import time
 from random import choice
 from six.moves import xrange
 from uuid import UUID
 
 from django.conf import settings
+from django.db.utils import OperationalError
 from django.test import TestCase
+from mock import MagicMock, call, patch
 
-from tests.models import ShardedModelIDs
-from django_sharding_library.id_generation_strategies import TableStrategy, UUIDStrategy
+from django_sharding_library.constants import Backends
+from tests.models import ShardedModelIDs, TicketServerModelIDs
+from django_sharding_library.exceptions import DjangoShardingException
+from django_sharding_library.id_generation_strategies import TableStrategy, TimeOrderedUUIDStrategy, UUIDStrategy
 
 
 class TableStrategyIDGenerationTestCase(TestCase):
@@ -24,6 +29,75 @@ class TableStrategyIDGenerationTestCase(TestCase):
             self.assertFalse(ShardedModelIDs.objects.filter(pk__gt=id).exists())
 
 
+class TicketServerTableStrategyTestCase(TestCase):
+    databases = '__all__'
+
+    def test_picks_ticket_servers_round_robin_with_their_offsets(self):
+        sut = TableStrategy('tests.TicketServerModelIDs')
+        with patch.object(sut, '_get_next_id_from_database', return_value=1) as mock_get_next_id:
+            for i in xrange(4):
+                sut.get_next_id()
+
+        self.assertEqual(mock_get_next_id.call_args_list, [
+            call(TicketServerModelIDs, 'app_shard_001', increment=2, offset=1),
+            call(TicketServerModelIDs, 'app_shard_002', increment=2, offset=2),
+            call(TicketServerModelIDs, 'app_shard_001', increment=2, offset=1),
+            call(TicketServerModelIDs, 'app_shard_002', increment=2, offset=2),
+        ])
+
+    def test_skips_an_unavailable_ticket_server(self):
+        sut = TableStrategy('tests.TicketServerModelIDs')
+
+        def get_next_id(backing_model, database, increment, offset):
+            if database == 'app_shard_001':
+                raise OperationalError('gone away')
+            return offset
+
+        with patch.object(sut, '_get_next_id_from_database', side_effect=get_next_id) as mock_get_next_id:
+            ids = [sut.get_next_id() for i in xrange(4)]
+
+        self.assertEqual(ids, [2, 2, 2, 2])
+        # The failed server is only tried once until it is due to be retried.
+        self.assertEqual([c[0][1] for c in mock_get_next_id.call_args_list].count('app_shard_001'), 1)
+
+    def test_retries_unhealthy_servers_when_all_have_failed(self):
+        sut = TableStrategy('tests.TicketServerModelIDs')
+        with patch.object(sut, '_get_next_id_from_database', side_effect=OperationalError('gone away')) as mock_get_next_id:
+            with self.assertRaises(DjangoShardingException):
+                sut.get_next_id()
+            with self.assertRaises(DjangoShardingException):
+                sut.get_next_id()
+        self.assertEqual(mock_get_next_id.call_count, 4)
+
+    def test_mysql_session_variables_are_reset_after_each_id(self):
+        sut = TableStrategy('tests.TicketServerModelIDs')
+        connection = MagicMock()
+        cursor = connection.cursor.return_value
+        cursor.cursor.cursor.lastrowid = 3
+        reset = call("SET SESSION auto_increment_increment = DEFAULT, auto_increment_offset = DEFAULT")
+
+        with patch.dict(settings.DATABASES['app_shard_001'], ENGINE='django.db.backends.mysql'):
+            with patch('django_sharding_library.id_generation_strategies.connections', {'app_shard_001': connection}):
+                with patch('django_sharding_library.id_generation_strategies.transaction.atomic'):
+                    self.assertEqual(sut._get_next_id_from_database(TicketServerModelIDs, 'app_shard_001', increment=2, offset=1), 3)
+                    self.assertEqual(cursor.execute.call_args_list[0], call(
+                        "SET SESSION auto_increment_increment = %s, auto_increment_offset = %s", [2, 1]
+                    ))
+                    self.assertEqual(cursor.execute.call_args_list[-1], reset)
+
+                    cursor.execute.reset_mock()
+                    cursor.execute.side_effect = [None, OperationalError('gone away'), None]
+                    with self.assertRaises(OperationalError):
+                        sut._get_next_id_from_database(TicketServerModelIDs, 'app_shard_001', increment=2, offset=1)
+                    self.assertEqual(cursor.execute.call_args_list[-1], reset)
+
+    def test_ticket_servers_require_mysql_or_postgres(self):
+        sut = TableStrategy('tests.TicketServerModelIDs')
+        if settings.DATABASES['app_shard_001']['ENGINE'] in Backends.SQLITE:
+            with self.assertRaises(DjangoShardingException):
+                sut.get_next_id()
+
+
 class UUIDStrategyTestCase(TestCase):
 
     def test_uuid_strategy_must_be_passed_a_database(self):
@@ -39,3 +113,33 @@ class UUIDStrategyTestCase(TestCase):
             self.assertTrue(id.startswith(database))
             uuid_value = id[len(database) + 1:]
             self.assertEqual(str(UUID(uuid_value, version=4)), uuid_value)
+
+
+class TimeOrderedUUIDStrategyTestCase(TestCase):
+
+    def test_time_ordered_uuid_strategy_must_be_passed_a_database(self):
+        sut = TimeOrderedUUIDStrategy()
+        with self.assertRaises(AssertionError):
+            sut.get_next_id('im not a database')
+
+    def test_returns_version_7_uuid_with_shard_id(self):
+        sut = TimeOrderedUUIDStrategy()
+        for database in ['app_shard_001', 'app_shard_002']:
+            id = sut.get_next_id(database)
+            self.assertEqual(id.version, 7)
+            self.assertEqual(sut.get_shard_id_from_id(id), settings.DATABASES[database]['SHARD_ID'])
+            self.assertEqual(sut.get_shard_id_from_id(str(id)), settings.DATABASES[database]['SHARD_ID'])
+
+    def test_ids_are_ordered_by_time(self):
+        sut = TimeOrderedUUIDStrategy()
+        before = int(time.time() * 1000)
+        first = sut.get_next_id('app_shard_002')
+        time.sleep(0.002)
+        second = sut.get_next_id('app_shard_001')
+        self.assertLess(first, second)
+        self.assertGreaterEqual(sut.get_timestamp_from_id(first), before)
+
+    def test_returns_unique_values(self):
+        sut = TimeOrderedUUIDStrategy()
+        ids = [sut.get_next_id('app_shard_001') for i in xrange(100)]
+        self.assertEqual(len(ids), len(set(ids)))
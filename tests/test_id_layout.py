@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+from mock import MagicMock, patch
+
+from django_sharding_library.exceptions import DjangoShardingException
+from django_sharding_library.id_layout import ShardedIDLayout, get_id_layout, get_id_layout_for_database
+from django_sharding_library.utils import create_postgres_shard_id_function
+
+
+class ShardedIDLayoutTestCase(TestCase):
+
+    def test_default_layout_matches_the_original_layout(self):
+        sut = ShardedIDLayout()
+        self.assertEqual((sut.time_shift, sut.shard_shift, sut.sequence_modulus, sut.max_shard_id), (23, 10, 1024, 8191))
+        self.assertEqual(sut.compose(10, 3, 800), (10 << 23) | (3 << 10) | 800)
+
+    def test_decompose(self):
+        sut = ShardedIDLayout(shard_bits=8, sequence_bits=15)
+        sharded_id = sut.compose(123456, 200, 30000)
+        self.assertEqual(sut.get_millis_since_epoch(sharded_id), 123456)
+        self.assertEqual(sut.get_shard_id(sharded_id), 200)
+        self.assertEqual(sut.get_sequence(sharded_id), 30000)
+
+    def test_shard_id_must_fit(self):
+        with self.assertRaises(ValueError):
+            ShardedIDLayout(shard_bits=2).compose(1, 4, 1)
+
+    def test_invalid_layouts(self):
+        with self.assertRaises(ValueError):
+            ShardedIDLayout(shard_bits=0)
+        with self.assertRaises(ValueError):
+            ShardedIDLayout(shard_bits=20, sequence_bits=20)
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'postgres': {'ID_LAYOUT': {'SHARD_BITS': 6, 'SEQUENCE_BITS': 14}}})
+    def test_layout_from_settings(self):
+        self.assertEqual(get_id_layout('postgres'), ShardedIDLayout(shard_bits=6, sequence_bits=14))
+        self.assertEqual(get_id_layout_for_database('app_shard_003'), ShardedIDLayout(shard_bits=6, sequence_bits=14))
+        self.assertEqual(get_id_layout('default'), ShardedIDLayout())
+
+    def test_forecast(self):
+        sut = ShardedIDLayout()
+        forecast = sut.forecast(inserts_per_second=1000, shard_epoch=0, now_millis=0)
+        self.assertEqual(forecast.inserts_per_millisecond, 1.0)
+        self.assertEqual(forecast.sequence_capacity, 1024)
+        self.assertLess(forecast.wraparound_probability, 1e-100)
+        self.assertEqual(forecast.exhaustion_millis, 1 << 40)
+        self.assertAlmostEqual(forecast.years_remaining, 34.8, places=1)
+
+    def test_forecast_wraparound_risk_increases_with_the_rate(self):
+        sut = ShardedIDLayout()
+        busy = sut.forecast(inserts_per_second=900000, shard_epoch=0, now_millis=0)
+        overloaded = sut.forecast(inserts_per_second=2000000, shard_epoch=0, now_millis=0)
+        self.assertGreater(busy.wraparound_probability, 0)
+        self.assertLess(busy.wraparound_probability, 0.01)
+        self.assertGreater(overloaded.wraparound_probability, 0.99)
+
+
+class CreateShardIDFunctionTestCase(TestCase):
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'postgres': {'ID_LAYOUT': {'SHARD_BITS': 6, 'SEQUENCE_BITS': 14}}})
+    def test_function_uses_the_layout_of_the_shard_group(self):
+        with patch('django_sharding_library.utils.connections', MagicMock()) as mock_connections:
+            create_postgres_shard_id_function('global_id_sequence', 'app_shard_004', 1)
+        sql = mock_connections['app_shard_004'].cursor().execute.call_args[0][0]
+        self.assertIn("nextval('global_id_sequence') % 16384", sql)
+        self.assertIn('<< 20;', sql)
+        self.assertIn('(shard_id << 14)', sql)
+        self.assertIn('start_epoch bigint := {};'.format(settings.SHARD_EPOCH), sql)
+
+    @override_settings(DJANGO_SHARDING_SETTINGS={'postgres': {'ID_LAYOUT': {'SHARD_BITS': 1, 'SEQUENCE_BITS': 10}}})
+    def test_shard_id_must_fit_in_the_layout(self):
+        with patch('django_sharding_library.utils.connections', MagicMock()):
+            with self.assertRaises(DjangoShardingException):
+                create_postgres_shard_id_function('global_id_sequence', 'app_shard_004', 2)
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase
+from mock import patch
+
+from django_sharding_library.exceptions import DjangoShardingException
+from django_sharding_library.joins import join_across
+from tests.models import TestModel
+
+
+class JoinAcrossTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(username='user {}'.format(i), password='password', email='{}@example.com'.format(i))
+            for i in range(4)
+        ]
+        pk = 1
+        # The last user has no rows and one row belongs to a user which doesn't exist.
+        for user_pk in [user.pk for user in self.users[:3]] * 2 + [self.users[-1].pk + 100]:
+            database = 'app_shard_001' if pk % 2 else 'app_shard_002'
+            TestModel.objects.using(database).create(id=pk, random_string='string {}'.format(pk), user_pk=user_pk)
+            pk += 1
+        self.expected = sorted((pk, self.users[(pk - 1) % 3].pk) for pk in range(1, 7))
+
+    def get_pairs(self, **kwargs):
+        return join_across(TestModel.objects.across_shards().order_by('id'), get_user_model().objects.all(), on=('user_pk', 'id'), **kwargs)
+
+    def test_joins_the_sharded_rows_to_the_unsharded_rows(self):
+        pairs = list(self.get_pairs())
+        # The rows come out in the order of the streamed side.
+        self.assertEqual([(row.id, user.id) for row, user in pairs], self.expected)
+        self.assertEqual({user._state.db for row, user in pairs}, {'default'})
+
+    def test_builds_the_table_from_either_side(self):
+        pairs = self.get_pairs(build='left')
+        self.assertEqual(sorted((row.id, user.id) for row, user in pairs), self.expected)
+        with self.assertRaises(DjangoShardingException):
+            list(self.get_pairs(build='middle'))
+
+    def test_joins_values_on_a_shared_field_name(self):
+        left = TestModel.objects.across_shards().values('id', 'random_string')
+        right = TestModel.objects.using('app_shard_001').values('id', 'user_pk')
+        pairs = join_across(left, right, on='id')
+        self.assertEqual(sorted((left_row['id'], right_row['id']) for left_row, right_row in pairs), [(1, 1), (3, 3), (5, 5), (7, 7)])
+
+    def test_spills_to_disk_when_the_build_side_is_too_large(self):
+        with patch('django_sharding_library.joins._SpillFile.write', autospec=True, side_effect=lambda *args: None) as mock_write:
+            list(self.get_pairs(max_rows_in_memory=100))
+        mock_write.assert_not_called()
+
+        pairs = self.get_pairs(max_rows_in_memory=2, partitions=3)
+        self.assertEqual(sorted((row.id, user.id) for row, user in pairs), self.expected)
+
+        with patch('django_sharding_library.joins._SpillFile.write', autospec=True, side_effect=lambda *args: None) as mock_write:
+            list(self.get_pairs(max_rows_in_memory=2, partitions=3))
+        # Every user and every sharded row with a user.
+        self.assertEqual(mock_write.call_count, 4 + 7)
@@ -1,12 +1,19 @@
+import threading
+import time
 from unittest import skip
 
+from django.conf import settings
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.migrations.loader import MigrationLoader
 from django.test import TestCase
-from mock import patch
+from mock import MagicMock, patch
+from six import StringIO
 
 from django_sharding_library.exceptions import InvalidMigrationException
 
 
+@patch('django_sharding_library.management.commands.migrate.Command.has_unapplied_migrations', new=lambda *args: True)
 @patch('django.core.management.commands.migrate.Command.handle')
 class MigrationCommandTestCase(TestCase):
     databases = '__all__'
@@ -53,3 +60,199 @@ class MigrationCommandTestCase(TestCase):
         self.assertEqual(mock_migrate_command.call_args[1].get('database'), 'app_shard_001')
         self.assertEqual(mock_migrate_command.call_args[1].get('app_label'), 'tests')
         self.assertEqual(mock_migrate_command.call_args[1].get('migration_name'), '0001')
+
+
+@patch('django_sharding_library.management.commands.migrate.Command.has_unapplied_migrations', new=lambda *args: True)
+@patch('django.core.management.commands.migrate.Command.handle')
+class ParallelMigrationCommandTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.databases_in_order = [database for database, db_settings in settings.DATABASES.items() if not db_settings.get('PRIMARY')]
+
+    def test_migrates_every_database_on_its_own_thread(self, mock_migrate_command):
+        threads = {}
+
+        def migrate(command, *args, **options):
+            threads[options['database']] = threading.current_thread()
+            command.stdout.write('Migrated {}'.format(options['database']))
+
+        mock_migrate_command.side_effect = migrate
+        stdout = StringIO()
+        call_command('migrate', parallel=3, verbosity=1, stdout=stdout)
+
+        self.assertEqual(sorted(threads), sorted(self.databases_in_order))
+        self.assertNotIn(threading.current_thread(), threads.values())
+        self.assertFalse(any(call[1]['interactive'] for call in mock_migrate_command.call_args_list))
+        # The output of each database is printed together and in order.
+        output = stdout.getvalue()
+        positions = [output.index('Database: {}\nMigrated {}'.format(database, database)) for database in self.databases_in_order]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_summarizes_the_failures(self, mock_migrate_command):
+        def migrate(command, *args, **options):
+            if options['database'] == 'app_shard_002':
+                raise ValueError('Broken migration')
+
+        mock_migrate_command.side_effect = migrate
+        stderr = StringIO()
+        with self.assertRaises(CommandError) as context:
+            call_command('migrate', parallel=2, verbosity=0, stderr=stderr)
+
+        self.assertEqual(str(context.exception), 'Migrations failed on 1 of 5 databases: app_shard_002.')
+        self.assertIn('Database app_shard_002: Broken migration', stderr.getvalue())
+        self.assertEqual(sorted(call[1]['database'] for call in mock_migrate_command.call_args_list), sorted(self.databases_in_order))
+
+    def test_fail_fast_skips_the_databases_not_started(self, mock_migrate_command):
+        first, second = self.databases_in_order[:2]
+        second_started = threading.Event()
+        first_failed = threading.Event()
+
+        def migrate(command, *args, **options):
+            if options['database'] == first:
+                second_started.wait()
+                first_failed.set()
+                raise ValueError('Broken migration')
+            # Hold the other worker until the first has failed.
+            second_started.set()
+            first_failed.wait()
+            time.sleep(0.1)
+
+        mock_migrate_command.side_effect = migrate
+        with self.assertRaises(CommandError) as context:
+            call_command('migrate', parallel=2, fail_fast=True, verbosity=0, stderr=StringIO())
+
+        self.assertEqual(sorted(call[1]['database'] for call in mock_migrate_command.call_args_list), sorted([first, second]))
+        self.assertIn('Migrations failed on 4 of 5 databases', str(context.exception))
+
+
+@patch('django_sharding_library.management.commands.migrate.time.sleep')
+@patch('django_sharding_library.management.commands.migrate.Command.has_unapplied_migrations', return_value=True)
+@patch('django.core.management.commands.migrate.Command.handle')
+class RollingMigrationCommandTestCase(TestCase):
+    databases = '__all__'
+
+    def get_migrated_databases(self, mock_migrate_command):
+        return [call[1]['database'] for call in mock_migrate_command.call_args_list]
+
+    def test_migrates_the_canary_and_then_waves(self, mock_migrate_command, mock_has_unapplied_migrations, mock_sleep):
+        call_command('migrate', rolling=True, canary='app_shard_003', wave_size=2, verbosity=0)
+
+        migrated = self.get_migrated_databases(mock_migrate_command)
+        self.assertEqual(migrated[0], 'app_shard_003')
+        self.assertEqual(sorted(migrated), ['app_shard_001', 'app_shard_002', 'app_shard_003', 'app_shard_004', 'default'])
+        mock_sleep.assert_not_called()
+
+    def test_skips_the_databases_already_migrated(self, mock_migrate_command, mock_has_unapplied_migrations, mock_sleep):
+        mock_has_unapplied_migrations.side_effect = lambda database, options: database in ['app_shard_002', 'app_shard_004']
+        stdout = StringIO()
+        call_command('migrate', rolling=True, skip_up_to_date=True, wave_size=3, verbosity=1, stdout=stdout)
+
+        self.assertEqual(sorted(self.get_migrated_databases(mock_migrate_command)), ['app_shard_002', 'app_shard_004'])
+        self.assertIn('Database app_shard_001 is already migrated.', stdout.getvalue())
+
+    def test_waits_for_the_replicas_between_waves(self, mock_migrate_command, mock_has_unapplied_migrations, mock_sleep):
+        lags = iter([30.0, 12.0, 1.0, 0.0])
+        with patch('django_sharding_library.management.commands.migrate.get_replica_lag', side_effect=lambda replica: next(lags)) as mock_lag:
+            call_command('migrate', rolling=True, canary='app_shard_001', wave_size=5, max_replica_lag=5, replica_lag_interval=2, verbosity=0)
+
+        # Both replicas of the canary are sampled until they have caught up.
+        self.assertEqual([call[0][0] for call in mock_lag.call_args_list], ['app_shard_001_replica_001', 'app_shard_001_replica_002'] * 2)
+        mock_sleep.assert_called_once_with(2)
+        self.assertEqual(self.get_migrated_databases(mock_migrate_command)[0], 'app_shard_001')
+        self.assertEqual(len(mock_migrate_command.call_args_list), 5)
+
+    def test_gives_up_when_the_replicas_stay_behind(self, mock_migrate_command, mock_has_unapplied_migrations, mock_sleep):
+        with patch('django_sharding_library.management.commands.migrate.get_replica_lag', return_value=60.0):
+            with self.assertRaises(CommandError):
+                call_command('migrate', rolling=True, canary='app_shard_001', replica_lag_timeout=0, verbosity=0)
+
+        self.assertEqual(self.get_migrated_databases(mock_migrate_command), ['app_shard_001'])
+
+    def test_a_failed_wave_stops_the_rollout(self, mock_migrate_command, mock_has_unapplied_migrations, mock_sleep):
+        mock_migrate_command.side_effect = ValueError('Broken migration')
+        with self.assertRaises(CommandError):
+            call_command('migrate', rolling=True, canary='app_shard_002', verbosity=0, stderr=StringIO())
+
+        self.assertEqual(self.get_migrated_databases(mock_migrate_command), ['app_shard_002'])
+
+    def test_canary_must_be_migrated(self, mock_migrate_command, mock_has_unapplied_migrations, mock_sleep):
+        with self.assertRaises(CommandError):
+            call_command('migrate', rolling=True, database='app_shard_001', canary='app_shard_002', verbosity=0)
+
+
+class FakeGraph(object):
+    def __init__(self, migrations):
+        self.migrations = migrations
+
+    def leaf_nodes(self):
+        return [self.migrations[-1]]
+
+    def forwards_plan(self, target):
+        return self.migrations[:self.migrations.index(target) + 1]
+
+
+class HasUnappliedMigrationsTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        from django_sharding_library.management.commands.migrate import Command
+
+        self.command = Command()
+        self.command._loader = MagicMock(
+            replacements={},
+            migrated_apps={'tests'},
+            graph=FakeGraph([('tests', '0001_initial'), ('tests', '0002_second'), ('tests', '0003_third')]),
+        )
+        self.options = {'app_label': None, 'migration_name': None, 'run_syncdb': False}
+
+    def test_diffs_the_plan_against_the_applied_migrations(self):
+        applied = {
+            'app_shard_001': set([('tests', '0001_initial')]),
+            'app_shard_002': set([('tests', '0001_initial'), ('tests', '0002_second'), ('tests', '0003_third')]),
+        }
+        with patch('django_sharding_library.management.commands.migrate.get_applied_migrations', side_effect=applied.get):
+            self.assertEqual(self.command.get_unapplied_migrations('app_shard_001', self.options), [('tests', '0002_second'), ('tests', '0003_third')])
+            self.assertTrue(self.command.has_unapplied_migrations('app_shard_001', self.options))
+            self.assertFalse(self.command.has_unapplied_migrations('app_shard_002', self.options))
+
+    def test_reuses_the_plan_of_databases_at_the_same_point(self):
+        self.command._loader.graph = MagicMock(wraps=self.command._loader.graph)
+        with patch('django_sharding_library.management.commands.migrate.get_applied_migrations', return_value=set([('tests', '0001_initial')])):
+            for database in ['app_shard_001', 'app_shard_002', 'app_shard_003']:
+                self.command.get_unapplied_migrations(database, self.options)
+        self.assertEqual(self.command._loader.graph.forwards_plan.call_count, 1)
+
+    def test_up_to_date_databases_skip_migrate(self):
+        with patch('django_sharding_library.management.commands.migrate.Command.get_migration_loader', return_value=self.command._loader):
+            with patch('django_sharding_library.management.commands.migrate.get_applied_migrations', side_effect=lambda database: (
+                set([('tests', '0001_initial')]) if database == 'app_shard_002' else set(self.command._loader.graph.migrations)
+            )):
+                with patch('django.core.management.commands.migrate.Command.handle') as mock_migrate_command:
+                    stdout = StringIO()
+                    call_command('migrate', skip_up_to_date=True, verbosity=1, stdout=stdout)
+                    call_command('migrate', skip_up_to_date=True, parallel=2, verbosity=0)
+
+        self.assertEqual([call[1]['database'] for call in mock_migrate_command.call_args_list], ['app_shard_002', 'app_shard_002'])
+        self.assertIn('Database: app_shard_001\n  No migrations to apply.', stdout.getvalue())
+
+    def test_up_to_date_databases_are_migrated_without_the_flag(self):
+        # Their pre_migrate receivers, such as the one creating the sequences of the Postgres ids, still have to run.
+        with patch('django_sharding_library.management.commands.migrate.Command.has_unapplied_migrations', return_value=False) as mock_has_unapplied_migrations:
+            with patch('django.core.management.commands.migrate.Command.handle') as mock_migrate_command:
+                call_command('migrate', verbosity=0)
+                call_command('migrate', rolling=True, verbosity=0)
+
+        self.assertEqual(len(mock_migrate_command.call_args_list), 10)
+        self.assertFalse(mock_has_unapplied_migrations.called)
+
+    def test_falls_back_to_the_migration_executor(self):
+        self.assertTrue(self.command.has_unapplied_migrations('app_shard_001', dict(self.options, migration_name='0001')))
+        self.assertTrue(self.command.has_unapplied_migrations('app_shard_001', dict(self.options, run_syncdb=True)))
+        self.assertTrue(self.command.has_unapplied_migrations('app_shard_001', dict(self.options, app_label='unknown')))
+
+        self.command._loader.replacements = {('tests', '0001_squashed'): None}
+        with patch('django_sharding_library.management.commands.migrate.MigrationExecutor.migration_plan', return_value=[]) as mock_plan:
+            self.assertFalse(self.command.has_unapplied_migrations('app_shard_001', self.options))
+        # Django's plan is worked out for every app with migrations.
+        mock_plan.assert_called_once_with(MigrationLoader(None, ignore_no_migrations=True).graph.leaf_nodes())
@@ -0,0 +1,65 @@
+from django.db.models.query import QuerySet
+from django.test import TransactionTestCase
+from mock import patch
+
+from django_sharding_library.exceptions import DjangoShardingException, InvalidCursorException
+from django_sharding_library.pagination import CrossShardPaginator
+from tests.models import TestModel
+
+
+class CrossShardPaginatorTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        for pk in range(1, 11):
+            database = 'app_shard_001' if pk % 2 else 'app_shard_002'
+            TestModel.objects.using(database).create(id=pk, random_string='string {}'.format(pk % 3), user_pk=pk)
+
+    def get_all_pages(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return [[row.id for row in page] for page in pages]
+
+    def test_pages_through_every_shard(self):
+        paginator = CrossShardPaginator(TestModel.objects.across_shards().order_by('-id'), per_page=3)
+        self.assertEqual(self.get_all_pages(paginator), [[10, 9, 8], [7, 6, 5], [4, 3, 2], [1]])
+
+    def test_last_page_is_full(self):
+        paginator = CrossShardPaginator(TestModel.objects.across_shards().order_by('id'), per_page=5)
+        self.assertEqual(self.get_all_pages(paginator), [[1, 2, 3, 4, 5], [6, 7, 8, 9, 10]])
+
+    def test_non_unique_ordering(self):
+        paginator = CrossShardPaginator(TestModel.objects.across_shards().order_by('random_string'), per_page=4)
+        self.assertEqual(self.get_all_pages(paginator), [[3, 6, 9, 1], [4, 7, 10, 2], [5, 8]])
+
+    def test_values(self):
+        paginator = CrossShardPaginator(
+            TestModel.objects.across_shards().filter(user_pk__gt=4).order_by('-user_pk').values('id', 'user_pk'),
+            per_page=4,
+        )
+        first_page = paginator.page()
+        self.assertEqual([row['id'] for row in first_page], [10, 9, 8, 7])
+        self.assertEqual([row['id'] for row in paginator.page(first_page.next_cursor)], [6, 5])
+
+    def test_deep_pages_use_a_predicate_rather_than_an_offset(self):
+        paginator = CrossShardPaginator(TestModel.objects.across_shards().order_by('id'), per_page=2)
+        cursor = paginator.page(paginator.page().next_cursor).next_cursor
+        with patch.object(QuerySet, '__getitem__', autospec=True, side_effect=QuerySet.__getitem__) as mock_getitem:
+            page = paginator.page(cursor)
+        self.assertEqual([row.id for row in page], [5, 6])
+        self.assertEqual(mock_getitem.call_count, 1)
+        self.assertEqual(mock_getitem.call_args[0][1], slice(None, 3))
+        self.assertIn('> 4', str(mock_getitem.call_args[0][0].query))
+
+    def test_invalid_cursors(self):
+        paginator = CrossShardPaginator(TestModel.objects.across_shards().order_by('id'), per_page=2)
+        other_paginator = CrossShardPaginator(TestModel.objects.across_shards().order_by('-id'), per_page=2)
+        with self.assertRaises(InvalidCursorException):
+            paginator.page('not a cursor')
+        with self.assertRaises(InvalidCursorException):
+            paginator.page(other_paginator.page().next_cursor)
+
+    def test_sliced_query(self):
+        with self.assertRaises(DjangoShardingException):
+            CrossShardPaginator(TestModel.objects.across_shards().order_by('id')[:5], per_page=2)
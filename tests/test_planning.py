@@ -0,0 +1,101 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from mock import MagicMock, patch
+from six import StringIO
+
+from django_sharding_library.exceptions import DjangoShardingException
+from django_sharding_library.planning import build_copy_plan, clear_copy_plans, get_copy_plan
+from django_sharding_library.registry import get_model_metadata
+from tests.models import ShardedUUID7TestModel, TestModel, TestModelComment, TestModelCommentEdit
+
+
+class CopyPlanTestCase(SimpleTestCase):
+    def setUp(self):
+        clear_copy_plans()
+        self.addCleanup(clear_copy_plans)
+
+    def test_orders_the_models_by_their_foreign_keys(self):
+        plan = get_copy_plan('default')
+
+        self.assertEqual(plan.models, [TestModel, TestModelComment, TestModelCommentEdit])
+        self.assertEqual([step.shard_key_lookup for step in plan], ['user_pk', 'test_model__user_pk', 'comment__test_model__user_pk'])
+        self.assertEqual([step.dependencies for step in plan], [[], [TestModel], [TestModelComment]])
+        self.assertEqual(plan.unreachable, [ShardedUUID7TestModel])
+        self.assertFalse(any(step.id_encodes_shard for step in plan))
+
+    def test_models_without_a_link_to_the_shard_key(self):
+        plan = get_copy_plan('postgres')
+
+        self.assertEqual(len(plan), 0)
+        self.assertEqual([model._meta.label for model in plan.unreachable], ['tests.PostgresCustomAutoIDModel', 'tests.PostgresCustomIDModel'])
+
+    def test_the_plan_is_cached(self):
+        self.assertIs(get_copy_plan('default'), get_copy_plan('default'))
+        plan = get_copy_plan('default')
+        clear_copy_plans()
+        self.assertIsNot(get_copy_plan('default'), plan)
+
+    def test_the_queryset_of_a_step_follows_the_lookup(self):
+        queryset = get_copy_plan('default').steps[2].get_queryset('app_shard_001', 5)
+
+        self.assertEqual(queryset.db, 'app_shard_001')
+        self.assertIn('"tests_testmodel"."user_pk" = 5', str(queryset.query))
+
+    def test_cycles_are_rejected(self):
+        comment_field = TestModelComment._meta.get_field('test_model')
+        # Pretend the test model has a foreign key to the comments as well.
+        reverse_field = MagicMock(related_model=TestModelComment)
+        reverse_field.name = 'comment'
+        relations = {TestModel: [reverse_field], TestModelComment: [comment_field]}
+        metadata = [get_model_metadata(model) for model in (TestModel, TestModelComment)]
+
+        with patch('django_sharding_library.planning._get_forward_relations', side_effect=lambda model, models: relations[model]):
+            with patch('django_sharding_library.planning.get_all_model_metadata', return_value=metadata):
+                with self.assertRaises(DjangoShardingException):
+                    build_copy_plan('default')
+
+
+class CopyStepTestCase(TestCase):
+    databases = '__all__'
+
+    def test_the_shard_key_of_an_instance_follows_the_lookup(self):
+        user = get_user_model().objects.create_user(username='username', password='pwassword', email='test@example.com')
+        user.shard = 'app_shard_001'
+        user.save()
+        plan = get_copy_plan('default')
+        edit = TestModelCommentEdit(comment=TestModelComment(test_model=TestModel(user_pk=user.pk)))
+
+        self.assertEqual(plan.get_step(TestModelCommentEdit).get_shard_key(edit), user.pk)
+        self.assertIsNone(plan.get_step(TestModelCommentEdit).get_shard_key(TestModelCommentEdit()))
+        self.assertIsNone(plan.get_step(ShardedUUID7TestModel))
+
+
+class ShardingPlanCommandTestCase(SimpleTestCase):
+    def test_text(self):
+        stdout = StringIO()
+        call_command('sharding_plan', shard_group='default', stdout=stdout)
+
+        self.assertEqual(stdout.getvalue().splitlines(), [
+            'Shard group default:',
+            '  1. tests.TestModel by user_pk',
+            '  2. tests.TestModelComment by test_model__user_pk, after tests.TestModel',
+            '  3. tests.TestModelCommentEdit by comment__test_model__user_pk, after tests.TestModelComment',
+            '  Not linked to the shard key: tests.ShardedUUID7TestModel',
+        ])
+
+    def test_json(self):
+        stdout = StringIO()
+        call_command('sharding_plan', json=True, stdout=stdout)
+
+        plans = json.loads(stdout.getvalue())
+        self.assertEqual(list(plans), ['default', 'postgres'])
+        self.assertEqual(plans['default']['steps'][1], {
+            'model': 'tests.TestModelComment',
+            'filter': 'test_model__user_pk',
+            'depends_on': ['tests.TestModel'],
+            'id_encodes_shard': False,
+        })
+        self.assertEqual(plans['postgres']['steps'], [])
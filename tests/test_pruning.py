@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.conf import settings
+from django.test import TransactionTestCase
+from mock import patch
+
+from django_sharding_library.pruning import prune_shards
+from django_sharding_library.registry import get_model_metadata
+from django_sharding_library.sharding_functions import ModBucketingStrategy, RangeBucketingStrategy
+from tests.models import ShardedUUID7TestModel, TestModel
+
+
+SHARDS = ['app_shard_001', 'app_shard_002']
+
+
+class PruneShardsByIDTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        strategy = ShardedUUID7TestModel._meta.pk.strategy
+        self.first_id = strategy.get_next_id('app_shard_001')
+        self.second_id = strategy.get_next_id('app_shard_002')
+
+    def prune(self, queryset):
+        return prune_shards(queryset, 'default', SHARDS)
+
+    def test_equality_on_the_primary_key(self):
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.filter(pk=self.second_id)), ['app_shard_002'])
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.filter(id=self.first_id, random_string='a')), ['app_shard_001'])
+
+    def test_in_on_the_primary_key(self):
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.filter(pk__in=[self.first_id])), ['app_shard_001'])
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.filter(pk__in=[self.first_id, self.second_id])), SHARDS)
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.filter(pk__in=[])), [])
+
+    def test_filters_which_do_not_restrict_every_row(self):
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.all()), SHARDS)
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.exclude(pk=self.first_id)), SHARDS)
+        self.assertEqual(self.prune(ShardedUUID7TestModel.objects.filter(Q(pk=self.first_id) | Q(random_string='a'))), SHARDS)
+
+    def test_primary_key_without_the_shard(self):
+        self.assertEqual(self.prune(TestModel.objects.filter(pk=1)), SHARDS)
+
+
+class PruneShardsByShardKeyTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def prune(self, queryset):
+        return prune_shards(queryset, 'default', SHARDS)
+
+    def use_bucketer(self, bucketer):
+        patcher = patch.object(get_model_metadata(TestModel), 'bucketer', bucketer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_uses_the_batch_api_of_the_bucketer(self):
+        bucketer = ModBucketingStrategy(shard_group='default', databases=settings.DATABASES)
+        self.use_bucketer(bucketer)
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk=5)), [bucketer.get_shard_for_key(5)])
+        self.assertEqual(
+            self.prune(TestModel.objects.filter(user_pk__in=[5, 6])),
+            sorted({bucketer.get_shard_for_key(5), bucketer.get_shard_for_key(6)}),
+        )
+
+    def test_falls_back_to_the_model(self):
+        user = get_user_model().objects.create_user(username='username', password='pwassword', email='test@example.com')
+        other_user = get_user_model().objects.create_user(username='other', password='pwassword', email='other@example.com')
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk=user.pk)), [user.shard])
+        # The shards of every key are looked up with one query.
+        with self.assertNumQueries(1, using='default'):
+            self.assertEqual(self.prune(TestModel.objects.filter(user_pk__in=[user.pk, other_user.pk])), sorted({user.shard, other_user.shard}))
+        # An unknown shard key can't be pruned on.
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk=user.pk + 100)), SHARDS)
+
+    def test_models_without_a_batch_lookup_are_not_pruned(self):
+        user = get_user_model().objects.create_user(username='username', password='pwassword', email='test@example.com')
+        with patch.object(TestModel, 'get_shards_from_shard_keys', None):
+            with self.assertNumQueries(0, using='default'):
+                self.assertEqual(self.prune(TestModel.objects.filter(user_pk=user.pk)), SHARDS)
+
+    def test_ranges(self):
+        self.use_bucketer(RangeBucketingStrategy(
+            shard_group='default', databases=settings.DATABASES, ranges=[(0, 'app_shard_001'), (100, 'app_shard_002')],
+        ))
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk__lt=50)), ['app_shard_001'])
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk__gte=100)), ['app_shard_002'])
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk__range=(50, 150))), SHARDS)
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk__gt=10, user_pk__lte=20)), ['app_shard_001'])
+        self.assertEqual(self.prune(TestModel.objects.filter(user_pk=150)), ['app_shard_002'])
+
+    def test_cross_shard_query_only_visits_the_shards_left(self):
+        bucketer = RangeBucketingStrategy(
+            shard_group='default', databases=settings.DATABASES, ranges=[(0, 'app_shard_001'), (100, 'app_shard_002')],
+        )
+        self.use_bucketer(bucketer)
+        TestModel.objects.using('app_shard_001').create(id=1, random_string='one', user_pk=1)
+        TestModel.objects.using('app_shard_002').create(id=2, random_string='two', user_pk=200)
+
+        with patch.object(QuerySet, '_fetch_all', autospec=True, side_effect=QuerySet._fetch_all) as mock_fetch_all:
+            rows = list(TestModel.objects.across_shards().filter(user_pk=200))
+        self.assertEqual([row.id for row in rows], [2])
+        self.assertEqual({call[0][0].db for call in mock_fetch_all.call_args_list}, {'app_shard_002'})
+
+        self.assertEqual(TestModel.objects.across_shards().filter(user_pk__gt=100, user_pk__lt=50).count(), 0)
@@ -0,0 +1,189 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+from mock import patch
+from six import StringIO
+
+from django_sharding.models import FrozenShardKey, ShardKeyMove
+from django_sharding_library.exceptions import ShardKeyFrozenException, ShardKeyMoveException
+from django_sharding_library.freezing import clear_frozen_cache, freeze_shard_key, is_shard_key_frozen, unfreeze_shard_key
+from django_sharding_library.rebalancing import get_shard_for_shard_key, get_shard_key_directory, move_shard_key
+from tests.models import ShardStorageTable, TestModel, TestModelComment, TestModelCommentEdit
+
+
+@patch('django_sharding_library.rebalancing.time.sleep')
+class MoveShardKeyTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        clear_frozen_cache()
+        self.addCleanup(clear_frozen_cache)
+        self.user = get_user_model().objects.create_user(username='username', password='pwassword', email='test@example.com')
+        self.user.shard = 'app_shard_001'
+        self.user.save()
+        self.other_user = get_user_model().objects.create_user(username='other', password='pwassword', email='other@example.com')
+        self.other_user.shard = 'app_shard_001'
+        self.other_user.save()
+        self.items = [TestModel.objects.using('app_shard_001').create(random_string=str(i), user_pk=self.user.pk) for i in range(5)]
+        self.other_item = TestModel.objects.using('app_shard_001').create(random_string='other', user_pk=self.other_user.pk)
+        self.comment = TestModelComment.objects.using('app_shard_001').create(test_model=self.items[0], text='a')
+        self.other_comment = TestModelComment.objects.using('app_shard_001').create(test_model=self.other_item, text='b')
+        self.edit = TestModelCommentEdit.objects.using('app_shard_001').create(comment=self.comment, text='c')
+
+    def test_directory(self, mock_sleep):
+        self.assertEqual(get_shard_key_directory('default'), [(get_user_model(), 'id', 'shard'), (ShardStorageTable, 'shard_key', 'shard')])
+        self.assertEqual(get_shard_for_shard_key('default', self.user.pk), 'app_shard_001')
+        self.assertIsNone(get_shard_for_shard_key('default', 1000))
+
+        ShardStorageTable.objects.create(shard_key=str(self.user.pk), shard='app_shard_002')
+        with self.assertRaises(ShardKeyMoveException):
+            get_shard_for_shard_key('default', self.user.pk)
+
+    def test_moves_the_rows_of_the_shard_key(self, mock_sleep):
+        log = []
+        move = move_shard_key('default', self.user.pk, 'app_shard_002', batch_size=2, throttle=0.5, log=log.append)
+
+        self.assertEqual(move.status, ShardKeyMove.DONE)
+        self.assertEqual((move.source, move.target), ('app_shard_001', 'app_shard_002'))
+        self.assertEqual(
+            sorted(TestModel.objects.using('app_shard_002').values_list('pk', flat=True)),
+            sorted(item.pk for item in self.items),
+        )
+        self.assertEqual(list(TestModel.objects.using('app_shard_001').values_list('pk', flat=True)), [self.other_item.pk])
+        self.assertEqual(list(TestModelComment.objects.using('app_shard_002').values_list('pk', 'test_model_id')), [(self.comment.pk, self.items[0].pk)])
+        self.assertEqual(list(TestModelComment.objects.using('app_shard_001').values_list('pk', flat=True)), [self.other_comment.pk])
+        self.assertEqual(list(TestModelCommentEdit.objects.using('app_shard_002').values_list('pk', flat=True)), [self.edit.pk])
+        self.assertFalse(TestModelCommentEdit.objects.using('app_shard_001').exists())
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).shard, 'app_shard_002')
+        self.assertEqual(get_user_model().objects.get(pk=self.other_user.pk).shard, 'app_shard_001')
+        self.assertFalse(FrozenShardKey.objects.exists())
+        self.assertFalse(is_shard_key_frozen('default', self.user.pk))
+        # Three batches of the test models and one of each of the others to
+        # copy and to delete, after waiting for the freeze.
+        mock_sleep.assert_any_call(0.5)
+        self.assertEqual(mock_sleep.call_count, 11)
+        self.assertIn('Verifying tests.TestModelComment on app_shard_002', log)
+
+    def test_resumes_an_interrupted_copy(self, mock_sleep):
+        freeze_shard_key('default', self.user.pk)
+        TestModel.objects.using('app_shard_002').bulk_create(self.items[:3])
+        ShardKeyMove.objects.create(
+            shard_group='default', shard_key=str(self.user.pk), source='app_shard_001', target='app_shard_002',
+            model='tests.TestModel', last_pk=str(self.items[1].pk),
+        )
+
+        move = move_shard_key('default', self.user.pk, 'app_shard_002')
+
+        self.assertEqual(move.status, ShardKeyMove.DONE)
+        self.assertEqual(TestModel.objects.using('app_shard_002').count(), 5)
+        self.assertEqual(TestModelComment.objects.using('app_shard_002').count(), 1)
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).shard, 'app_shard_002')
+        self.assertFalse(mock_sleep.called)
+
+    def test_verification_failure_keeps_the_key_frozen(self, mock_sleep):
+        freeze_shard_key('default', self.user.pk)
+        TestModel.objects.using('app_shard_002').bulk_create(self.items[:3])
+        ShardKeyMove.objects.create(
+            shard_group='default', shard_key=str(self.user.pk), source='app_shard_001', target='app_shard_002', status=ShardKeyMove.VERIFYING,
+        )
+
+        with self.assertRaises(ShardKeyMoveException):
+            move_shard_key('default', self.user.pk, 'app_shard_002')
+
+        self.assertTrue(is_shard_key_frozen('default', self.user.pk))
+        self.assertEqual(ShardKeyMove.objects.get().status, ShardKeyMove.COPYING)
+        self.assertFalse(TestModel.objects.using('app_shard_002').exists())
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).shard, 'app_shard_001')
+
+        # Moving it again copies the rows again.
+        self.assertEqual(move_shard_key('default', self.user.pk, 'app_shard_002').status, ShardKeyMove.DONE)
+        self.assertEqual(TestModel.objects.using('app_shard_002').count(), 5)
+
+    def test_copies_keep_the_values_set_when_saving(self, mock_sleep):
+        created_at = self.comment.created_at - timedelta(days=30)
+        TestModelComment.objects.using('app_shard_001').filter(pk=self.comment.pk).update(created_at=created_at)
+
+        move_shard_key('default', self.user.pk, 'app_shard_002')
+
+        self.assertEqual(TestModelComment.objects.using('app_shard_002').get(pk=self.comment.pk).created_at, created_at)
+
+    def test_rejects_another_target_while_a_move_is_unfinished(self, mock_sleep):
+        ShardKeyMove.objects.create(shard_group='default', shard_key=str(self.user.pk), source='app_shard_001', target='app_shard_002')
+
+        with self.assertRaises(ShardKeyMoveException):
+            move_shard_key('default', self.user.pk, 'app_shard_001')
+
+    def test_rejects_invalid_targets(self, mock_sleep):
+        with self.assertRaises(ShardKeyMoveException):
+            move_shard_key('default', self.user.pk, 'app_shard_003')
+        with self.assertRaises(ShardKeyMoveException):
+            move_shard_key('default', self.user.pk, 'app_shard_001')
+        with self.assertRaises(ShardKeyMoveException):
+            move_shard_key('default', 1000, 'app_shard_002')
+        self.assertFalse(ShardKeyMove.objects.exists())
+
+    def test_command(self, mock_sleep):
+        stdout = StringIO()
+        call_command('move_shard_key', str(self.user.pk), target='app_shard_002', stdout=stdout)
+
+        self.assertIn('Moved {} from app_shard_001 to app_shard_002.'.format(self.user.pk), stdout.getvalue())
+        self.assertEqual(TestModel.objects.using('app_shard_002').count(), 5)
+
+        with self.assertRaises(CommandError):
+            call_command('move_shard_key', str(self.user.pk), target='app_shard_002', stdout=StringIO())
+
+
+class FrozenShardKeyRouterTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        clear_frozen_cache()
+        self.addCleanup(clear_frozen_cache)
+        self.user = get_user_model().objects.create_user(username='username', password='pwassword', email='test@example.com')
+        self.user.shard = 'app_shard_001'
+        self.user.save()
+        self.item = TestModel.objects.using('app_shard_001').create(random_string='a', user_pk=self.user.pk)
+
+    def test_writes_to_a_frozen_shard_key_are_rejected(self):
+        freeze_shard_key('default', self.user.pk)
+
+        item = TestModel.objects.using('app_shard_001').get(pk=self.item.pk)
+        item.random_string = 'b'
+        with self.assertRaises(ShardKeyFrozenException) as context:
+            item.save()
+        self.assertEqual(context.exception.shard_key, self.user.pk)
+        with self.assertRaises(ShardKeyFrozenException):
+            TestModel(random_string='c', user_pk=self.user.pk).save()
+        with self.assertRaises(ShardKeyFrozenException):
+            item.delete()
+        # Reads keep working.
+        self.assertEqual(TestModel.objects.using('app_shard_001').get(pk=self.item.pk).random_string, 'a')
+
+        unfreeze_shard_key('default', self.user.pk)
+        TestModel(random_string='c', user_pk=self.user.pk).save()
+        self.assertEqual(TestModel.objects.using('app_shard_001').count(), 2)
+
+    def test_writes_to_the_models_linked_to_a_frozen_shard_key_are_rejected(self):
+        comment = TestModelComment.objects.using('app_shard_001').create(test_model=self.item, text='a')
+        edit = TestModelCommentEdit.objects.using('app_shard_001').create(comment=comment, text='b')
+        other_user = get_user_model().objects.create_user(username='other', password='pwassword', email='other@example.com')
+        other_item = TestModel.objects.using('app_shard_001').create(random_string='b', user_pk=other_user.pk)
+        other_comment = TestModelComment.objects.using('app_shard_001').create(test_model=other_item, text='c')
+        freeze_shard_key('default', self.user.pk)
+
+        comment = TestModelComment.objects.using('app_shard_001').get(pk=comment.pk)
+        with self.assertRaises(ShardKeyFrozenException) as context:
+            comment.save()
+        self.assertEqual(context.exception.shard_key, self.user.pk)
+        with self.assertRaises(ShardKeyFrozenException):
+            TestModelCommentEdit.objects.using('app_shard_001').get(pk=edit.pk).save()
+        with self.assertRaises(ShardKeyFrozenException):
+            TestModelComment(test_model=self.item, text='d').save()
+
+        other_comment = TestModelComment.objects.using('app_shard_001').get(pk=other_comment.pk)
+        other_comment.text = 'e'
+        other_comment.save()
+        self.assertEqual(TestModelComment.objects.using('app_shard_001').get(pk=other_comment.pk).text, 'e')
@@ -0,0 +1,66 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from mock import patch
+
+from django_sharding_library.registry import get_model_metadata
+from tests.models import ShardedByForiegnKeyModel, ShardStorageTable, TestModel, UnshardedTestModel
+
+
+class ShardedModelMetadataTestCase(TestCase):
+    databases = '__all__'
+
+    def test_model_storing_the_shard(self):
+        metadata = get_model_metadata(get_user_model())
+        self.assertEqual(metadata.shard_group, 'default')
+        self.assertEqual(metadata.shard_field.name, 'shard')
+        self.assertTrue(metadata.stores_shard)
+        self.assertTrue(metadata.use_signal)
+        self.assertIs(metadata.bucketer, apps.get_app_config('django_sharding').get_bucketer('default'))
+        self.assertEqual(metadata.databases, ['default'])
+
+    def test_model_storing_the_shard_in_another_table(self):
+        metadata = get_model_metadata(ShardedByForiegnKeyModel)
+        self.assertEqual(metadata.shard_group, 'default')
+        self.assertEqual(metadata.shard_field.name, 'shard')
+        self.assertFalse(metadata.use_signal)
+
+    def test_sharded_model(self):
+        metadata = get_model_metadata(TestModel)
+        self.assertTrue(metadata.is_sharded)
+        self.assertEqual(metadata.shard_group, 'default')
+        self.assertIs(metadata.id_field, TestModel._meta.pk)
+        self.assertEqual(sorted(metadata.databases), ['app_shard_001', 'app_shard_001_replica_001', 'app_shard_001_replica_002', 'app_shard_002'])
+
+    def test_model_on_a_specific_database(self):
+        metadata = get_model_metadata(UnshardedTestModel)
+        self.assertFalse(metadata.is_sharded)
+        self.assertEqual(metadata.database, 'default')
+        self.assertIsNone(metadata.shard_field)
+
+    def test_unregistered_model(self):
+        self.assertIsNone(get_model_metadata(object))
+
+
+class RegistryUsageTestCase(TestCase):
+    databases = '__all__'
+
+    def test_signal_does_not_inspect_the_model(self):
+        with patch('django_sharding_library.signals.apps') as mock_apps:
+            user = get_user_model().objects.create(username='test', password='test')
+        self.assertIsNotNone(user.shard)
+        self.assertFalse(mock_apps.get_app_config.called)
+
+    def test_save_shard_uses_the_bucketer_from_the_registry(self):
+        field = ShardedByForiegnKeyModel._meta.get_field('shard')
+
+        class FakeModel(object):
+            shard = None
+
+            def get_shard_key(self):
+                return 'testing_registry_bucketer'
+
+        with patch('django_sharding_library.fields.apps') as mock_apps:
+            field.save_shard(FakeModel())
+        self.assertFalse(mock_apps.get_app_config.called)
+        self.assertTrue(ShardStorageTable.objects.filter(shard_key='testing_registry_bucketer').exists())
@@ -245,6 +245,15 @@ class RouterAllowMigrateTestCase(TransactionTestCase):
             can_migrate_shard=True,
         )
 
+    def test_ticket_server_model_only_on_ticket_servers(self):
+        self.assert_allow_migrate(
+            app_label='tests',
+            model_name='TicketServerModelIDs',
+            can_migrate_default=False,
+            can_migrate_shard=True,
+        )
+        self.assertFalse(self.sut.allow_migrate(db='app_shard_003', app_label='tests', model_name='TicketServerModelIDs'))
+
     def test_lookup_fallback_if_migration_directory_not_the_same_as_the_model(self):
         self.assert_allow_migrate(
             app_label='tests',
@@ -288,3 +297,25 @@ class RouterAllowMigrateTestCase(TransactionTestCase):
         self.assertFalse(self.sut.allow_migrate(model_name="Whatever", db='app_shard_002', app_label='deleted', **{}))
         self.assertFalse(self.sut.allow_migrate(model_name="Whatever", db='app_shard_001_replica_001', app_label='deleted', **{}))
         self.assertFalse(self.sut.allow_migrate(model_name="Whatever", db='app_shard_001_replica_002', app_label='deleted', **{}))
+
+    def test_allow_migrate_is_memoized(self):
+        with patch('django_sharding_library.router.is_model_class_on_database', return_value=True) as mock_is_on_database:
+            for _ in range(3):
+                self.assertTrue(self.sut.allow_migrate(db='app_shard_001', app_label='tests', model_name='TestModel'))
+                self.assertTrue(self.sut.allow_migrate(db='app_shard_001', app_label='tests'))
+        self.assertEqual(mock_is_on_database.call_count, 2)
+
+        # The model hint shares the answer for the model name.
+        self.assertTrue(self.sut.allow_migrate(db='app_shard_001', app_label='tests', model=TestModel))
+
+    def test_allow_migrate_cache_is_cleared_when_the_settings_change(self):
+        with self.assertRaises(LookupError):
+            self.sut.allow_migrate(model_name="Whatever", db='default', app_label='deleted')
+
+        with override_settings(DJANGO_SHARDING_SETTINGS={"DELETED_MODELS": {"deleted.Whatever": {"database": "app_shard_001"}}}):
+            self.assertFalse(self.sut.allow_migrate(model_name="Whatever", db='default', app_label='deleted'))
+            self.assertTrue(self.sut.allow_migrate(model_name="Whatever", db='app_shard_001', app_label='deleted'))
+
+        with override_settings(DJANGO_SHARDING_SETTINGS={"DELETED_MODELS": {"deleted.Whatever": None}}):
+            self.assertTrue(self.sut.allow_migrate(model_name="Whatever", db='default', app_label='deleted'))
+            self.assertFalse(self.sut.allow_migrate(model_name="Whatever", db='app_shard_001', app_label='deleted'))
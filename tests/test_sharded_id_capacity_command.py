@@ -0,0 +1,30 @@
+from django.core.management import call_command
+from django.test import TestCase
+from mock import patch
+from six import StringIO
+
+
+class ShardedIDCapacityCommandTestCase(TestCase):
+    databases = '__all__'
+
+    def test_reports_on_all_shards(self):
+        out = StringIO()
+        call_command('sharded_id_capacity', '--inserts-per-second=100', stdout=out)
+        output = out.getvalue()
+        for database in ['app_shard_001', 'app_shard_002', 'app_shard_003', 'app_shard_004']:
+            self.assertIn('Database {} with shard id'.format(database), output)
+        self.assertNotIn('Database default', output)
+        self.assertIn('40 time bits, 13 shard bits, 10 sequence bits', output)
+
+    def test_unobservable_databases_are_reported(self):
+        out = StringIO()
+        with patch('django_sharding_library.management.commands.sharded_id_capacity.time.sleep') as mock_sleep:
+            call_command('sharded_id_capacity', '--database=app_shard_001', '--sample-seconds=3', stdout=out)
+        mock_sleep.assert_called_once_with(3.0)
+        self.assertIn('Database app_shard_001: unable to observe the insert rate', out.getvalue())
+
+    def test_observes_the_rate_from_the_sequence(self):
+        out = StringIO()
+        with patch('django_sharding_library.management.commands.sharded_id_capacity.Command.observe_insert_rates', return_value={'app_shard_002': 2000.0}):
+            call_command('sharded_id_capacity', '--database=app_shard_002', stdout=out)
+        self.assertIn('inserts: 2000.00/s, 2.0000/ms at peak', out.getvalue())
@@ -1,7 +1,10 @@
+import zlib
+
 from six.moves import xrange
 
 from django.conf import settings
 from django.test import TestCase
+from mock import patch
 
 from django_sharding_library.sharding_functions import (
     BaseBucketingStrategy,
@@ -9,8 +12,10 @@ from django_sharding_library.sharding_functions import (
     RandomBucketingStrategy,
     RoundRobinBucketingStrategy,
     ModBucketingStrategy,
+    RangeBucketingStrategy,
     SavedModBucketingStrategy
 )
+from django_sharding_library.exceptions import DjangoShardingException
 
 
 class BaseBucketingStrategyTestCase(TestCase):
@@ -131,10 +136,30 @@ class ModBucketingStrategyTestCase(TestCase):
         model = FakeModel()
         for i in xrange(100):
             model.pk = i
-            expected_shard = sut.shards[hash(str(i)) % 2]
+            expected_shard = sut.shards[zlib.crc32(str(i).encode('utf-8')) % 2]
             self.assertEqual(sut.get_shard(model), expected_shard)
             self.assertEqual(sut.pick_shard(model), expected_shard)
 
+    def test_get_shards_for_keys(self):
+        sut = ModBucketingStrategy(shard_group='default', databases=settings.DATABASES)
+        self.assertEqual(sut.get_shards_for_keys([1, 2]), {1: sut.shards[zlib.crc32(b'1') % 2], 2: sut.shards[zlib.crc32(b'2') % 2]})
+
+    def test_legacy_hash(self):
+        sut = ModBucketingStrategy(shard_group='default', databases=settings.DATABASES, legacy_hash=True)
+        self.assertEqual(sut.get_shard_for_key(1), sut.shards[hash('1') % 2])
+        with patch.dict('os.environ', {'PYTHONHASHSEED': '123'}):
+            self.assertEqual(sut.get_shards_for_keys([1]), {1: sut.shards[hash('1') % 2]})
+        # The shards of the keys can't be known ahead of time in every process.
+        with patch.dict('os.environ', {'PYTHONHASHSEED': 'random'}):
+            with self.assertRaises(NotImplementedError):
+                sut.get_shards_for_keys([1])
+
+    def test_the_shards_do_not_depend_on_the_hash_seed(self):
+        sut = ModBucketingStrategy(shard_group='default', databases=settings.DATABASES)
+        with patch('builtins.hash', side_effect=AssertionError):
+            shards = sut.get_shards_for_keys(['a', 'b', 'c'])
+        self.assertEqual(shards, {'a': sut.shards[3904355907 % 2], 'b': sut.shards[1908338681 % 2], 'c': sut.shards[112844655 % 2]})
+
 
 class SavedModBucketingStrategyTestCase(TestCase):
     databases = '__all__'
@@ -151,6 +176,46 @@ class SavedModBucketingStrategyTestCase(TestCase):
         model = FakeModel()
         for i in xrange(100):
             model.pk = i
-            expected_shard = sut.shards[hash(str(i)) % 2]
+            expected_shard = sut.shards[zlib.crc32(str(i).encode('utf-8')) % 2]
             self.assertEqual(sut.pick_shard(model), expected_shard)
             self.assertEqual(sut.get_shard(model), 'cool_guy_shard')
+
+    def test_get_shards_for_keys_is_unimplemented(self):
+        sut = SavedModBucketingStrategy(shard_group='default', databases=settings.DATABASES)
+        with self.assertRaises(NotImplementedError):
+            sut.get_shards_for_keys([1])
+
+
+class RangeBucketingStrategyTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.sut = RangeBucketingStrategy(
+            shard_group='default',
+            databases=settings.DATABASES,
+            ranges=[(1000, 'app_shard_002'), (0, 'app_shard_001'), (2000, 'app_shard_001')],
+        )
+
+    def test_pick_shard_and_get_shard_use_the_range_of_the_pk(self):
+        class FakeModel(object):
+            pk = 0
+
+        model = FakeModel()
+        for pk, expected_shard in [(-5, 'app_shard_001'), (0, 'app_shard_001'), (999, 'app_shard_001'), (1000, 'app_shard_002'), (2500, 'app_shard_001')]:
+            model.pk = pk
+            self.assertEqual(self.sut.pick_shard(model), expected_shard)
+            self.assertEqual(self.sut.get_shard(model), expected_shard)
+
+    def test_get_shards_for_keys(self):
+        self.assertEqual(self.sut.get_shards_for_keys([5, 1500]), {5: 'app_shard_001', 1500: 'app_shard_002'})
+
+    def test_get_shards_for_range(self):
+        self.assertEqual(self.sut.get_shards_for_range(0, 999), ['app_shard_001'])
+        self.assertEqual(self.sut.get_shards_for_range(1000, 1999), ['app_shard_002'])
+        self.assertEqual(self.sut.get_shards_for_range(500, 1500), ['app_shard_001', 'app_shard_002'])
+        self.assertEqual(self.sut.get_shards_for_range(lower=1000, upper=None), ['app_shard_001', 'app_shard_002'])
+        self.assertEqual(self.sut.get_shards_for_range(lower=None, upper=500), ['app_shard_001'])
+
+    def test_ranges_must_be_on_shards_of_the_group(self):
+        with self.assertRaises(DjangoShardingException):
+            RangeBucketingStrategy(shard_group='default', databases=settings.DATABASES, ranges=[(0, 'app_shard_003')])
@@ -1,6 +1,12 @@
+import json
+
+from django.conf import settings
 from django.core.management import call_command
-from django.test import TestCase
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import TestCase, TransactionTestCase
 from mock import patch
+from six import StringIO
 
 from django_sharding_library.exceptions import InvalidShowMigrationsException
 
@@ -38,3 +44,75 @@ class MigrationCommandTestCase(TestCase):
         expected_migrated_databases = []
 
         self.assertEqual(databases_migrated, expected_migrated_databases)
+
+
+@patch(
+    'django_sharding_library.management.commands.showmigrations.Command.get_migration_plan',
+    return_value=[('tests', '0001_initial'), ('tests', '0002_second'), ('tests', '0003_third')],
+)
+class MigrationMatrixTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.databases_in_order = [database for database, db_settings in settings.DATABASES.items() if not db_settings.get('PRIMARY')]
+        for database in self.databases_in_order:
+            recorder = MigrationRecorder(connections[database])
+            recorder.ensure_schema()
+            recorder.record_applied('tests', '0001_initial')
+            self.addCleanup(recorder.migration_qs.filter(app='tests').delete)
+        MigrationRecorder(connections['app_shard_002']).record_applied('tests', '0002_second')
+        MigrationRecorder(connections['app_shard_003']).record_applied('tests', '0009_removed')
+
+    def test_lists_only_the_databases_which_diverge(self, mock_get_migration_plan):
+        stdout = StringIO()
+        call_command('showmigrations', 'tests', matrix=True, stdout=stdout, no_color=True)
+
+        self.assertEqual(stdout.getvalue().splitlines()[1:], [
+            'tests',
+            ' [X] 0001_initial',
+            ' [~] 0002_second  only applied on: app_shard_002',
+            ' [ ] 0003_third',
+            ' [~] 0009_removed  only applied on: app_shard_003',
+            '2 migrations are only applied on some of the databases.',
+        ])
+        mock_get_migration_plan.assert_called_once_with()
+
+    def test_reads_each_database_once(self, mock_get_migration_plan):
+        with patch(
+            'django_sharding_library.management.commands.showmigrations.Command.get_applied_migrations',
+            autospec=True, side_effect=lambda command, database: set([('tests', '0001_initial')]),
+        ) as mock_get_applied_migrations:
+            stdout = StringIO()
+            call_command('showmigrations', 'tests', matrix=True, stdout=stdout, no_color=True)
+
+        self.assertEqual(sorted(call[0][1] for call in mock_get_applied_migrations.call_args_list), sorted(self.databases_in_order))
+        self.assertIn('The databases are in sync.', stdout.getvalue())
+
+    def test_json(self, mock_get_migration_plan):
+        stdout = StringIO()
+        call_command('showmigrations', 'tests', matrix=True, json=True, database='app_shard_002', stdout=stdout)
+
+        self.assertEqual(json.loads(stdout.getvalue()), {
+            'databases': ['app_shard_002'],
+            'errors': {},
+            'in_sync': True,
+            'migrations': [
+                {'app': 'tests', 'name': '0001_initial', 'status': 'applied'},
+                {'app': 'tests', 'name': '0002_second', 'status': 'applied'},
+                {'app': 'tests', 'name': '0003_third', 'status': 'pending'},
+            ],
+        })
+
+    def test_json_lists_the_divergent_databases(self, mock_get_migration_plan):
+        stdout = StringIO()
+        call_command('showmigrations', 'tests', matrix=True, json=True, stdout=stdout)
+
+        result = json.loads(stdout.getvalue())
+        self.assertFalse(result['in_sync'])
+        self.assertEqual(result['migrations'][1], {
+            'app': 'tests',
+            'name': '0002_second',
+            'status': 'diverged',
+            'applied_on': ['app_shard_002'],
+            'missing_on': [database for database in self.databases_in_order if database != 'app_shard_002'],
+        })
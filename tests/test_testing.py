@@ -0,0 +1,122 @@
+from django.db import connections
+from django.test import SimpleTestCase, TestCase
+from mock import MagicMock, call, patch
+
+from django_sharding_library.testing import _can_clone, clone_test_database, setup_sharded_test_databases
+from tests.models import TestModel
+
+
+def make_connection(alias, shard_group=None, engine='django.db.backends.sqlite3', **settings_dict):
+    connection = MagicMock()
+    connection.alias = alias
+    connection.settings_dict = dict(settings_dict, ENGINE=engine, TEST={})
+    if shard_group:
+        connection.settings_dict['SHARD_GROUP'] = shard_group
+    return connection
+
+
+class SetupShardedTestDatabasesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.connections = {
+            'default': make_connection('default'),
+            'shard_1': make_connection('shard_1', 'default'),
+            'shard_1_replica': make_connection('shard_1_replica', 'default'),
+            'shard_2': make_connection('shard_2', 'default'),
+            'shard_3': make_connection('shard_3', 'default'),
+            'other_1': make_connection('other_1', 'other'),
+            'other_2': make_connection('other_2', 'other'),
+        }
+        test_databases = {
+            ('default', 'sqlite'): ('default', ['default']),
+            ('shard_1', 'sqlite'): ('shard_1', ['shard_1']),
+            ('shard_2', 'sqlite'): ('shard_2', ['shard_2']),
+            ('shard_3', 'sqlite'): ('shard_3', ['shard_3']),
+            ('other_1', 'sqlite'): ('other_1', ['other_1']),
+            ('other_2', 'sqlite'): ('other_2', ['other_2']),
+        }
+        patchers = [
+            patch('django_sharding_library.testing.connections', self.connections),
+            patch('django_sharding_library.testing.get_unique_databases_and_mirrors', return_value=(test_databases, {'shard_1_replica': 'shard_1'})),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch('django_sharding_library.testing.clone_test_database')
+    def test_migrates_the_first_shard_of_each_group_and_clones_the_rest(self, mock_clone):
+        old_names = setup_sharded_test_databases(verbosity=0, interactive=False)
+
+        for alias in ('default', 'shard_1', 'other_1'):
+            self.connections[alias].creation.create_test_db.assert_called_once_with(verbosity=0, autoclobber=True, keepdb=False, serialize=True)
+        for alias in ('shard_2', 'shard_3', 'other_2'):
+            self.assertFalse(self.connections[alias].creation.create_test_db.called)
+        mock_clone.assert_has_calls([
+            call('shard_1', 'shard_2', verbosity=0, keepdb=False, serialize=True),
+            call('shard_1', 'shard_3', verbosity=0, keepdb=False, serialize=True),
+            call('other_1', 'other_2', verbosity=0, keepdb=False, serialize=True),
+        ])
+        self.assertEqual(mock_clone.call_count, 3)
+
+        self.connections['shard_1_replica'].creation.set_as_test_mirror.assert_called_once_with(self.connections['shard_1'].settings_dict)
+        self.assertEqual(len(old_names), 6)
+        self.assertTrue(all(destroy for connection, name, destroy in old_names))
+
+    @patch('django_sharding_library.testing.clone_test_database')
+    def test_only_serializes_the_serialized_aliases(self, mock_clone):
+        setup_sharded_test_databases(verbosity=0, interactive=False, serialized_aliases={'shard_1', 'shard_3'})
+
+        self.connections['shard_1'].creation.create_test_db.assert_called_once_with(verbosity=0, autoclobber=True, keepdb=False, serialize=True)
+        self.connections['default'].creation.create_test_db.assert_called_once_with(verbosity=0, autoclobber=True, keepdb=False, serialize=False)
+        mock_clone.assert_any_call('shard_1', 'shard_2', verbosity=0, keepdb=False, serialize=False)
+        mock_clone.assert_any_call('shard_1', 'shard_3', verbosity=0, keepdb=False, serialize=True)
+
+    @patch('django_sharding_library.testing.clone_test_database')
+    def test_migrates_the_shards_which_cannot_be_cloned(self, mock_clone):
+        self.connections['shard_3'].settings_dict['ENGINE'] = 'django.db.backends.mysql'
+
+        setup_sharded_test_databases(verbosity=0, interactive=False)
+
+        self.connections['shard_3'].creation.create_test_db.assert_called_once_with(verbosity=0, autoclobber=True, keepdb=False, serialize=True)
+        self.assertEqual(mock_clone.call_count, 2)
+
+
+class CloneTestDatabaseTestCase(SimpleTestCase):
+    @patch('django_sharding_library.testing._clone_sqlite_test_database')
+    def test_restores_the_database_name_when_the_copy_fails(self, mock_clone):
+        template, connection = make_connection('shard_1', NAME='shard_1'), make_connection('shard_2', NAME='shard_2')
+        connection.creation._get_test_db_name.return_value = 'test_shard_2'
+        connection.ensure_connection.side_effect = OSError('Unable to open the database file')
+        mock_settings = MagicMock(DATABASES={'shard_2': {'NAME': 'shard_2'}})
+
+        with patch('django_sharding_library.testing.connections', {'shard_1': template, 'shard_2': connection}):
+            with patch('django_sharding_library.testing.settings', mock_settings):
+                with self.assertRaises(OSError):
+                    clone_test_database('shard_1', 'shard_2', verbosity=0)
+
+        self.assertEqual(connection.settings_dict['NAME'], 'shard_2')
+        self.assertEqual(mock_settings.DATABASES['shard_2']['NAME'], 'shard_2')
+
+
+class CanCloneTestCase(SimpleTestCase):
+    def test_sqlite(self):
+        self.assertTrue(_can_clone(make_connection('a'), make_connection('b')))
+
+    def test_postgres_on_the_same_server(self):
+        engine = 'django.db.backends.postgresql'
+        template = make_connection('a', engine=engine, HOST='db1', PORT='5432', USER='postgres')
+        self.assertTrue(_can_clone(template, make_connection('b', engine=engine, HOST='db1', PORT='5432', USER='postgres')))
+        self.assertFalse(_can_clone(template, make_connection('b', engine=engine, HOST='db2', PORT='5432', USER='postgres')))
+
+    def test_other_backends(self):
+        engine = 'django.db.backends.mysql'
+        self.assertFalse(_can_clone(make_connection('a', engine=engine), make_connection('b', engine=engine)))
+        self.assertFalse(_can_clone(make_connection('a'), make_connection('b', engine='django.db.backends.postgresql')))
+
+
+class ClonedTestDatabaseTestCase(TestCase):
+    databases = '__all__'
+
+    def test_cloned_shards_have_the_tables_of_their_template(self):
+        self.assertIn(TestModel._meta.db_table, connections['app_shard_002'].introspection.table_names())
+        for template, alias in (('app_shard_001', 'app_shard_002'), ('app_shard_003', 'app_shard_004')):
+            self.assertEqual(connections[alias].introspection.table_names(), connections[template].introspection.table_names())